@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -42,11 +43,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mitorneo.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'mitorneo.estaticos.EstaticosMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'mitorneo.auditoria.AuditoriaMiddleware',
+    'mitorneo.perfilado.PerfiladoMiddleware',
+    'mitorneo.consultas_lentas.ConsultasLentasMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,6 +91,18 @@ DATABASES = {
     }
 }
 
+# Caché: en memoria por proceso; con varios workers defina PLAYLIGA_REDIS_URL para compartirla
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.environ.get('PLAYLIGA_REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['PLAYLIGA_REDIS_URL'],
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,13 +140,21 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
-# Add static files directories for development
-STATICFILES_DIRS = [
-    os.path.join(BASE_DIR, 'mitorneo', 'static'),
-]
+# Los estáticos de mitorneo/static los encuentra AppDirectoriesFinder; listarlos también en
+# STATICFILES_DIRS los duplicaba en collectstatic
 
-# For production, set STATIC_ROOT and run collectstatic
-# STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# collectstatic copia aquí los estáticos con el hash en el nombre y sus variantes .gz/.br
+# (mitorneo/estaticos.py); EstaticosMiddleware los sirve con Cache-Control immutable
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'mitorneo.estaticos.AlmacenComprimido'},
+}
+# False si los estáticos los sirve el servidor web (nginx con gzip_static/brotli_static)
+ESTATICOS_SERVIR = True
+# manage.py test corre con DEBUG=False y sin collectstatic: sin manifiesto {% static %} fallaría
+if sys.argv[1:2] == ['test']:
+    STORAGES['staticfiles'] = {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -137,5 +163,87 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'mitorneo.Usuario'
 
+# El usuario de la sesión se sirve desde la caché (mitorneo/autenticacion.py), solo si es
+# compartida (Redis), y la sesión también: cached_db lee de la caché y solo escribe en la base de
+# datos al modificarla
+AUTHENTICATION_BACKENDS = ['mitorneo.autenticacion.UsuarioCacheBackend']
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+AUTH_CACHE_TIMEOUT = 300
+
 LOGIN_URL = '/torneo/login/'
 LOGIN_REDIRECT_URL = '/torneo/home/'
+
+# Métricas de Prometheus (/metrics). Con varios workers, apuntar METRICAS_DIR a un
+# directorio local compartido por los procesos de la máquina para sumar las métricas de todos.
+METRICAS_DIR = os.environ.get('PLAYLIGA_METRICAS_DIR')
+METRICAS_INTERVALO = 5  # segundos entre volcados de cada proceso
+# Sin token, /metrics solo responde a administradores con sesión
+METRICAS_TOKEN = os.environ.get('PLAYLIGA_METRICAS_TOKEN')
+
+# Perfilado con cProfile: los admin lo piden con la cabecera "X-Perfilar: 1";
+# PERFILADO_MUESTREO > 0 perfila además esa fracción de todas las peticiones.
+PERFILADO_DIR = os.path.join(BASE_DIR, 'perfiles')
+PERFILADO_MUESTREO = float(os.environ.get('PLAYLIGA_PERFILADO_MUESTREO', 0))
+PERFILADO_MAX_ARCHIVOS = 200
+
+# Registro de consultas lentas (resumen agregado en /torneo/api/consultas_lentas/)
+CONSULTAS_LENTAS_UMBRAL_MS = 100
+CONSULTAS_LENTAS_EXPLAIN = True
+CONSULTAS_N_MAS_1_UMBRAL = 10  # consultas idénticas en una petición para marcar un N+1
+
+# Rankings de goleadores y asistentes: tamaño del top cacheado y segundos de vida
+RANKING_TOP_N = 50
+RANKING_TIMEOUT = 600
+
+# Alta masiva de cuentas: procesos para hashear contraseñas (None = nº de CPUs) y mínimo de
+# contraseñas para que compense arrancar el pool
+APROVISIONAMIENTO_PROCESOS = None
+APROVISIONAMIENTO_MIN_PARALELO = 16
+
+# Paneles de jugador y árbitro: segundos de vida de los fragmentos de partidos cacheados
+# (se invalidan antes al cambiar un partido)
+PANELES_CACHE_TIMEOUT = 3600
+
+# Auditoría (cambios de rol y acciones de administración): se escribe por lotes desde un hilo
+# cada AUDITORIA_INTERVALO segundos o al juntar AUDITORIA_LOTE registros; con
+# AUDITORIA_MAX_PENDIENTES en el búfer quien audita escribe en su propio hilo
+AUDITORIA_LOTE = 500
+AUDITORIA_INTERVALO = 1.0
+AUDITORIA_MAX_PENDIENTES = 10000
+
+# Cola de trabajos en segundo plano (run_workers): reintentos con backoff exponencial
+# (base * 2^intentos segundos, hasta el máximo) y segundos tras los que un trabajo en curso
+# se da por abandonado y vuelve a la cola
+TRABAJOS_MAX_INTENTOS = 5
+TRABAJOS_BACKOFF_BASE = 5
+TRABAJOS_BACKOFF_MAX = 600
+TRABAJOS_TIMEOUT = 600
+
+# Límites de las APIs de escritura (apuestas, recargas, eventos): token bucket por usuario y
+# por IP como (ráfaga, fichas por segundo), y peticiones limitadas en curso por proceso antes
+# de responder 503. PLAYLIGA_LIMITES=0 los desactiva (pruebas de carga desde una sola IP).
+# LIMITES_CABECERA_IP: p. ej. 'HTTP_X_FORWARDED_FOR' detrás de un proxy de confianza
+LIMITES_ACTIVOS = os.environ.get('PLAYLIGA_LIMITES', '1') != '0'
+LIMITES_USUARIO = (10, 2.0)
+LIMITES_IP = (60, 20.0)
+LIMITES_CONCURRENCIA = 8
+LIMITES_CABECERA_IP = None
+
+# Idempotency-Key en apuestas y recargas: segundos que se guarda la primera respuesta (después
+# la clave caduca; purgar_idempotencia borra las caducadas) y segundos tras los que una petición
+# en curso se da por abandonada y otra con la misma clave puede ejecutarse
+IDEMPOTENCIA_TTL = 86400
+IDEMPOTENCIA_EN_CURSO = 60
+
+# Mercados de apuestas abiertos en memoria de cada proceso: segundos máximos entre recargas
+# (con LocMem la versión no se comparte entre procesos)
+MERCADOS_CACHE_TIMEOUT = 5
+
+# Simulación automática (simular_programados): un partido cuya simulación falla se reintenta con
+# backoff exponencial (base * 2^(intentos-1) segundos, hasta el máximo)
+SIMULACION_BACKOFF_BASE = 60
+SIMULACION_BACKOFF_MAX = 3600
+
+# Exportaciones incrementales: segundos de retraso de la marca respecto al inicio de la
+# exportación, para no saltarse filas de transacciones aún sin confirmar
+EXPORTACION_RETRASO = 60
@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 from mitorneo import views as torneo_views
+from mitorneo.metricas import vista_metricas
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', torneo_views.home),  # Redirige al login
     path('torneo/', include('mitorneo.urls')),  # urls propias de la app
+    path('metrics', vista_metricas, name='metrics'),  # Prometheus
 ]
\ No newline at end of file
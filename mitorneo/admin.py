@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import Usuario, Equipo, Arbitro, Jugador, Partido, Apuesta, RecargaSaldo, AuditoriaRol
+from .models import Usuario, Equipo, FuerzaEquipo, Arbitro, Jugador, Partido, EventoPartido, Apuesta, RecargaSaldo, AuditoriaRol, AuditoriaAccion, Trabajo, ClaveIdempotencia
 
 @admin.register(Usuario)
 class UsuarioAdmin(admin.ModelAdmin):
@@ -40,6 +40,15 @@ class EquipoAdmin(admin.ModelAdmin):
         return obj.partidos_local.count() + obj.partidos_visitante.count()
     partidos_jugados.short_description = 'Partidos'
 
+@admin.register(FuerzaEquipo)
+class FuerzaEquipoAdmin(admin.ModelAdmin):
+    list_display = ('equipo', 'jugadores', 'nivel_total', 'nivel_promedio', 'nivel_maximo', 'actualizado')
+    search_fields = ('equipo__nombre',)
+    readonly_fields = ('equipo', 'jugadores', 'nivel_total', 'nivel_promedio', 'nivel_maximo', 'nivel_por_posicion', 'actualizado')
+    
+    def has_add_permission(self, request):
+        return False  # Se calcula a partir de los jugadores
+
 @admin.register(Arbitro)
 class ArbitroAdmin(admin.ModelAdmin):
     list_display = ('nombre_completo', 'correo', 'usuario_link', 'partidos_arbitrados')
@@ -137,6 +146,25 @@ class PartidoAdmin(admin.ModelAdmin):
         return 'Partido no simulado'
     resultado_display.short_description = 'Detalles del Resultado'
 
+@admin.register(EventoPartido)
+class EventoPartidoAdmin(admin.ModelAdmin):
+    # Los agregados de Jugador solo se actualizan desde mitorneo.eventos; aquí solo se consulta
+    list_display = ('partido', 'minuto', 'tipo', 'jugador', 'registrado_por')
+    list_filter = ('tipo',)
+    search_fields = ('jugador__nombre', 'jugador__apellido')
+    list_select_related = ('partido__equipo_local', 'partido__equipo_visitante', 'jugador', 'registrado_por')
+    raw_id_fields = ('partido', 'jugador', 'registrado_por')
+    
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Borrar aquí no pasaría por eventos.anular_eventos y dejaría los agregados inflados
+        return False
+
 @admin.register(Apuesta)
 class ApuestaAdmin(admin.ModelAdmin):
     list_display = ('usuario', 'partido_info', 'equipo', 'monto', 'estado_apuesta', 'fecha_apuesta')
@@ -177,6 +205,36 @@ class AuditoriaRolAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False  # No permitir editar
 
+@admin.register(AuditoriaAccion)
+class AuditoriaAccionAdmin(admin.ModelAdmin):
+    list_display = ('accion', 'objeto', 'usuario', 'fecha')
+    list_filter = ('accion', 'fecha')
+    search_fields = ('usuario__username', 'accion', 'objeto')
+    readonly_fields = ('usuario', 'accion', 'objeto', 'detalles', 'fecha')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(Trabajo)
+class TrabajoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'estado', 'intentos', 'creado', 'iniciado', 'terminado', 'trabajador')
+    list_filter = ('estado', 'tipo')
+    search_fields = ('tipo', 'trabajador')
+    readonly_fields = ('creado', 'iniciado', 'terminado', 'trabajador', 'resultado', 'error')
+
+@admin.register(ClaveIdempotencia)
+class ClaveIdempotenciaAdmin(admin.ModelAdmin):
+    list_display = ('clave', 'usuario', 'estado', 'creada')
+    list_filter = ('estado',)
+    search_fields = ('clave', 'usuario__username')
+    readonly_fields = ('usuario', 'clave', 'huella', 'estado', 'tipo_contenido', 'respuesta', 'creada')
+
+    def has_add_permission(self, request):
+        return False
+
 # Personalización del sitio de administración
 admin.site.site_header = "PlayLiga - Administración"
 admin.site.site_title = "PlayLiga Admin"
@@ -0,0 +1,253 @@
+"""
+Selección del once inicial de mayor fuerza para una formación dada.
+
+Cada jugador aporta su nivel si juega en su posición natural y una fracción de él
+(FACTOR_FUERA_DE_POSICION) si no. El once óptimo se obtiene con programación dinámica
+sobre los jugadores cuyo estado es cuántos puestos de cada posición están ya cubiertos:
+con una formación 4-3-3 hay 2·5·4·4 = 160 estados, así que una plantilla de 40 jugadores
+se resuelve en unas pocas miles de operaciones en vez de recorrer las C(40, 11) alineaciones.
+
+Para recorrer todas las alineaciones posibles sin generarlas se usan rangos: la alineación
+número r (combinación o k-permutación, en orden lexicográfico) se construye directamente a
+partir de r con el sistema combinatorio, así que cualquier página cuesta lo mismo que la primera.
+
+El orden por fuerza (suma de niveles, de mayor a menor) no tiene unrank cerrado: las
+combinaciones se sacan de un monticulo empezando por los k mejores jugadores, y cada una añade
+las vecinas que resultan de cambiar un jugador por el siguiente de menos nivel. Cuesta lo que
+la posición pedida, por eso se limita a las MAX_RANGO_FUERZA primeras combinaciones. Las
+k-permutaciones de una misma combinación suman lo mismo, así que cada combinación se expande en
+sus k! permutaciones en orden lexicográfico.
+"""
+import heapq
+import math
+import re
+
+from .models import normalizar_posicion
+
+ORDEN_POSICIONES = ('portero', 'defensa', 'medio', 'delantero')
+FORMACION_POR_DEFECTO = '4-3-3'
+FACTOR_FUERA_DE_POSICION = 0.5
+TITULARES = 11
+TIPOS_ENUMERACION = ('combinaciones', 'permutaciones')
+ORDENES_ENUMERACION = ('lexicografico', 'fuerza')
+MAX_TAMANO_PAGINA = 100
+MAX_RANGO_FUERZA = 10000
+
+_FORMACION = re.compile(r'^\d(-\d){1,3}$')
+
+
+def parsear_formacion(formacion):
+    """
+    '4-3-3' -> {'portero': 1, 'defensa': 4, 'medio': 3, 'delantero': 3}.
+    Con más de tres líneas ('4-2-3-1') las intermedias se suman al medio campo.
+    """
+    formacion = (formacion or FORMACION_POR_DEFECTO).strip()
+    if not _FORMACION.match(formacion):
+        raise ValueError(f'Formación no válida: {formacion!r} (ejemplo: 4-3-3)')
+    lineas = [int(n) for n in formacion.split('-')]
+    if sum(lineas) != TITULARES - 1:
+        raise ValueError(f'La formación {formacion} debe sumar {TITULARES - 1} jugadores de campo')
+    return {
+        'portero': 1,
+        'defensa': lineas[0],
+        'medio': sum(lineas[1:-1]),
+        'delantero': lineas[-1],
+    }
+
+
+def valor_en_posicion(nivel, posicion_natural, posicion):
+    return nivel if posicion_natural == posicion else nivel * FACTOR_FUERA_DE_POSICION
+
+
+def mejor_alineacion(jugadores, formacion=None):
+    """
+    jugadores: iterable de objetos o dicts con id, nivel y posicion.
+    Devuelve (fuerza, [(jugador, posicion_asignada, valor)], suplentes) con el once óptimo.
+    """
+    cupos = parsear_formacion(formacion)
+    # Orden estable: ante empates gana el jugador de más nivel y, después, el de menor id
+    jugadores = sorted(jugadores, key=lambda j: (-_campo(j, 'nivel'), _campo(j, 'id')))
+    if len(jugadores) < TITULARES:
+        raise ValueError(f'El equipo tiene {len(jugadores)} jugadores; se necesitan {TITULARES}')
+
+    limites = tuple(cupos[p] for p in ORDEN_POSICIONES)
+    naturales = [normalizar_posicion(_campo(j, 'posicion')) for j in jugadores]
+
+    # mejor[estado] = fuerza máxima con los jugadores vistos; estado = puestos cubiertos por posición
+    inicial = (0,) * len(ORDEN_POSICIONES)
+    mejor = {inicial: 0.0}
+    decisiones = []
+    for jugador, natural in zip(jugadores, naturales):
+        nivel = _campo(jugador, 'nivel')
+        siguiente = dict(mejor)
+        origen = {estado: (estado, None) for estado in mejor}
+        for estado, fuerza in mejor.items():
+            for i, posicion in enumerate(ORDEN_POSICIONES):
+                if estado[i] == limites[i]:
+                    continue
+                nuevo = estado[:i] + (estado[i] + 1,) + estado[i + 1:]
+                candidata = fuerza + valor_en_posicion(nivel, natural, posicion)
+                # El nivel puede ser 0 o negativo: cualquier fuerza vale para un estado nuevo
+                if nuevo not in siguiente or candidata > siguiente[nuevo]:
+                    siguiente[nuevo] = candidata
+                    origen[nuevo] = (estado, i)
+        mejor = siguiente
+        decisiones.append(origen)
+
+    # Se reconstruye el once recorriendo las decisiones hacia atrás
+    estado = limites
+    fuerza = mejor[estado]
+    titulares = []
+    for indice in range(len(jugadores) - 1, -1, -1):
+        estado, posicion = decisiones[indice][estado]
+        if posicion is not None:
+            jugador = jugadores[indice]
+            nombre = ORDEN_POSICIONES[posicion]
+            titulares.append((jugador, nombre, valor_en_posicion(_campo(jugador, 'nivel'), naturales[indice], nombre)))
+    titulares.reverse()
+    titulares.sort(key=lambda t: ORDEN_POSICIONES.index(t[1]))
+    elegidos = {id(t[0]) for t in titulares}
+    suplentes = [j for j in jugadores if id(j) not in elegidos]
+    return fuerza, titulares, suplentes
+
+
+def total_alineaciones(tipo, n, k=TITULARES):
+    """Número exacto de alineaciones de k jugadores entre n (entero de Python, sin límite)."""
+    return math.comb(n, k) if tipo == 'combinaciones' else math.perm(n, k)
+
+
+def unrank_combinacion(rango, n, k):
+    """Índices de la combinación número `rango` (desde 0) de C(n, k) en orden lexicográfico."""
+    indices = []
+    x = 0
+    for i in range(k):
+        # Combinaciones que empiezan por x en la posición i: C(n - x - 1, k - i - 1)
+        bloque = math.comb(n - x - 1, k - i - 1)
+        while rango >= bloque:
+            rango -= bloque
+            x += 1
+            bloque = math.comb(n - x - 1, k - i - 1)
+        indices.append(x)
+        x += 1
+    return indices
+
+
+def rank_combinacion(indices, n):
+    """Inversa de unrank_combinacion."""
+    k = len(indices)
+    rango = 0
+    anterior = -1
+    for i, x in enumerate(indices):
+        for y in range(anterior + 1, x):
+            rango += math.comb(n - y - 1, k - i - 1)
+        anterior = x
+    return rango
+
+
+def unrank_permutacion(rango, n, k):
+    """Índices de la k-permutación número `rango` (desde 0) de P(n, k) en orden lexicográfico."""
+    disponibles = list(range(n))
+    indices = []
+    for i in range(k):
+        cociente, rango = divmod(rango, math.perm(n - i - 1, k - i - 1))
+        indices.append(disponibles.pop(cociente))
+    return indices
+
+
+def rank_permutacion(indices, n):
+    """Inversa de unrank_permutacion."""
+    k = len(indices)
+    disponibles = list(range(n))
+    rango = 0
+    for i, x in enumerate(indices):
+        posicion = disponibles.index(x)
+        rango += posicion * math.perm(n - i - 1, k - i - 1)
+        disponibles.pop(posicion)
+    return rango
+
+
+def combinaciones_por_fuerza(niveles, k, cuantas):
+    """
+    Las `cuantas` primeras combinaciones de k índices de `niveles` (ordenados de mayor a menor)
+    por suma descendente; a igual suma, en orden lexicográfico.
+    """
+    inicial = tuple(range(k))
+    monticulo = [(-sum(niveles[i] for i in inicial), inicial)]
+    vistas = {inicial}
+    resultado = []
+    while monticulo and len(resultado) < cuantas:
+        negativa, indices = heapq.heappop(monticulo)
+        resultado.append(indices)
+        for posicion, x in enumerate(indices):
+            tope = indices[posicion + 1] if posicion + 1 < k else len(niveles)
+            if x + 1 == tope:
+                continue
+            # Cambiar un jugador por el siguiente nunca sube la suma: el orden del monticulo es exacto
+            vecina = indices[:posicion] + (x + 1,) + indices[posicion + 1:]
+            if vecina not in vistas:
+                vistas.add(vecina)
+                heapq.heappush(monticulo, (negativa + niveles[x] - niveles[x + 1], vecina))
+    return resultado
+
+
+def pagina_alineaciones(jugadores, tipo='combinaciones', k=TITULARES, pagina=1, tamano=20, orden='lexicografico'):
+    """
+    Página `pagina` (desde 1) de las alineaciones de k jugadores de la plantilla.
+    Con orden='lexicografico' se enumeran por id; con 'fuerza', de mayor a menor suma de niveles
+    (solo las que salen de las MAX_RANGO_FUERZA combinaciones más fuertes).
+    """
+    if tipo not in TIPOS_ENUMERACION:
+        raise ValueError(f'Tipo no válido: {tipo!r} (combinaciones o permutaciones)')
+    if orden not in ORDENES_ENUMERACION:
+        raise ValueError(f'Orden no válido: {orden!r} (lexicografico o fuerza)')
+    jugadores = list(jugadores)
+    n = len(jugadores)
+    if not 1 <= k <= n:
+        raise ValueError(f'k debe estar entre 1 y el número de jugadores ({n})')
+    if pagina < 1 or not 1 <= tamano <= MAX_TAMANO_PAGINA:
+        raise ValueError(f'La página empieza en 1 y el tamaño debe estar entre 1 y {MAX_TAMANO_PAGINA}')
+
+    total = total_alineaciones(tipo, n, k)
+    paginas = -(-total // tamano)
+    inicio = (pagina - 1) * tamano
+    rangos = range(inicio, min(inicio + tamano, total))
+    if orden == 'fuerza':
+        jugadores.sort(key=lambda j: (-_campo(j, 'nivel'), _campo(j, 'id')))
+        indices = _por_fuerza(jugadores, tipo, k, rangos)
+    else:
+        jugadores.sort(key=lambda j: _campo(j, 'id'))
+        unrank = unrank_combinacion if tipo == 'combinaciones' else unrank_permutacion
+        indices = (unrank(rango, n, k) for rango in rangos)
+
+    alineaciones = []
+    for rango, elegidos in zip(rangos, indices):
+        elegidos = [jugadores[i] for i in elegidos]
+        alineaciones.append({
+            'rango': rango,
+            'jugadores': [_campo(j, 'id') for j in elegidos],
+            'nivel_total': sum(_campo(j, 'nivel') for j in elegidos),
+        })
+    return {'total': total, 'paginas': paginas, 'alineaciones': alineaciones}
+
+
+def _por_fuerza(jugadores, tipo, k, rangos):
+    """Índices de las alineaciones `rangos` en orden de fuerza (jugadores ya ordenados por nivel)."""
+    if not rangos:
+        return []
+    # Cada combinación ocupa k! rangos seguidos si se enumeran permutaciones
+    bloque = 1 if tipo == 'combinaciones' else math.factorial(k)
+    necesarias = (rangos[-1] // bloque) + 1
+    if necesarias > MAX_RANGO_FUERZA:
+        raise ValueError(f'Con orden=fuerza solo se recorren las {MAX_RANGO_FUERZA} combinaciones más fuertes')
+    combinaciones = combinaciones_por_fuerza([_campo(j, 'nivel') for j in jugadores], k, necesarias)
+    if tipo == 'combinaciones':
+        return [list(combinaciones[rango]) for rango in rangos]
+    # Dentro de la combinación, la permutación número r en orden lexicográfico de sus índices
+    return [
+        [combinaciones[rango // bloque][i] for i in unrank_permutacion(rango % bloque, k, k)]
+        for rango in rangos
+    ]
+
+
+def _campo(jugador, nombre):
+    return jugador[nombre] if isinstance(jugador, dict) else getattr(jugador, nombre)
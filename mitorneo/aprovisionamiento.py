@@ -0,0 +1,90 @@
+"""
+Hash de contraseñas en paralelo para el alta masiva de cuentas.
+
+El PBKDF2 de Django se diseña para ser lento (cientos de milisegundos por contraseña), así que
+al dar de alta miles de cuentas el hash domina el tiempo total. Aquí se reparte en un pool de
+procesos. Se usa siempre el método "spawn" (el único disponible en Windows y el seguro en un
+servidor con hilos), de modo que cada worker arranca Django con su inicializador.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+LOTE_POR_TAREA = 32
+
+
+def _inicializar_worker(modulo_settings):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', modulo_settings)
+    import django
+    django.setup()
+
+
+def _hashear_lote(passwords):
+    return [make_password(p) for p in passwords]
+
+
+def procesos_por_defecto():
+    return getattr(settings, 'APROVISIONAMIENTO_PROCESOS', None) or os.cpu_count() or 1
+
+
+class Hasheador:
+    """
+    Reparte el hash de contraseñas en un pool de procesos que se crea la primera vez que
+    compensa (APROVISIONAMIENTO_MIN_PARALELO contraseñas) y se reutiliza hasta cerrar el bloque
+    with, para no pagar el arranque de los workers en cada lote.
+    """
+
+    def __init__(self, procesos=None):
+        self.procesos = procesos or procesos_por_defecto()
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def _pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_inicializar_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'miproyectofutbol.settings'),),
+            )
+        return self.pool
+
+    def hashear(self, passwords):
+        """
+        Hash de cada contraseña, en el mismo orden. Las vacías o None dan una contraseña
+        inutilizable, sin coste.
+        """
+        hashes = [None] * len(passwords)
+        pendientes = []
+        for indice, password in enumerate(passwords):
+            if password:
+                pendientes.append(indice)
+            else:
+                hashes[indice] = make_password(None)
+
+        if self.procesos <= 1 or len(pendientes) < getattr(settings, 'APROVISIONAMIENTO_MIN_PARALELO', 16):
+            for indice in pendientes:
+                hashes[indice] = make_password(passwords[indice])
+            return hashes
+
+        lotes = [pendientes[i:i + LOTE_POR_TAREA] for i in range(0, len(pendientes), LOTE_POR_TAREA)]
+        resultados = self._pool().map(_hashear_lote, [[passwords[i] for i in lote] for lote in lotes])
+        for lote, resultado in zip(lotes, resultados):
+            for indice, hash_ in zip(lote, resultado):
+                hashes[indice] = hash_
+        return hashes
+
+
+def hashear_passwords(passwords, procesos=None):
+    with Hasheador(procesos) as hasheador:
+        return hasheador.hashear(passwords)
@@ -0,0 +1,215 @@
+"""
+Auditoría de cambios de rol y acciones sensibles de administración, escrita por lotes.
+
+Los registros (AuditoriaRol, AuditoriaAccion) no se insertan en la petición que los genera:
+se añaden a un búfer en memoria del proceso y un hilo en segundo plano los escribe con
+bulk_create cada AUDITORIA_INTERVALO segundos o en cuanto se juntan AUDITORIA_LOTE. Así un
+cambio de rol o una simulación no pagan un INSERT más. Al terminar el proceso (atexit) se
+vacía lo pendiente.
+
+La memoria está acotada: si el búfer llega a AUDITORIA_MAX_PENDIENTES (la base de datos no da
+abasto o el hilo está parado) quien añade el registro vacía el búfer en su propio hilo antes
+de seguir, en lugar de dejarlo crecer o descartar registros.
+
+Los cambios de rol se detectan en signals.py comparando el rol al cargar el Usuario con el
+rol al guardarlo, y solo se auditan si la transacción se confirma. AuditoriaMiddleware guarda
+el usuario de la petición para rellenar cambiado_por.
+"""
+import atexit
+import logging
+import os
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+
+from . import metricas
+from .models import AuditoriaAccion, AuditoriaRol
+
+logger = logging.getLogger(__name__)
+
+METODOS_LECTURA = ('GET', 'HEAD', 'OPTIONS')
+
+_local = threading.local()
+
+
+def _lote():
+    return getattr(settings, 'AUDITORIA_LOTE', 500)
+
+
+def _intervalo():
+    return getattr(settings, 'AUDITORIA_INTERVALO', 1.0)
+
+
+def _max_pendientes():
+    return getattr(settings, 'AUDITORIA_MAX_PENDIENTES', 10000)
+
+
+class EscritorAuditoria:
+    """Búfer de instancias sin guardar y el hilo que las vuelca con bulk_create."""
+
+    def __init__(self):
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._pendientes = []
+        self._condicion = threading.Condition()
+        # Un solo volcado a la vez (el hilo, atexit o un productor con el búfer lleno)
+        self._escribiendo = threading.Lock()
+        self._hilo = None
+        self._parar = False
+
+    def reiniciar_tras_fork(self):
+        # El hilo no sobrevive al fork y los pendientes heredados ya los escribe el padre
+        self._reiniciar()
+
+    def agregar(self, instancia):
+        with self._condicion:
+            self._pendientes.append(instancia)
+            pendientes = len(self._pendientes)
+            if pendientes >= _lote():
+                self._condicion.notify()
+            if self._hilo is None and not self._parar:
+                self._hilo = threading.Thread(target=self._bucle, name='auditoria', daemon=True)
+                self._hilo.start()
+        if pendientes >= _max_pendientes():
+            self.vaciar()
+
+    def pendientes(self):
+        with self._condicion:
+            return len(self._pendientes)
+
+    def vaciar(self):
+        """Escribe todo lo pendiente; devuelve cuántos registros se escribieron."""
+        with self._escribiendo:
+            with self._condicion:
+                pendientes, self._pendientes = self._pendientes, []
+            if not pendientes:
+                return 0
+            return self._escribir(pendientes)
+
+    def _escribir(self, pendientes):
+        por_modelo = {}
+        for instancia in pendientes:
+            por_modelo.setdefault(type(instancia), []).append(instancia)
+        escritos = 0
+        for modelo, instancias in por_modelo.items():
+            try:
+                with transaction.atomic():
+                    modelo.objects.bulk_create(instancias, batch_size=_lote())
+                escritos += len(instancias)
+            except DatabaseError:
+                # Una fila inválida (p. ej. un usuario borrado antes del volcado) no tumba el lote
+                escritos += self._escribir_uno_a_uno(instancias)
+        descartados = len(pendientes) - escritos
+        metricas.incrementar('playliga_auditoria_registros_total', escritos, resultado='escrito')
+        if descartados:
+            metricas.incrementar('playliga_auditoria_registros_total', descartados, resultado='descartado')
+        return escritos
+
+    @staticmethod
+    def _escribir_uno_a_uno(instancias):
+        escritos = 0
+        for instancia in instancias:
+            try:
+                with transaction.atomic():
+                    instancia.save(force_insert=True)
+                escritos += 1
+            except DatabaseError:
+                campos = {f.attname: getattr(instancia, f.attname) for f in instancia._meta.concrete_fields}
+                logger.exception('No se pudo guardar el registro de %s: %s', type(instancia).__name__, campos)
+        return escritos
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                if not self._parar and len(self._pendientes) < _lote():
+                    self._condicion.wait(_intervalo())
+                if self._parar:
+                    return
+            try:
+                self.vaciar()
+            except Exception:
+                logger.exception('Error al volcar la auditoría')
+            finally:
+                # El hilo tiene su propia conexión: no se deja abierta entre volcados
+                close_old_connections()
+
+    def detener(self):
+        """Para el hilo y escribe lo pendiente en el hilo actual."""
+        with self._condicion:
+            self._parar = True
+            self._condicion.notify()
+            hilo = self._hilo
+        if hilo is not None and hilo is not threading.current_thread():
+            hilo.join(timeout=5)
+        try:
+            self.vaciar()
+        except Exception:
+            logger.exception('Error al volcar la auditoría al terminar')
+
+
+escritor = EscritorAuditoria()
+atexit.register(escritor.detener)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=escritor.reiniciar_tras_fork)
+
+
+def usuario_actual():
+    """Id del usuario autenticado de la petición en curso (AuditoriaMiddleware), o None."""
+    usuario = getattr(_local, 'usuario', None)
+    if usuario is None or not usuario.is_authenticated:
+        return None
+    return usuario.pk
+
+
+def registrar_cambio_rol(usuario_id, rol_anterior, rol_nuevo, cambiado_por_id=None):
+    """Audita un cambio de rol cuando se confirme la transacción en curso."""
+    registro = AuditoriaRol(
+        usuario_id=usuario_id, rol_anterior=rol_anterior, rol_nuevo=rol_nuevo,
+        cambiado_por_id=cambiado_por_id if cambiado_por_id is not None else usuario_actual(),
+        fecha_cambio=timezone.now(),
+    )
+    transaction.on_commit(lambda: escritor.agregar(registro))
+
+
+def registrar_accion(usuario_id, accion, objeto='', detalles=None):
+    registro = AuditoriaAccion(
+        usuario_id=usuario_id, accion=accion, objeto=objeto, detalles=detalles or {}, fecha=timezone.now(),
+    )
+    transaction.on_commit(lambda: escritor.agregar(registro))
+
+
+def auditar(accion, lectura=False):
+    """
+    Decorador de vista: audita `accion` si la respuesta no es un error. Las peticiones de
+    lectura solo se auditan con lectura=True (exportaciones). Debe ir debajo de los decoradores
+    de permisos y métodos, para que solo se ejecute cuando la vista se ejecuta de verdad.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            response = vista(request, *args, **kwargs)
+            if response.status_code < 400 and (lectura or request.method not in METODOS_LECTURA):
+                objeto = ','.join(f'{clave}={valor}' for clave, valor in sorted(kwargs.items()))
+                registrar_accion(
+                    request.user.pk, accion, objeto[:100],
+                    {'metodo': request.method, 'ruta': request.path, 'estado': response.status_code},
+                )
+            return response
+        return envoltura
+    return decorador
+
+
+class AuditoriaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.usuario = getattr(request, 'user', None)
+        try:
+            return self.get_response(request)
+        finally:
+            _local.usuario = None
@@ -0,0 +1,78 @@
+"""
+Backend de autenticación con el usuario en caché.
+
+AuthenticationMiddleware carga el Usuario de la sesión en cada petición, y los endpoints que se
+consultan sin parar (saldo, apuestas) y los controles de rol (es_admin, es_apostador...) solo
+necesitan sus campos. UsuarioCacheBackend guarda esos campos en la caché por id y reconstruye
+el Usuario sin tocar la base de datos. La entrada se borra al guardar o borrar el usuario
+(señales en signals.py), así que cambios de rol, contraseña o saldo_real hechos con save() se
+ven en la siguiente petición; quien actualice usuarios con .update() o bulk_update debe llamar
+a invalidar_usuarios().
+
+Solo se cachea con una caché compartida entre procesos (Redis, Memcached...). Con LocMem cada
+proceso tendría su copia y no se enteraría de las invalidaciones de los demás (otro worker, un
+comando, run_workers): un administrador revocado seguiría siéndolo hasta AUTH_CACHE_TIMEOUT. En
+ese caso el backend lee el usuario de la base de datos como ModelBackend.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from . import metricas
+from .models import Usuario
+
+
+def _timeout():
+    return getattr(settings, 'AUTH_CACHE_TIMEOUT', 300)
+
+
+def cache_compartida():
+    """Si la caché por defecto la ven todos los procesos; LocMem es de cada proceso."""
+    # `cache` es un proxy: el tipo del backend está en caches['default']
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def _clave(usuario_id):
+    return f'usuario:{usuario_id}'
+
+
+def _campos():
+    return [campo.attname for campo in Usuario._meta.concrete_fields]
+
+
+def guardar_en_cache(usuario):
+    campos = _campos()
+    cache.set(_clave(usuario.pk), [getattr(usuario, c) for c in campos], _timeout())
+
+
+def invalidar_usuarios(usuario_ids):
+    """Borra de la caché los usuarios indicados, ahora y otra vez al confirmar la transacción."""
+    claves = [_clave(usuario_id) for usuario_id in usuario_ids]
+    if not claves:
+        return
+    cache.delete_many(claves)
+    # Una petición concurrente podría volver a cachear el valor anterior antes del commit
+    transaction.on_commit(lambda: cache.delete_many(claves))
+
+
+class UsuarioCacheBackend(ModelBackend):
+    def get_user(self, user_id):
+        if not cache_compartida():
+            return super().get_user(user_id)
+        valores = cache.get(_clave(user_id))
+        if valores is not None:
+            campos = _campos()
+            # Si cambian los campos del modelo (migración) la entrada vieja no sirve
+            if len(valores) == len(campos):
+                metricas.incrementar('playliga_auth_cache_total', resultado='acierto')
+                usuario = Usuario.from_db('default', campos, valores)
+                return usuario if self.user_can_authenticate(usuario) else None
+
+        metricas.incrementar('playliga_auth_cache_total', resultado='fallo')
+        usuario = super().get_user(user_id)
+        if usuario is not None:
+            guardar_en_cache(usuario)
+        return usuario
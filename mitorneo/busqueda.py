@@ -0,0 +1,251 @@
+"""
+Búsqueda de jugadores por nombre, apellido y correo, por prefijo y tolerante a erratas.
+
+En PostgreSQL se usa pg_trgm: las migraciones 0011 y 0013 crean índices GIN de trigramas sobre
+mitorneo_normalizar(nombre) y (apellido) y sobre la parte del usuario del correo, minúsculas sin
+tildes como normalizar(), que sirven tanto para el operador %>> (parecido por trigramas con la
+palabra más parecida del campo) como para la expresión regular del prefijo de palabra. En el
+resto de bases de datos (SQLite en desarrollo) se construye en memoria un índice equivalente:
+palabra -> jugadores y trigrama -> palabras, más la lista ordenada de palabras para los
+prefijos. Se reconstruye cuando cambia la versión compartida en la caché (al guardar o borrar
+jugadores).
+
+Cada término de la consulta debe coincidir con algún campo del jugador; la puntuación suma, por
+término, 1 si es prefijo de una palabra (1.5 si es la palabra entera) o su parecido por
+trigramas con una palabra si supera UMBRAL_PARECIDO. Del correo cuentan las palabras de la parte
+del usuario, no el dominio, que comparten demasiados jugadores.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Jugador
+
+LIMITE_POR_DEFECTO = 20
+MAX_LIMITE = 100
+MIN_LONGITUD = 2
+MAX_TERMINOS = 4
+UMBRAL_PARECIDO = 0.3
+# Trigramas presentes en más palabras que esto (' ma', 'use'...) no aportan candidatos si ya
+# los aportó otro más raro del término: recorrerlos costaría cientos de milisegundos
+MAX_PALABRAS_POR_TRIGRAMA = 2000
+CAMPOS = ('nombre', 'apellido', 'correo')
+COLUMNAS = ('id', 'nombre', 'apellido', 'correo', 'nivel', 'posicion', 'equipo_id', 'equipo__nombre')
+
+_SEPARADORES = re.compile(r'[^0-9a-zñ]+')
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes ('Muñoz Pérez' -> 'muñoz perez'; la ñ se conserva)."""
+    texto = (texto or '').lower().replace('ñ', '\0')
+    texto = ''.join(c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c))
+    return texto.replace('\0', 'ñ')
+
+
+def terminos(consulta):
+    return [t for t in _SEPARADORES.split(normalizar(consulta)) if t][:MAX_TERMINOS]
+
+
+def trigramas(palabra):
+    """Como pg_trgm: la palabra con dos espacios delante y uno detrás, en trozos de tres."""
+    relleno = f'  {palabra} '
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def buscar(consulta, limite=LIMITE_POR_DEFECTO, incluir_correo=False):
+    """
+    Devuelve hasta `limite` jugadores (dicts con COLUMNAS y 'puntuacion') ordenados por
+    puntuación. Sin incluir_correo el correo no se busca ni se devuelve.
+    """
+    lista = terminos(consulta)
+    if not lista or sum(len(t) for t in lista) < MIN_LONGITUD:
+        return []
+    campos = CAMPOS if incluir_correo else CAMPOS[:2]
+    if connection.vendor == 'postgresql':
+        puntuaciones = _buscar_postgresql(lista, campos, limite)
+    else:
+        puntuaciones = _indice().buscar(lista, campos, limite)
+
+    filas = {f['id']: f for f in Jugador.objects.filter(id__in=[i for i, _ in puntuaciones]).values(*COLUMNAS)}
+    resultado = []
+    for jugador_id, puntuacion in puntuaciones:
+        fila = filas.get(jugador_id)
+        if fila is None:
+            continue
+        if not incluir_correo:
+            fila.pop('correo')
+        fila['equipo'] = fila.pop('equipo__nombre')
+        fila['puntuacion'] = round(puntuacion, 3)
+        resultado.append(fila)
+    return resultado
+
+
+# Límites de palabra de IndiceNgramas: todo lo que no es [0-9a-zñ] separa palabras
+_INICIO_PALABRA = '(^|[^0-9a-zñ])'
+_FIN_PALABRA = '([^0-9a-zñ]|$)'
+
+
+def _expresion_postgresql(campo):
+    # Los términos llegan sin tildes: se comparan con la columna normalizada igual (índices de las
+    # migraciones 0011 y 0013), no con lower(), o 'Pérez' nunca coincidiría por prefijo
+    normalizado = f'mitorneo_normalizar({campo})'
+    return f"split_part({normalizado}, '@', 1)" if campo == 'correo' else normalizado
+
+
+def _buscar_postgresql(lista, campos, limite):
+    # Por palabras, como IndiceNgramas: el prefijo debe empezar una palabra del campo ('carlos'
+    # encuentra a 'Juan Carlos') y el parecido es strict_word_similarity, el de la palabra más
+    # parecida y no el del campo entero. Los términos solo tienen [0-9a-zñ]: no hay que escaparlos
+    expresiones = [_expresion_postgresql(c) for c in campos]
+    puntos, condiciones, params_puntos, params_condiciones = [], [], [], []
+    for termino in lista:
+        prefijo = _INICIO_PALABRA + termino
+        palabra = prefijo + _FIN_PALABRA
+        coincide = ' OR '.join(f'{e} ~ %s OR {e} %%>> %s' for e in expresiones)
+        condiciones.append(f'({coincide})')
+        params_condiciones.extend(p for _ in expresiones for p in (prefijo, termino))
+        # Por término, el mejor campo: palabra entera (1.5), prefijo de palabra (1) o parecido
+        mejores = ', '.join(
+            f"CASE WHEN {e} ~ %s THEN 1.5 WHEN {e} ~ %s THEN 1.0 "
+            f"ELSE strict_word_similarity(%s, coalesce({e}, '')) END"
+            for e in expresiones
+        )
+        puntos.append(f'GREATEST({mejores})')
+        params_puntos.extend(p for _ in expresiones for p in (palabra, prefijo, termino))
+    sql = (
+        f'SELECT id, {" + ".join(puntos)} AS puntuacion FROM {Jugador._meta.db_table} '
+        f'WHERE {" AND ".join(condiciones)} ORDER BY puntuacion DESC, id LIMIT %s'
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        # %>> usa pg_trgm.strict_word_similarity_threshold (0.5 por defecto); el mismo umbral que en
+        # memoria, solo para esta transacción
+        cursor.execute("SELECT set_config('pg_trgm.strict_word_similarity_threshold', %s, true)",
+                       [str(UMBRAL_PARECIDO)])
+        cursor.execute(sql, params_puntos + params_condiciones + [limite])
+        return [(jugador_id, float(puntuacion)) for jugador_id, puntuacion in cursor.fetchall()]
+
+
+class IndiceNgramas:
+    """Índice en memoria: palabra -> [(jugador_id, campo)], trigrama -> palabras y palabras ordenadas."""
+
+    def __init__(self, filas):
+        self.palabras = {}
+        con_trigramas = set()
+        for jugador_id, *valores in filas:
+            for campo, valor in zip(CAMPOS, valores):
+                for palabra, trigramable in self._palabras(campo, valor):
+                    self.palabras.setdefault(palabra, []).append((jugador_id, campo))
+                    if trigramable:
+                        con_trigramas.add(palabra)
+        self.trigramas = {}
+        self.trigramas_palabra = {}
+        for palabra in con_trigramas:
+            propios = self.trigramas_palabra[palabra] = frozenset(trigramas(palabra))
+            for trigrama in propios:
+                self.trigramas.setdefault(trigrama, []).append(palabra)
+        self.ordenadas = sorted(self.palabras)
+
+    @staticmethod
+    def _palabras(campo, valor):
+        """[(palabra, si entra en el índice de trigramas)] de un campo."""
+        valor = normalizar(valor)
+        if not valor:
+            return []
+        if campo != 'correo':
+            return [(p, True) for p in _SEPARADORES.split(valor) if p]
+        # El correo completo solo se busca por prefijo; por parecido, los trozos del usuario
+        # (el dominio lo comparten demasiados)
+        usuario = valor.split('@', 1)[0]
+        return [(valor, False), *((p, True) for p in {p for p in _SEPARADORES.split(usuario) if p} - {valor})]
+
+    def _candidatas(self, termino):
+        """palabra -> puntuación para un término."""
+        candidatas = {}
+        inicio = bisect_left(self.ordenadas, termino)
+        for palabra in self.ordenadas[inicio:]:
+            if not palabra.startswith(termino):
+                break
+            candidatas[palabra] = 1.5 if palabra == termino else 1.0
+        propios = trigramas(termino)
+        parecidas = set()
+        for lista in sorted((self.trigramas.get(t, ()) for t in propios), key=len):
+            if parecidas and len(lista) > MAX_PALABRAS_POR_TRIGRAMA:
+                break
+            parecidas.update(lista)
+        for palabra in parecidas - candidatas.keys():
+            suyos = self.trigramas_palabra[palabra]
+            n = len(propios & suyos)
+            # |A ∩ B| / |A ∪ B| sin construir la unión
+            similitud = n / (len(propios) + len(suyos) - n)
+            if similitud >= UMBRAL_PARECIDO:
+                candidatas[palabra] = similitud
+        return candidatas
+
+    def buscar(self, lista, campos, limite):
+        if len(lista) == 1:
+            return self._buscar_termino(lista[0], campos, limite)
+        totales = None
+        for termino in lista:
+            mejores = {}
+            for palabra, puntuacion in self._candidatas(termino).items():
+                for jugador_id, campo in self.palabras[palabra]:
+                    if campo in campos and puntuacion > mejores.get(jugador_id, 0):
+                        mejores[jugador_id] = puntuacion
+            if totales is None:
+                totales = mejores
+            else:
+                # Todos los términos deben coincidir
+                totales = {j: totales[j] + p for j, p in mejores.items() if j in totales}
+            if not totales:
+                return []
+        return heapq.nsmallest(limite, totales.items(), key=lambda item: (-item[1], item[0]))
+
+    def _buscar_termino(self, termino, campos, limite):
+        # Recorriendo las palabras de mayor a menor puntuación, la primera vez que aparece un
+        # jugador ya tiene su puntuación final: se para al completar el límite (y su empate)
+        mejores = {}
+        corte = None
+        for palabra, puntuacion in sorted(self._candidatas(termino).items(), key=lambda item: -item[1]):
+            if corte is not None and puntuacion < corte:
+                break
+            for jugador_id, campo in self.palabras[palabra]:
+                if campo in campos and jugador_id not in mejores:
+                    mejores[jugador_id] = puntuacion
+            if corte is None and len(mejores) >= limite:
+                corte = puntuacion
+        return heapq.nsmallest(limite, mejores.items(), key=lambda item: (-item[1], item[0]))
+
+
+CLAVE_VERSION = 'busqueda:jugadores:version'
+_cerrojo = threading.Lock()
+_estado = {'version': None, 'indice': None}
+
+
+def _version():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(CLAVE_VERSION, version, None):
+            version = cache.get(CLAVE_VERSION, version)
+    return version
+
+
+def invalidar():
+    """Marca el índice en memoria como desactualizado en todos los procesos."""
+    cache.set(CLAVE_VERSION, time.time_ns(), None)
+
+
+def _indice():
+    version = _version()
+    with _cerrojo:
+        if _estado['version'] != version:
+            filas = Jugador.objects.values_list('id', *CAMPOS).iterator(chunk_size=5000)
+            _estado['indice'] = IndiceNgramas(filas)
+            _estado['version'] = version
+        return _estado['indice']
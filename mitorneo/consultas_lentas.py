@@ -0,0 +1,191 @@
+"""
+Registro de consultas lentas con captura automática del plan de ejecución.
+
+Las consultas que superan CONSULTAS_LENTAS_UMBRAL_MS se registran con la vista y la línea
+del proyecto que las originó, y se agregan por huella (el SQL normalizado, sin literales)
+para ver qué forma de consulta consume más tiempo. La primera vez que una huella es lenta
+se guarda su EXPLAIN. También se marcan como posibles N+1 las consultas idénticas que se
+repiten al menos CONSULTAS_N_MAS_1_UMBRAL veces en una misma petición.
+"""
+import hashlib
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+MAX_HUELLAS = 500
+
+_agregado = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+_LITERAL_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LISTA_IN = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|\d+)\s*,?)+\)', re.IGNORECASE)
+_ESPACIOS = re.compile(r'\s+')
+# Módulos de instrumentación que envuelven toda la petición y no son el origen real
+_INSTRUMENTACION = ('consultas_lentas.py', 'metricas.py', 'perfilado.py', 'benchmark_api.py')
+# Firma de connection.execute_wrapper: sus __call__ están en la pila de cada consulta
+_ARGUMENTOS_ENVOLTURA = ('self', 'execute', 'sql', 'params', 'many', 'context')
+
+
+def normalizar(sql):
+    sql = _LITERAL_TEXTO.sub('?', sql)
+    sql = _LISTA_IN.sub('IN (...)', sql)
+    sql = _NUMERO.sub('?', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+def huella(sql_normalizado):
+    return hashlib.sha1(sql_normalizado.encode()).hexdigest()[:12]
+
+
+def _origen():
+    """
+    Última línea del código del proyecto en la pila, sin contar Django, librerías, los módulos
+    de instrumentación ni el __call__ de ningún execute_wrapper.
+    """
+    base = str(settings.BASE_DIR)
+    marco = sys._getframe(1)
+    while marco is not None:
+        codigo = marco.f_code
+        envoltura = codigo.co_name == '__call__' and codigo.co_varnames[:6] == _ARGUMENTOS_ENVOLTURA
+        if codigo.co_filename.startswith(base) and 'site-packages' not in codigo.co_filename \
+                and not codigo.co_filename.endswith(_INSTRUMENTACION) and not envoltura:
+            return f'{codigo.co_filename[len(base) + 1:]}:{marco.f_lineno} en {codigo.co_name}'
+        marco = marco.f_back
+    return 'desconocido'
+
+
+def _explain(sql, params):
+    if connection.vendor == 'postgresql':
+        prefijo = 'EXPLAIN (ANALYZE off) '
+    elif connection.vendor == 'sqlite':
+        prefijo = 'EXPLAIN QUERY PLAN '
+    else:
+        prefijo = 'EXPLAIN '
+    _local.explicando = True
+    try:
+        # El savepoint evita que un EXPLAIN fallido aborte la transacción de la vista
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(prefijo + sql, params)
+                return '\n'.join(' | '.join(str(c) for c in fila) for fila in cursor.fetchall())
+    except DatabaseError as e:
+        return f'EXPLAIN no disponible: {e}'
+    finally:
+        _local.explicando = False
+
+
+def _entrada(sql):
+    normalizado = normalizar(sql)
+    clave = huella(normalizado)
+    entrada = _agregado.get(clave)
+    if entrada is None and len(_agregado) < MAX_HUELLAS:
+        entrada = _agregado[clave] = {
+            'huella': clave, 'sql': normalizado, 'lentas': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'n_mas_1': 0, 'vistas': Counter(), 'origenes': Counter(), 'plan': None,
+        }
+    return entrada
+
+
+def registrar_lenta(sql, params, duracion_ms, vista, origen, explicable=True):
+    with _lock:
+        entrada = _entrada(sql)
+        if entrada is None:
+            return
+        entrada['lentas'] += 1
+        entrada['total_ms'] += duracion_ms
+        entrada['max_ms'] = max(entrada['max_ms'], duracion_ms)
+        entrada['vistas'][vista] += 1
+        entrada['origenes'][origen] += 1
+        sin_plan = entrada['plan'] is None
+    if sin_plan and explicable and getattr(settings, 'CONSULTAS_LENTAS_EXPLAIN', True) \
+            and sql.lstrip()[:6].upper() == 'SELECT':
+        plan = _explain(sql, params)
+        with _lock:
+            entrada['plan'] = plan
+    logger.warning('Consulta lenta (%.1f ms) en %s desde %s [%s]: %s',
+                   duracion_ms, vista, origen, entrada['huella'], entrada['sql'][:500])
+
+
+def registrar_n_mas_1(sql, repeticiones, vista, origen):
+    with _lock:
+        entrada = _entrada(sql)
+        if entrada is None:
+            return
+        entrada['n_mas_1'] += 1
+        entrada['vistas'][vista] += 1
+        entrada['origenes'][origen] += 1
+    logger.warning('Posible N+1 en %s desde %s: %d consultas iguales [%s]: %s',
+                   vista, origen, repeticiones, entrada['huella'], entrada['sql'][:500])
+
+
+def resumen():
+    """Huellas agregadas, de mayor a menor tiempo acumulado."""
+    with _lock:
+        entradas = [
+            dict(e, total_ms=round(e['total_ms'], 2), max_ms=round(e['max_ms'], 2),
+                 vistas=dict(e['vistas']), origenes=dict(e['origenes'].most_common(5)))
+            for e in _agregado.values()
+        ]
+    return sorted(entradas, key=lambda e: (e['total_ms'], e['n_mas_1']), reverse=True)
+
+
+def reiniciar():
+    with _lock:
+        _agregado.clear()
+
+
+class RegistradorConsultas:
+    """execute_wrapper de una petición: mide cada consulta y cuenta las repetidas."""
+
+    def __init__(self, request):
+        self.request = request
+        self.umbral_ms = getattr(settings, 'CONSULTAS_LENTAS_UMBRAL_MS', 100)
+        self.repetidas = Counter()
+        self.origenes = {}
+
+    def vista(self):
+        coincidencia = getattr(self.request, 'resolver_match', None)
+        return (coincidencia.url_name or coincidencia.view_name) if coincidencia else 'sin_resolver'
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, 'explicando', False):
+            return execute(sql, params, many, context)
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+            # El SQL de Django ya viene parametrizado, así que el texto sirve de clave
+            self.repetidas[sql] += 1
+            if self.repetidas[sql] == 2:
+                self.origenes[sql] = _origen()
+            if duracion_ms >= self.umbral_ms:
+                registrar_lenta(sql, params, duracion_ms, self.vista(), _origen(), explicable=not many)
+
+    def finalizar(self):
+        umbral = getattr(settings, 'CONSULTAS_N_MAS_1_UMBRAL', 10)
+        for sql, repeticiones in self.repetidas.items():
+            if repeticiones >= umbral:
+                registrar_n_mas_1(sql, repeticiones, self.vista(), self.origenes.get(sql, 'desconocido'))
+
+
+class ConsultasLentasMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        registrador = RegistradorConsultas(request)
+        with connection.execute_wrapper(registrador):
+            response = self.get_response(request)
+        registrador.finalizar()
+        return response
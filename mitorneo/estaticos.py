@@ -0,0 +1,148 @@
+"""
+Estáticos con nombre versionado y precomprimidos.
+
+AlmacenComprimido (STORAGES['staticfiles']) es el ManifestStaticFilesStorage de Django, que
+en collectstatic copia cada archivo con el hash de su contenido en el nombre
+(adminpanel.3f2a9c1b.js) y reescribe las referencias url() de los CSS; además deja junto a cada
+archivo de texto sus variantes .gz y, si está instalado el paquete brotli, .br.
+
+EstaticosMiddleware sirve STATIC_URL desde STATIC_ROOT eligiendo la variante según
+Accept-Encoding, con Vary: Accept-Encoding y, para los nombres con hash, Cache-Control
+immutable de un año: el navegador no vuelve a pedirlos hasta que cambie el archivo (y con él
+su nombre). Con DEBUG=True runserver sirve los estáticos antes de llegar al middleware.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # opcional: sin él solo se generan las variantes .gz
+    brotli = None
+
+EXTENSIONES_COMPRIMIBLES = ('.css', '.js', '.json', '.svg', '.txt', '.html', '.map', '.xml')
+MIN_BYTES = 256
+# Una variante que no ahorra al menos un 5% no compensa
+RATIO_MAXIMO = 0.95
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_SIN_HASH = 'public, max-age=300'
+
+# Content-Encoding -> extensión, en orden de preferencia
+CODIFICACIONES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _comprimir_gzip(datos):
+    # mtime=0: el mismo archivo da siempre los mismos bytes
+    return gzip.compress(datos, compresslevel=9, mtime=0)
+
+
+def _comprimir_brotli(datos):
+    return brotli.compress(datos, quality=11)
+
+
+def _codificaciones_aceptadas(cabecera):
+    """'gzip, deflate, br;q=0' -> {'gzip', 'deflate'} (las de q=0 se rechazan)."""
+    aceptadas = set()
+    for parte in cabecera.split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        if nombre and parametros.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            aceptadas.add(nombre.lower())
+    return aceptadas
+
+
+class AlmacenComprimido(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Originales (por si alguien los enlaza sin {% static %}) y versiones con hash
+        nombres = set(self.hashed_files) | set(self.hashed_files.values())
+        for nombre in sorted(nombres):
+            if nombre.lower().endswith(EXTENSIONES_COMPRIMIBLES) and self.exists(nombre):
+                for variante in self.comprimir(nombre):
+                    yield nombre, variante, True
+
+    def comprimir(self, nombre):
+        """Escribe las variantes .gz/.br de `nombre` que ahorren espacio; devuelve sus nombres."""
+        ruta = self.path(nombre)
+        with open(ruta, 'rb') as archivo:
+            datos = archivo.read()
+        if len(datos) < MIN_BYTES:
+            return []
+        compresores = [('.gz', _comprimir_gzip)]
+        if brotli is not None:
+            compresores.append(('.br', _comprimir_brotli))
+        escritas = []
+        for extension, comprimir in compresores:
+            comprimido = comprimir(datos)
+            if len(comprimido) <= len(datos) * RATIO_MAXIMO:
+                with open(ruta + extension, 'wb') as archivo:
+                    archivo.write(comprimido)
+                escritas.append(nombre + extension)
+        return escritas
+
+
+class EstaticosMiddleware:
+    def __init__(self, get_response):
+        if not settings.STATIC_ROOT or not getattr(settings, 'ESTATICOS_SERVIR', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefijo = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.raiz = str(settings.STATIC_ROOT)
+        self.con_hash = None
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefijo):
+            response = self.servir(request, request.path_info[len(self.prefijo):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def nombres_con_hash(self):
+        # El manifiesto se lee una vez por proceso (tras collectstatic hay que reiniciar)
+        if self.con_hash is None:
+            self.con_hash = frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return self.con_hash
+
+    def servir(self, request, nombre):
+        nombre = posixpath.normpath(nombre).lstrip('/')
+        if nombre.endswith(('.gz', '.br')):
+            return None
+        try:
+            ruta = safe_join(self.raiz, nombre)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(ruta):
+            return None
+
+        aceptadas = _codificaciones_aceptadas(request.headers.get('Accept-Encoding', ''))
+        codificacion = None
+        for candidata, extension in CODIFICACIONES:
+            if candidata in aceptadas and os.path.isfile(ruta + extension):
+                codificacion, ruta_servida = candidata, ruta + extension
+                break
+        else:
+            ruta_servida = ruta
+
+        estado = os.stat(ruta_servida)
+        if not was_modified_since(request.headers.get('If-Modified-Since'), estado.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            tipo, _ = mimetypes.guess_type(ruta)
+            response = FileResponse(open(ruta_servida, 'rb'), content_type=tipo or 'application/octet-stream')
+            if codificacion:
+                response['Content-Encoding'] = codificacion
+        response['Last-Modified'] = http_date(estado.st_mtime)
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = CACHE_INMUTABLE if nombre in self.nombres_con_hash() else CACHE_SIN_HASH
+        return response
@@ -0,0 +1,173 @@
+"""
+Eventos de partido (goles, asistencias, tarjetas y apariciones) y los agregados de Jugador.
+
+Jugador.goles, asistencias y partidos_jugados se mantienen de forma incremental: al registrar
+o anular los eventos de un partido se calcula el delta de cada jugador en Python y se aplica
+con un único UPDATE (F() + CASE WHEN por jugador). reconstruir_estadisticas() los recalcula
+desde cero con una sola consulta agrupada, por si se cargan eventos sin pasar por aquí.
+"""
+import random
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.utils import timezone
+
+from . import rankings
+from .alineaciones import TITULARES, mejor_alineacion
+from .models import EventoPartido, Jugador, normalizar_posicion
+
+# Campo de Jugador que incrementa cada tipo de evento (las tarjetas no tienen agregado)
+CAMPO_POR_TIPO = {
+    'gol': 'goles',
+    'asistencia': 'asistencias',
+    'aparicion': 'partidos_jugados',
+}
+CAMPOS_ESTADISTICAS = ('goles', 'asistencias', 'partidos_jugados')
+
+# Peso de cada posición al elegir goleador y asistente en la simulación
+PESO_GOL = {'delantero': 4, 'medio': 2, 'defensa': 1, 'portero': 0.1, None: 1}
+PESO_ASISTENCIA = {'delantero': 2, 'medio': 4, 'defensa': 1, 'portero': 0.2, None: 1}
+PROBABILIDAD_ASISTENCIA = 0.7
+PROBABILIDAD_TARJETA = 0.15
+
+
+def _titulares(jugadores):
+    """Once de mayor fuerza, o la plantilla entera si no llega a once."""
+    jugadores = list(jugadores)
+    if len(jugadores) < TITULARES:
+        return jugadores
+    _, titulares, _ = mejor_alineacion(jugadores)
+    return [jugador for jugador, _, _ in titulares]
+
+
+def _elegir(jugadores, pesos, rng, excluir=None):
+    candidatos = [j for j in jugadores if j is not excluir]
+    if not candidatos:
+        return None
+    # El nivel es un entero libre: 0 o negativo no debe impedir elegir
+    pesos_candidatos = [max(j.nivel, 0) * pesos[normalizar_posicion(j.posicion)] for j in candidatos]
+    if sum(pesos_candidatos) <= 0:
+        return rng.choice(candidatos)
+    return rng.choices(candidatos, weights=pesos_candidatos)[0]
+
+
+def titulares_por_equipo(equipo_ids):
+    """equipo_id -> once de mayor fuerza (o plantilla completa si no llega a once)."""
+    plantillas = {equipo_id: [] for equipo_id in equipo_ids}
+    for jugador in Jugador.objects.filter(equipo_id__in=plantillas).only('id', 'equipo_id', 'nivel', 'posicion'):
+        plantillas[jugador.equipo_id].append(jugador)
+    return {equipo_id: _titulares(jugadores) for equipo_id, jugadores in plantillas.items()}
+
+
+def generar_eventos(partido, goles_local, goles_visitante, rng=random, titulares=None):
+    """
+    Eventos simulados (sin guardar) coherentes con el marcador del partido.
+    `titulares` (de titulares_por_equipo) evita consultar las plantillas en cada partido.
+    """
+    if titulares is None:
+        titulares = titulares_por_equipo([partido.equipo_local_id, partido.equipo_visitante_id])
+
+    eventos = []
+    for equipo_id, goles in ((partido.equipo_local_id, goles_local), (partido.equipo_visitante_id, goles_visitante)):
+        once = titulares.get(equipo_id)
+        if not once:
+            continue
+        eventos.extend(EventoPartido(partido=partido, jugador=j, tipo='aparicion', minuto=0) for j in once)
+        for _ in range(goles):
+            minuto = rng.randint(1, 90)
+            goleador = _elegir(once, PESO_GOL, rng)
+            eventos.append(EventoPartido(partido=partido, jugador=goleador, tipo='gol', minuto=minuto))
+            if rng.random() < PROBABILIDAD_ASISTENCIA:
+                asistente = _elegir(once, PESO_ASISTENCIA, rng, excluir=goleador)
+                if asistente:
+                    eventos.append(EventoPartido(partido=partido, jugador=asistente, tipo='asistencia', minuto=minuto))
+        for jugador in once:
+            if rng.random() < PROBABILIDAD_TARJETA:
+                eventos.append(EventoPartido(partido=partido, jugador=jugador, tipo='tarjeta', minuto=rng.randint(1, 90)))
+    return eventos
+
+
+def _deltas(filas):
+    """(jugador_id, tipo, partido_id) -> {jugador_id: Counter(campo: delta)}."""
+    deltas = {}
+    apariciones = set()
+    for jugador_id, tipo, partido_id in filas:
+        campo = CAMPO_POR_TIPO.get(tipo)
+        if campo is None:
+            continue
+        if campo == 'partidos_jugados':
+            # Un jugador suma como mucho un partido jugado por partido
+            if (jugador_id, partido_id) in apariciones:
+                continue
+            apariciones.add((jugador_id, partido_id))
+        deltas.setdefault(jugador_id, Counter())[campo] += 1
+    return deltas
+
+
+def aplicar_deltas(deltas, signo=1):
+    """Suma (o resta, con signo=-1) los deltas con un único UPDATE sobre los jugadores afectados."""
+    if not deltas:
+        return 0
+    cambios = {}
+    for campo in CAMPOS_ESTADISTICAS:
+        casos = [When(id=jugador_id, then=Value(signo * d[campo])) for jugador_id, d in deltas.items() if d[campo]]
+        if casos:
+            cambios[campo] = F(campo) + Case(*casos, default=Value(0))
+    if not cambios:
+        return 0
+    rankings.actualizar_al_confirmar(deltas)
+    return Jugador.objects.filter(id__in=list(deltas)).update(actualizado=timezone.now(), **cambios)
+
+
+def registrar_eventos(eventos, batch_size=1000):
+    """Guarda los eventos en bloque y actualiza los agregados de los jugadores."""
+    with transaction.atomic():
+        EventoPartido.objects.bulk_create(eventos, batch_size=batch_size)
+        aplicar_deltas(_deltas((e.jugador_id, e.tipo, e.partido_id) for e in eventos))
+    return eventos
+
+
+def anular_eventos(partido, solo_simulados=False):
+    """
+    Borra los eventos de un partido descontándolos de los agregados. Con solo_simulados, solo
+    los que generó la simulación (sin registrado_por), p. ej. antes de re-simular.
+    """
+    with transaction.atomic():
+        eventos = EventoPartido.objects.filter(partido=partido)
+        if solo_simulados:
+            eventos = eventos.filter(registrado_por__isnull=True)
+        filas = list(eventos.values_list('jugador_id', 'tipo', 'partido_id'))
+        if filas:
+            aplicar_deltas(_deltas(filas), signo=-1)
+            eventos.delete()
+    return len(filas)
+
+
+def reconstruir_estadisticas(batch_size=1000):
+    """
+    Recalcula goles, asistencias y partidos jugados de todos los jugadores con una consulta
+    agrupada sobre EventoPartido. Devuelve cuántos jugadores cambiaron.
+    """
+    agregados = {
+        fila['jugador_id']: fila
+        for fila in EventoPartido.objects.values('jugador_id').annotate(
+            goles=Count('id', filter=Q(tipo='gol')),
+            asistencias=Count('id', filter=Q(tipo='asistencia')),
+            partidos_jugados=Count('partido', filter=Q(tipo='aparicion'), distinct=True),
+        )
+    }
+    vacio = dict.fromkeys(CAMPOS_ESTADISTICAS, 0)
+    cambiados = []
+    ahora = timezone.now()
+    with transaction.atomic():
+        for jugador in Jugador.objects.only('id', *CAMPOS_ESTADISTICAS).iterator(chunk_size=batch_size):
+            nuevos = agregados.get(jugador.id, vacio)
+            if any(getattr(jugador, campo) != nuevos[campo] for campo in CAMPOS_ESTADISTICAS):
+                for campo in CAMPOS_ESTADISTICAS:
+                    setattr(jugador, campo, nuevos[campo])
+                jugador.actualizado = ahora
+                cambiados.append(jugador)
+        Jugador.objects.bulk_update(cambiados, [*CAMPOS_ESTADISTICAS, 'actualizado'], batch_size=batch_size)
+        transaction.on_commit(rankings.invalidar)
+    return len(cambiados)
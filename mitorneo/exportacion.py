@@ -0,0 +1,123 @@
+"""
+Exportación en streaming (NDJSON o CSV) de partidos, apuestas, recargas y jugadores.
+
+Las filas se leen con iterator(chunk_size=...), que en PostgreSQL usa un cursor del lado del
+servidor, y se escriben a medida que llegan, así que la memoria no depende del tamaño de la
+tabla. También se puede filtrar por id (desde_id) o por fecha (desde, solo en apuestas y
+recargas).
+
+Las exportaciones incrementales usan una marca de tiempo por tabla: `actualizado` en partidos,
+apuestas y jugadores, que cambia cada vez que se modifican (un partido simulado, una apuesta
+liquidada, las estadísticas de un jugador), y la fecha de la recarga, que no cambia. Cada
+exportación incluye las filas con marca en (desde_marca, hasta], con `hasta` = ahora menos
+EXPORTACION_RETRASO segundos, y la siguiente parte de `hasta`. El retraso cubre las transacciones
+aún abiertas: una fila se marca al escribirla pero se ve al confirmar, y una transacción más
+larga que el retraso podría perderse. Una fila modificada vuelve a exportarse, así que el destino
+debe reemplazar por id.
+"""
+import csv
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Apuesta, Jugador, Partido, RecargaSaldo
+
+TAMANO_CHUNK = 2000
+FORMATOS = ('ndjson', 'csv')
+
+# tipo -> (modelo, columnas, campo de fecha para exportar "desde" o None, campo de la marca)
+EXPORTACIONES = {
+    'partidos': (Partido, (
+        'id', 'fecha', 'equipo_local_id', 'equipo_local__nombre', 'equipo_visitante_id',
+        'equipo_visitante__nombre', 'arbitro_id', 'goles_local', 'goles_visitante', 'simulado', 'ganador_id',
+        'actualizado',
+    ), None, 'actualizado'),
+    'apuestas': (Apuesta, (
+        'id', 'usuario_id', 'partido_id', 'equipo_id', 'monto', 'fecha_apuesta', 'ganador', 'actualizado',
+    ), 'fecha_apuesta', 'actualizado'),
+    'recargas': (RecargaSaldo, (
+        'id', 'usuario_id', 'monto', 'metodo_pago', 'fecha_recarga',
+    ), 'fecha_recarga', 'fecha_recarga'),
+    'jugadores': (Jugador, (
+        'id', 'usuario_id', 'nombre', 'apellido', 'equipo_id', 'equipo__nombre', 'posicion', 'nivel',
+        'numero_camiseta', 'partidos_jugados', 'goles', 'asistencias', 'actualizado',
+    ), None, 'actualizado'),
+}
+
+
+def fecha_iso(texto, nombre='desde'):
+    """Fecha ISO 8601 (con zona horaria o en la del proyecto); ValueError si no lo es."""
+    fecha = parse_datetime(texto)
+    if fecha is None:
+        raise ValueError(f'{nombre} debe ser una fecha ISO 8601')
+    return timezone.make_aware(fecha) if timezone.is_naive(fecha) else fecha
+
+
+def preparar(tipo, desde_id=None, desde=None, desde_marca=None):
+    """
+    Devuelve (queryset de tuplas, columnas, marca). `marca` es el instante hasta el que se
+    exporta: la siguiente exportación incremental pasa desde_marca=marca.
+    """
+    if tipo not in EXPORTACIONES:
+        raise ValueError(f'Tipo no válido: {tipo} ({", ".join(EXPORTACIONES)})')
+    modelo, columnas, campo_fecha, campo_marca = EXPORTACIONES[tipo]
+    marca = timezone.now() - timedelta(seconds=getattr(settings, 'EXPORTACION_RETRASO', 60))
+    consulta = modelo.objects.filter(**{f'{campo_marca}__lte': marca})
+    if desde_marca is not None:
+        consulta = consulta.filter(**{f'{campo_marca}__gt': desde_marca})
+    if desde_id is not None:
+        consulta = consulta.filter(id__gt=desde_id)
+    if desde is not None:
+        if campo_fecha is None:
+            raise ValueError(f'{tipo} no admite exportación por fecha; use desde_marca')
+        consulta = consulta.filter(**{f'{campo_fecha}__gte': desde})
+    return consulta.order_by('id').values_list(*columnas), columnas, marca
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def filas_ndjson(consulta, columnas, chunk_size=TAMANO_CHUNK):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for fila in consulta.iterator(chunk_size=chunk_size):
+        yield encoder.encode(dict(zip(columnas, fila))) + '\n'
+
+
+def filas_csv(consulta, columnas, chunk_size=TAMANO_CHUNK):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(columnas)
+    for fila in consulta.iterator(chunk_size=chunk_size):
+        yield escritor.writerow([v.isoformat() if hasattr(v, 'isoformat') else v for v in fila])
+
+
+def generar(tipo, formato='ndjson', desde_id=None, desde=None, chunk_size=TAMANO_CHUNK, desde_marca=None):
+    """Devuelve (generador de líneas de texto, marca)."""
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato no válido: {formato} ({", ".join(FORMATOS)})')
+    consulta, columnas, marca = preparar(tipo, desde_id, desde, desde_marca)
+    filas = filas_ndjson if formato == 'ndjson' else filas_csv
+    return filas(consulta, columnas, chunk_size), marca
+
+
+def leer_marcas(ruta):
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return {}
+
+
+def guardar_marcas(ruta, marcas):
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(marcas, archivo, indent=2)
+    os.replace(temporal, ruta)
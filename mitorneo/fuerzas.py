@@ -0,0 +1,98 @@
+"""
+Agregados de fuerza por equipo (FuerzaEquipo) y su uso en la simulación de partidos.
+"""
+import random
+
+from django.db.models import Count, Max, Sum
+
+from .models import Equipo, Jugador, FuerzaEquipo, normalizar_posicion
+
+
+def _agregar(filas):
+    """Combina filas (equipo_id, posicion, n, total, maximo) en un dict de campos por equipo."""
+    equipos = {}
+    for equipo_id, posicion, n, total, maximo in filas:
+        datos = equipos.setdefault(equipo_id, {
+            'jugadores': 0, 'nivel_total': 0, 'nivel_maximo': 0, 'nivel_por_posicion': {},
+        })
+        datos['jugadores'] += n
+        datos['nivel_total'] += total or 0
+        datos['nivel_maximo'] = max(datos['nivel_maximo'], maximo or 0)
+        clave = normalizar_posicion(posicion) or 'sin_posicion'
+        datos['nivel_por_posicion'][clave] = datos['nivel_por_posicion'].get(clave, 0) + (total or 0)
+    for datos in equipos.values():
+        datos['nivel_promedio'] = round(datos['nivel_total'] / datos['jugadores'], 2) if datos['jugadores'] else 0
+    return equipos
+
+
+def _filas(equipo_ids=None):
+    jugadores = Jugador.objects.filter(equipo__isnull=False)
+    if equipo_ids is not None:
+        jugadores = jugadores.filter(equipo_id__in=equipo_ids)
+    return (
+        jugadores.values('equipo_id', 'posicion')
+        .annotate(n=Count('id'), total=Sum('nivel'), maximo=Max('nivel'))
+        .values_list('equipo_id', 'posicion', 'n', 'total', 'maximo')
+    )
+
+
+def recalcular_fuerzas(equipo_ids=None):
+    """
+    Recalcula FuerzaEquipo de los equipos indicados (o de todos) con una sola consulta agrupada.
+    Los equipos sin jugadores quedan con agregados a cero.
+    """
+    if equipo_ids is not None:
+        equipo_ids = [e for e in set(equipo_ids) if e is not None]
+        if not equipo_ids:
+            return
+        # Descarta equipos borrados (p. ej. un jugador que se elimina junto a su equipo)
+        equipo_ids = list(Equipo.objects.filter(id__in=equipo_ids).values_list('id', flat=True))
+    else:
+        equipo_ids = list(Equipo.objects.values_list('id', flat=True))
+    agregados = _agregar(_filas(equipo_ids))
+    vacio = {'jugadores': 0, 'nivel_total': 0, 'nivel_promedio': 0, 'nivel_maximo': 0, 'nivel_por_posicion': {}}
+    fuerzas = [FuerzaEquipo(equipo_id=e, **agregados.get(e, vacio)) for e in equipo_ids]
+    FuerzaEquipo.objects.bulk_create(
+        fuerzas,
+        update_conflicts=True,
+        unique_fields=['equipo'],
+        update_fields=['jugadores', 'nivel_total', 'nivel_promedio', 'nivel_maximo', 'nivel_por_posicion', 'actualizado'],
+        batch_size=1000,
+    )
+
+
+def obtener_fuerzas(equipo_ids):
+    """dict equipo_id -> FuerzaEquipo; calcula al vuelo las que aún no existen."""
+    fuerzas = FuerzaEquipo.objects.in_bulk(equipo_ids)
+    faltantes = [e for e in equipo_ids if e not in fuerzas]
+    if faltantes:
+        recalcular_fuerzas(faltantes)
+        fuerzas.update(FuerzaEquipo.objects.in_bulk(faltantes))
+    return fuerzas
+
+
+def fuerza_a_dict(fuerza):
+    return {
+        'equipo_id': fuerza.equipo_id,
+        'jugadores': fuerza.jugadores,
+        'nivel_total': fuerza.nivel_total,
+        'nivel_promedio': fuerza.nivel_promedio,
+        'nivel_maximo': fuerza.nivel_maximo,
+        'nivel_por_posicion': fuerza.nivel_por_posicion,
+    }
+
+
+def probabilidad_local(fuerza_local, fuerza_visitante):
+    total = fuerza_local.nivel_total + fuerza_visitante.nivel_total
+    return 0.5 if total == 0 else fuerza_local.nivel_total / total
+
+
+def simular_goles(fuerza_local, fuerza_visitante, rng=random):
+    """
+    Goles de cada equipo como binomial(5, p) con p la cuota de fuerza del equipo:
+    con equipos iguales la media es 2.5 goles, la misma que el antiguo randint(0, 5).
+    """
+    p = probabilidad_local(fuerza_local, fuerza_visitante)
+    goles_local = sum(rng.random() < p for _ in range(5))
+    goles_visitante = sum(rng.random() < 1 - p for _ in range(5))
+    return goles_local, goles_visitante
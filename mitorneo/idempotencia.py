@@ -0,0 +1,144 @@
+"""
+Cabecera Idempotency-Key en los POST que mueven saldo (apuestas y recargas).
+
+Un cliente que agota su timeout no sabe si el servidor llegó a cobrar; si reintenta con la misma
+clave, recibe la primera respuesta guardada en vez de volver a descontar o abonar el saldo.
+
+- La clave se reserva con un INSERT en ClaveIdempotencia (único por usuario y clave) en su propia
+  transacción, así que de dos peticiones simultáneas con la misma clave solo una ejecuta la vista.
+  La otra recibe 409 con Retry-After mientras la primera sigue en curso.
+- La vista y el guardado de su respuesta van en una misma transacción: o queda todo o nada. Una
+  respuesta 5xx deshace el trabajo de la vista y libera la clave, para que el reintento se ejecute.
+- La misma clave con otro cuerpo o en otra ruta responde 422. Pasado IDEMPOTENCIA_TTL la clave
+  caduca y puede reutilizarse; purgar_idempotencia borra las caducadas.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import ClaveIdempotencia
+
+CABECERA = 'Idempotency-Key'
+LONGITUD_MAXIMA = ClaveIdempotencia._meta.get_field('clave').max_length
+
+
+class _Descartar(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class _ClaveTomada(Exception):
+    pass
+
+
+def ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCIA_TTL', 86400))
+
+
+def _huella(request):
+    resumen = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    resumen.update(request.body)
+    return resumen.hexdigest()
+
+
+def _reservar(usuario_id, clave, huella):
+    """
+    Crea la reserva de la clave. Devuelve (registro, reservada): si ya existía, el registro
+    existente y False. Una reserva caducada, o en curso desde hace más de IDEMPOTENCIA_EN_CURSO
+    (el proceso pudo morir), se toma con un UPDATE condicional que cambia `creada`: si la petición
+    original seguía viva, su guardado final ya no coincide y deshace su trabajo.
+    """
+    ahora = timezone.now()
+    try:
+        with transaction.atomic():
+            return ClaveIdempotencia.objects.create(usuario_id=usuario_id, clave=clave, huella=huella, creada=ahora), True
+    except IntegrityError:
+        pass
+    registro = ClaveIdempotencia.objects.filter(usuario_id=usuario_id, clave=clave).first()
+    if registro is None:
+        # Purgada entre el INSERT y la lectura: quien reintente la reservará
+        return None, False
+    en_curso = timedelta(seconds=getattr(settings, 'IDEMPOTENCIA_EN_CURSO', 60))
+    caducada = registro.creada <= ahora - ttl()
+    abandonada = registro.estado is None and registro.creada <= ahora - en_curso
+    if caducada or abandonada:
+        condicion = {} if caducada else {'estado__isnull': True}
+        tomada = ClaveIdempotencia.objects.filter(pk=registro.pk, creada=registro.creada, **condicion).update(
+            huella=huella, estado=None, tipo_contenido='', respuesta='', creada=ahora,
+        )
+        if tomada:
+            registro.huella, registro.estado, registro.creada = huella, None, ahora
+            return registro, True
+        registro = ClaveIdempotencia.objects.filter(pk=registro.pk).first()
+    return registro, False
+
+
+def _repetir(registro, huella):
+    if registro is None or registro.estado is None:
+        response = JsonResponse({'error': 'Hay una petición en curso con esta Idempotency-Key.'}, status=409)
+        response['Retry-After'] = '1'
+        return response
+    if registro.huella != huella:
+        return JsonResponse({'error': 'La Idempotency-Key ya se usó con otra petición.'}, status=422)
+    response = HttpResponse(registro.respuesta, status=registro.estado, content_type=registro.tipo_contenido)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotente(vista):
+    """
+    Decorador para los POST con efectos: sin la cabecera Idempotency-Key no hace nada. Debe ir
+    debajo de login_required, porque las claves son de cada usuario.
+    """
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        clave = request.headers.get(CABECERA)
+        if request.method != 'POST' or not clave:
+            return vista(request, *args, **kwargs)
+        if len(clave) > LONGITUD_MAXIMA:
+            return JsonResponse({'error': f'La Idempotency-Key admite como mucho {LONGITUD_MAXIMA} caracteres.'}, status=400)
+
+        huella = _huella(request)
+        registro, reservada = _reservar(request.user.pk, clave, huella)
+        if not reservada:
+            return _repetir(registro, huella)
+
+        try:
+            with transaction.atomic():
+                response = vista(request, *args, **kwargs)
+                if response.status_code >= 500 or response.streaming:
+                    raise _Descartar(response)
+                guardada = ClaveIdempotencia.objects.filter(pk=registro.pk, creada=registro.creada).update(
+                    estado=response.status_code,
+                    tipo_contenido=response.get('Content-Type', ''),
+                    respuesta=response.content.decode(response.charset),
+                )
+                if not guardada:
+                    # Un reintento dio la reserva por abandonada y ejecuta la vista: esta se deshace
+                    raise _ClaveTomada
+        except _ClaveTomada:
+            return _repetir(None, huella)
+        except _Descartar as descartada:
+            ClaveIdempotencia.objects.filter(pk=registro.pk, creada=registro.creada).delete()
+            return descartada.response
+        except Exception:
+            ClaveIdempotencia.objects.filter(pk=registro.pk, creada=registro.creada).delete()
+            raise
+        return response
+    return envoltura
+
+
+def purgar(lote=1000):
+    """Borra las claves caducadas por lotes; devuelve cuántas."""
+    limite = timezone.now() - ttl()
+    total = 0
+    while True:
+        ids = list(ClaveIdempotencia.objects.filter(creada__lte=limite).values_list('pk', flat=True)[:lote])
+        if not ids:
+            return total
+        total += ClaveIdempotencia.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,115 @@
+"""
+Variantes redimensionadas (AVIF/WebP y el formato original) de las imágenes estáticas.
+
+El comando optimizar_imagenes genera, para cada imagen de mitorneo/static/mitorneo/imagenes,
+una copia por ancho (sin ampliar nunca el original) y por formato en su subdirectorio
+variantes/ (ignorado por git), junto con variantes.json, que describe lo generado. Los tags de
+templatetags/imagenes.py leen ese índice para emitir <picture>/srcset o los fondos por media
+query; si no existe (no se ha ejecutado el comando) emiten la imagen original tal cual.
+Pillow solo hace falta para generar, no para servir.
+"""
+import json
+import os
+
+from django.conf import settings
+from django.utils.text import slugify
+
+EXTENSIONES_ORIGEN = ('.jpg', '.jpeg', '.png')
+FORMATOS = ('avif', 'webp')
+ANCHOS = (320, 480, 640)
+CALIDAD = {'avif': 55, 'webp': 75, 'jpeg': 80}
+INDICE = 'variantes.json'
+PREFIJO_ESTATICO = 'mitorneo/imagenes/variantes'
+TIPOS = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+}
+
+
+def directorio_origen():
+    return os.path.join(settings.BASE_DIR, 'mitorneo', 'static', 'mitorneo', 'imagenes')
+
+
+def directorio_variantes():
+    return os.path.join(directorio_origen(), 'variantes')
+
+
+def _guardar(imagen, ruta, formato):
+    opciones = {'quality': CALIDAD.get(formato, 80)}
+    if formato == 'webp':
+        opciones['method'] = 6
+    elif formato == 'jpeg':
+        opciones.update(optimize=True, progressive=True)
+    elif formato == 'png':
+        opciones = {'optimize': True}
+    imagen.save(ruta, format=formato.upper(), **opciones)
+
+
+def generar_variantes(ruta, anchos=ANCHOS, formatos=FORMATOS, destino=None, forzar=False):
+    """
+    Genera las variantes de la imagen `ruta`. Devuelve la entrada del índice:
+    {'ancho', 'alto', 'variantes': {formato: [[ancho, nombre estático, bytes], ...]}}.
+    Las que ya existen y son más recientes que el original no se regeneran salvo con forzar.
+    """
+    from PIL import Image, features
+
+    destino = destino or directorio_variantes()
+    os.makedirs(destino, exist_ok=True)
+    base = slugify(os.path.splitext(os.path.basename(ruta))[0])
+    modificado = os.path.getmtime(ruta)
+
+    with Image.open(ruta) as original:
+        original.load()
+        ancho_original, alto_original = original.size
+        propio = 'png' if original.format == 'PNG' else 'jpeg'
+        tiene_alfa = original.mode in ('RGBA', 'LA', 'P')
+        # Solo se reduce: los anchos mayores que el original se sustituyen por el original
+        objetivos = sorted({a for a in anchos if a < ancho_original} | {ancho_original})
+
+        entrada = {'ancho': ancho_original, 'alto': alto_original, 'variantes': {}}
+        for formato in (*formatos, propio):
+            if formato == 'avif' and not features.check('avif'):
+                continue
+            generadas = []
+            for ancho in objetivos:
+                nombre = f'{base}-{ancho}.{formato}'
+                salida = os.path.join(destino, nombre)
+                if forzar or not os.path.exists(salida) or os.path.getmtime(salida) < modificado:
+                    alto = round(alto_original * ancho / ancho_original)
+                    copia = original.resize((ancho, alto), Image.LANCZOS) if ancho != ancho_original else original.copy()
+                    if formato == 'jpeg' or not tiene_alfa:
+                        copia = copia.convert('RGB')
+                    elif copia.mode == 'P':
+                        copia = copia.convert('RGBA')
+                    _guardar(copia, salida, formato)
+                generadas.append([ancho, f'{PREFIJO_ESTATICO}/{nombre}', os.path.getsize(salida)])
+            entrada['variantes'][formato] = generadas
+        entrada['formato_original'] = propio
+    return entrada
+
+
+def guardar_indice(indice, destino=None):
+    ruta = os.path.join(destino or directorio_variantes(), INDICE)
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(indice, archivo, indent=2, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+_indice = {'mtime': None, 'datos': {}}
+
+
+def indice():
+    """Índice de variantes (nombre estático original -> entrada), recargado si cambia el archivo."""
+    ruta = os.path.join(directorio_variantes(), INDICE)
+    try:
+        mtime = os.path.getmtime(ruta)
+    except OSError:
+        return {}
+    if _indice['mtime'] != mtime:
+        with open(ruta, encoding='utf-8') as archivo:
+            _indice['datos'] = json.load(archivo)
+        _indice['mtime'] = mtime
+    return _indice['datos']
@@ -0,0 +1,327 @@
+"""
+Importación masiva desde CSV de equipos, jugadores, árbitros y partidos.
+
+El archivo se lee fila a fila y se procesa por lotes: en cada lote las referencias (usuarios,
+correos, equipos, árbitros) se resuelven con una consulta por tipo y las filas válidas se
+insertan con bulk_create. Todo ocurre en una transacción; las filas con errores se saltan y se
+informan con su número de línea. Con simular=True se valida todo y se deshace al final.
+
+Columnas por tipo (la primera fila del CSV es la cabecera):
+  equipos:   nombre
+  jugadores: username, nombre, apellido, correo, equipo, [nivel, posicion, numero_camiseta, password]
+  arbitros:  username, nombre, apellido, correo, [password]
+  partidos:  fecha, equipo_local, equipo_visitante, [arbitro]
+  apostadores: username, nombre, apellido, correo, [password]
+Los equipos se referencian por nombre y el árbitro por su username. Sin password, la cuenta
+se crea con una contraseña inutilizable; las contraseñas se hashean en paralelo
+(mitorneo.aprovisionamiento).
+"""
+import csv
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import busqueda, mercados, paneles
+from .aprovisionamiento import Hasheador
+from .fuerzas import recalcular_fuerzas
+from .models import Arbitro, Equipo, Jugador, Partido, Usuario
+
+TAMANO_LOTE = 2000
+MAX_ERRORES_GUARDADOS = 1000
+
+COLUMNAS = {
+    'equipos': ('nombre',),
+    'jugadores': ('username', 'nombre', 'apellido', 'correo', 'equipo'),
+    'arbitros': ('username', 'nombre', 'apellido', 'correo'),
+    'partidos': ('fecha', 'equipo_local', 'equipo_visitante'),
+    'apostadores': ('username', 'nombre', 'apellido', 'correo'),
+}
+
+
+class ErrorFila(Exception):
+    pass
+
+
+class ResultadoImportacion:
+    def __init__(self, tipo):
+        self.tipo = tipo
+        self.filas = 0
+        self.creados = 0
+        self.errores = []
+        self.total_errores = 0
+        self.equipos_modificados = set()
+        self.hasheador = None
+
+    def error(self, linea, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < MAX_ERRORES_GUARDADOS:
+            self.errores.append((linea, mensaje))
+
+    def como_dict(self):
+        return {
+            'tipo': self.tipo,
+            'filas': self.filas,
+            'creados': self.creados,
+            'errores': self.total_errores,
+            'detalle_errores': [{'linea': linea, 'error': mensaje} for linea, mensaje in self.errores],
+        }
+
+
+def _texto(fila, columna):
+    return (fila.get(columna) or '').strip()
+
+
+def _entero(fila, columna, defecto=None, minimo=None, maximo=None):
+    valor = _texto(fila, columna)
+    if not valor:
+        return defecto
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ErrorFila(f'{columna} debe ser un número entero')
+    if (minimo is not None and numero < minimo) or (maximo is not None and numero > maximo):
+        raise ErrorFila(f'{columna} fuera de rango')
+    return numero
+
+
+def _equipos_por_nombre(nombres):
+    """nombre -> id, o None si hay varios equipos con ese nombre (Equipo.nombre no es único)."""
+    ids = {}
+    for equipo_id, nombre in Equipo.objects.filter(nombre__in=nombres).values_list('id', 'nombre'):
+        ids[nombre] = None if nombre in ids else equipo_id
+    return ids
+
+
+def _equipo(equipos, nombre):
+    if nombre not in equipos:
+        raise ErrorFila(f'el equipo "{nombre}" no existe')
+    if equipos[nombre] is None:
+        raise ErrorFila(f'hay varios equipos llamados "{nombre}"')
+    return equipos[nombre]
+
+
+def _importar_equipos(lote, resultado, vistos):
+    existentes = _equipos_por_nombre({_texto(f, 'nombre') for _, f in lote})
+    nuevos = []
+    for linea, fila in lote:
+        nombre = _texto(fila, 'nombre')
+        if not nombre:
+            resultado.error(linea, 'nombre vacío')
+        elif len(nombre) > Equipo._meta.get_field('nombre').max_length:
+            resultado.error(linea, 'nombre demasiado largo')
+        elif nombre in existentes or nombre in vistos:
+            resultado.error(linea, f'el equipo "{nombre}" ya existe')
+        else:
+            vistos.add(nombre)
+            nuevos.append(Equipo(nombre=nombre))
+    Equipo.objects.bulk_create(nuevos)
+    return len(nuevos)
+
+
+def _error_longitud(fila, modelo):
+    # bulk_create no valida: un valor demasiado largo abortaría la transacción en PostgreSQL
+    nombre, apellido = ('first_name', 'last_name') if modelo is Usuario else ('nombre', 'apellido')
+    for columna, campo in (('username', Usuario._meta.get_field('username')),
+                           ('nombre', modelo._meta.get_field(nombre)),
+                           ('apellido', modelo._meta.get_field(apellido))):
+        if len(_texto(fila, columna)) > campo.max_length:
+            return f'{columna} supera {campo.max_length} caracteres'
+    return None
+
+
+def _error_correo(correo):
+    try:
+        validate_email(correo)
+    except ValidationError:
+        return f'correo no válido: "{correo}"'
+    return None
+
+
+def _validar_cuentas(lote, resultado, vistos, modelo):
+    """Comprueba username y correo (únicos) de las filas; devuelve las filas válidas."""
+    usernames = {_texto(f, 'username') for _, f in lote}
+    correos = {_texto(f, 'correo') for _, f in lote} - {''}
+    usados = set(Usuario.objects.in_bulk(usernames, field_name='username'))
+    campo_correo = 'email' if modelo is Usuario else 'correo'
+    correos_usados = set(modelo.objects.filter(**{f'{campo_correo}__in': correos}).values_list(campo_correo, flat=True))
+    validas = []
+    for linea, fila in lote:
+        faltantes = [c for c in COLUMNAS[resultado.tipo] if c != 'equipo' and not _texto(fila, c)]
+        username, correo = _texto(fila, 'username'), _texto(fila, 'correo')
+        if faltantes:
+            resultado.error(linea, f'faltan columnas obligatorias: {", ".join(faltantes)}')
+        elif error := _error_longitud(fila, modelo) or _error_correo(correo):
+            resultado.error(linea, error)
+        elif username in usados or username in vistos['usernames']:
+            resultado.error(linea, f'el usuario "{username}" ya existe')
+        elif correo in correos_usados or correo in vistos['correos']:
+            resultado.error(linea, f'el correo "{correo}" ya está registrado')
+        else:
+            vistos['usernames'].add(username)
+            vistos['correos'].add(correo)
+            validas.append((linea, fila))
+    return validas
+
+
+def _crear_usuarios(filas, rol, hasheador):
+    passwords = hasheador.hashear([_texto(f, 'password') for _, f in filas])
+    usuarios = [
+        Usuario(
+            username=_texto(fila, 'username'),
+            email=_texto(fila, 'correo'),
+            first_name=_texto(fila, 'nombre'),
+            last_name=_texto(fila, 'apellido'),
+            rol=rol,
+            password=password,
+        )
+        for (_, fila), password in zip(filas, passwords)
+    ]
+    return Usuario.objects.bulk_create(usuarios)
+
+
+def _importar_jugadores(lote, resultado, vistos):
+    equipos = _equipos_por_nombre({_texto(f, 'equipo') for _, f in lote})
+    validas = []
+    for linea, fila in _validar_cuentas(lote, resultado, vistos, Jugador):
+        try:
+            datos = {
+                'equipo_id': _equipo(equipos, _texto(fila, 'equipo')) if _texto(fila, 'equipo') else None,
+                'nivel': _entero(fila, 'nivel', 1, 1, 10),
+                'numero_camiseta': _entero(fila, 'numero_camiseta', None, 0, 99),
+                'posicion': _texto(fila, 'posicion') or None,
+            }
+            if datos['posicion'] and len(datos['posicion']) > Jugador._meta.get_field('posicion').max_length:
+                raise ErrorFila('posicion demasiado larga')
+        except ErrorFila as e:
+            vistos['usernames'].discard(_texto(fila, 'username'))
+            vistos['correos'].discard(_texto(fila, 'correo'))
+            resultado.error(linea, str(e))
+            continue
+        validas.append((linea, fila, datos))
+
+    usuarios = _crear_usuarios([(linea, fila) for linea, fila, _ in validas], 'jugador', resultado.hasheador)
+    Jugador.objects.bulk_create([
+        Jugador(usuario=usuario, nombre=_texto(fila, 'nombre'), apellido=_texto(fila, 'apellido'),
+                correo=_texto(fila, 'correo'), **datos)
+        for (_, fila, datos), usuario in zip(validas, usuarios)
+    ])
+    resultado.equipos_modificados.update(d['equipo_id'] for _, _, d in validas if d['equipo_id'])
+    return len(validas)
+
+
+def _importar_arbitros(lote, resultado, vistos):
+    validas = _validar_cuentas(lote, resultado, vistos, Arbitro)
+    usuarios = _crear_usuarios(validas, 'arbitro', resultado.hasheador)
+    Arbitro.objects.bulk_create([
+        Arbitro(usuario=usuario, nombre=_texto(fila, 'nombre'), apellido=_texto(fila, 'apellido'),
+                correo=_texto(fila, 'correo'))
+        for (_, fila), usuario in zip(validas, usuarios)
+    ])
+    return len(validas)
+
+
+def _importar_partidos(lote, resultado, vistos):
+    equipos = _equipos_por_nombre(
+        {_texto(f, 'equipo_local') for _, f in lote} | {_texto(f, 'equipo_visitante') for _, f in lote}
+    )
+    arbitros = dict(
+        Arbitro.objects.filter(usuario__username__in={_texto(f, 'arbitro') for _, f in lote})
+        .values_list('usuario__username', 'id')
+    )
+    nuevos = []
+    for linea, fila in lote:
+        try:
+            faltantes = [c for c in COLUMNAS['partidos'] if not _texto(fila, c)]
+            if faltantes:
+                raise ErrorFila(f'faltan columnas obligatorias: {", ".join(faltantes)}')
+            fecha = parse_datetime(_texto(fila, 'fecha'))
+            if fecha is None:
+                raise ErrorFila('fecha no válida (formato AAAA-MM-DD HH:MM)')
+            if timezone.is_naive(fecha):
+                fecha = timezone.make_aware(fecha)
+            local = _equipo(equipos, _texto(fila, 'equipo_local'))
+            visitante = _equipo(equipos, _texto(fila, 'equipo_visitante'))
+            if local == visitante:
+                raise ErrorFila('el equipo local y el visitante son el mismo')
+            arbitro = _texto(fila, 'arbitro')
+            if arbitro and arbitro not in arbitros:
+                raise ErrorFila(f'el árbitro "{arbitro}" no existe')
+        except ErrorFila as e:
+            resultado.error(linea, str(e))
+            continue
+        nuevos.append(Partido(fecha=fecha, equipo_local_id=local, equipo_visitante_id=visitante,
+                              arbitro_id=arbitros.get(arbitro)))
+    Partido.objects.bulk_create(nuevos)
+    return len(nuevos)
+
+
+def _importar_apostadores(lote, resultado, vistos):
+    validas = _validar_cuentas(lote, resultado, vistos, Usuario)
+    _crear_usuarios(validas, 'apostador', resultado.hasheador)
+    return len(validas)
+
+
+IMPORTADORES = {
+    'equipos': _importar_equipos,
+    'jugadores': _importar_jugadores,
+    'arbitros': _importar_arbitros,
+    'partidos': _importar_partidos,
+    'apostadores': _importar_apostadores,
+}
+
+
+def importar_filas(tipo, filas, tamano_lote=TAMANO_LOTE, simular=False, progreso=None, procesos=None):
+    """
+    Importa `filas`, un iterable de (número de línea, dict columna -> valor), de tipo `tipo`.
+    `progreso(resultado)` se llama tras cada lote.
+    """
+    if tipo not in IMPORTADORES:
+        raise ValueError(f'Tipo no válido: {tipo} ({", ".join(IMPORTADORES)})')
+    resultado = ResultadoImportacion(tipo)
+    vistos = set() if tipo == 'equipos' else {'usernames': set(), 'correos': set()}
+    with Hasheador(procesos) as resultado.hasheador, transaction.atomic():
+        lote = []
+        for fila in filas:
+            lote.append(fila)
+            if len(lote) >= tamano_lote:
+                _procesar_lote(tipo, lote, resultado, vistos, progreso)
+                lote = []
+        if lote:
+            _procesar_lote(tipo, lote, resultado, vistos, progreso)
+        # bulk_create no dispara las señales que mantienen FuerzaEquipo
+        if resultado.equipos_modificados:
+            recalcular_fuerzas(resultado.equipos_modificados)
+        if tipo == 'partidos' and resultado.creados:
+            paneles.invalidar_todo()
+            mercados.invalidar()
+        if tipo == 'jugadores' and resultado.creados:
+            transaction.on_commit(busqueda.invalidar)
+        if simular:
+            transaction.set_rollback(True)
+    resultado.hasheador = None
+    return resultado
+
+
+def _procesar_lote(tipo, lote, resultado, vistos, progreso):
+    resultado.filas += len(lote)
+    resultado.creados += IMPORTADORES[tipo](lote, resultado, vistos)
+    if progreso:
+        progreso(resultado)
+
+
+def importar_csv(tipo, archivo, tamano_lote=TAMANO_LOTE, simular=False, delimitador=',', progreso=None,
+                 procesos=None):
+    """Importa el CSV `archivo` (objeto de texto abierto, con cabecera) de tipo `tipo`."""
+    if tipo not in IMPORTADORES:
+        raise ValueError(f'Tipo no válido: {tipo} ({", ".join(IMPORTADORES)})')
+    lector = csv.DictReader(archivo, delimiter=delimitador)
+    cabecera = [c.strip() for c in (lector.fieldnames or [])]
+    faltantes = [c for c in COLUMNAS[tipo] if c not in cabecera]
+    if faltantes:
+        raise ValueError(f'Faltan columnas en la cabecera: {", ".join(faltantes)}')
+    lector.fieldnames = cabecera
+    # La línea 1 es la cabecera
+    return importar_filas(tipo, enumerate(lector, start=2), tamano_lote, simular, progreso, procesos)
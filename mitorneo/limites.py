@@ -0,0 +1,181 @@
+"""
+Limitación de peticiones y descarte de carga en las APIs de escritura.
+
+El decorador @limites.limitar('grupo') aplica dos defensas a los métodos que escriben:
+
+- Token bucket por usuario y por IP en la caché compartida. Cada cubo admite ráfagas de
+  `capacidad` peticiones y se rellena a `tasa` fichas por segundo (LIMITES_USUARIO, LIMITES_IP).
+  Sin fichas se responde 429 con Retry-After, los segundos hasta la siguiente ficha. Una
+  petición toma ficha de los dos cubos o de ninguno: un usuario que agota su cubo no gasta el
+  de su IP, que comparten todos los que están detrás del mismo NAT. Con Redis la lectura y
+  escritura de los cubos es un script Lua atómico; con otras cachés se hace bajo un cerrojo del
+  proceso (exacto con LocMem, que ya es por proceso).
+- Límite de concurrencia: si ya hay LIMITES_CONCURRENCIA peticiones limitadas en curso en este
+  proceso, la siguiente recibe 503 con Retry-After al momento, en vez de encolarse detrás de las
+  demás en la base de datos y alargar la latencia de todas. Se comprueba antes que los cubos,
+  así que un 503 no gasta fichas. Es por proceso a propósito: un contador compartido perdería
+  plazas cada vez que un worker muere a mitad de petición.
+"""
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.http import JsonResponse
+
+from . import metricas
+
+METODOS_LECTURA = ('GET', 'HEAD', 'OPTIONS')
+
+# KEYS: cubos; ARGV: ahora y, por cubo, capacidad, tasa y segundos de vida. Devuelve
+# {posición (desde 1) del primer cubo sin fichas o 0, sus fichas}
+SCRIPT_REDIS = """
+local ahora = tonumber(ARGV[1])
+local fichas = {}
+local rechazo = 0
+for i, clave in ipairs(KEYS) do
+    local capacidad = tonumber(ARGV[3 * i - 1])
+    local tasa = tonumber(ARGV[3 * i])
+    local estado = redis.call('HMGET', clave, 'f', 't')
+    local previas = tonumber(estado[1]) or capacidad
+    local anterior = tonumber(estado[2]) or ahora
+    fichas[i] = math.min(capacidad, previas + math.max(0, ahora - anterior) * tasa)
+    if rechazo == 0 and fichas[i] < 1 then
+        rechazo = i
+    end
+end
+for i, clave in ipairs(KEYS) do
+    local quedan = fichas[i]
+    if rechazo == 0 then
+        quedan = quedan - 1
+    end
+    redis.call('HSET', clave, 'f', tostring(quedan), 't', tostring(ahora))
+    redis.call('EXPIRE', clave, tonumber(ARGV[3 * i + 1]))
+end
+if rechazo == 0 then
+    return {0, '0'}
+end
+return {rechazo, tostring(fichas[rechazo])}
+"""
+
+_cerrojo = threading.Lock()
+
+
+def _vida(capacidad, tasa):
+    # Pasado el tiempo de rellenar el cubo entero, uno nuevo es equivalente
+    return math.ceil(capacidad / tasa) + 1
+
+
+def _tomar_redis(cubos, ahora):
+    backend = caches['default']
+    claves = [backend.make_and_validate_key(clave) for clave, _, _ in cubos]
+    argumentos = [ahora]
+    for _, capacidad, tasa in cubos:
+        argumentos.extend((capacidad, tasa, _vida(capacidad, tasa)))
+    # Todas las claves en el mismo servidor: el script las necesita juntas
+    cliente = backend._cache.get_client(claves[0], write=True)
+    rechazo, fichas = cliente.eval(SCRIPT_REDIS, len(claves), *claves, *argumentos)
+    return (int(rechazo) - 1 if int(rechazo) else None), float(fichas)
+
+
+def _tomar_local(cubos, ahora):
+    with _cerrojo:
+        estados = cache.get_many([clave for clave, _, _ in cubos])
+        fichas = []
+        for clave, capacidad, tasa in cubos:
+            previas, anterior = estados.get(clave) or (capacidad, ahora)
+            fichas.append(min(capacidad, previas + max(0.0, ahora - anterior) * tasa))
+        rechazo = next((i for i, f in enumerate(fichas) if f < 1), None)
+        for (clave, capacidad, tasa), f in zip(cubos, fichas):
+            cache.set(clave, (f - 1 if rechazo is None else f, ahora), _vida(capacidad, tasa))
+    return rechazo, (fichas[rechazo] if rechazo is not None else 0.0)
+
+
+def tomar_fichas(cubos):
+    """
+    Consume una ficha de cada cubo (clave, capacidad, tasa) solo si todos tienen alguna.
+    Devuelve (None, 0) si se pudo o (posición del primer cubo sin fichas, segundos hasta su
+    siguiente ficha).
+    """
+    ahora = time.time()
+    # `cache` es un proxy: el tipo del backend está en caches['default']
+    tomar = _tomar_redis if isinstance(caches['default'], RedisCache) else _tomar_local
+    rechazo, fichas = tomar(cubos, ahora)
+    if rechazo is None:
+        return None, 0
+    return rechazo, max(1, math.ceil((1 - fichas) / cubos[rechazo][2]))
+
+
+def tomar_ficha(clave, capacidad, tasa):
+    """Consume una ficha del cubo `clave`. Devuelve 0 si se pudo o los segundos hasta la siguiente."""
+    return tomar_fichas([(clave, capacidad, tasa)])[1]
+
+
+def ip_cliente(request):
+    cabecera = getattr(settings, 'LIMITES_CABECERA_IP', None)
+    if cabecera and request.META.get(cabecera):
+        # La última entrada de X-Forwarded-For es la que añadió nuestro proxy
+        return request.META[cabecera].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class LimiteConcurrencia:
+    def __init__(self):
+        self._cerrojo = threading.Lock()
+        self.en_curso = 0
+
+    def entrar(self, maximo):
+        with self._cerrojo:
+            if self.en_curso >= maximo:
+                return False
+            self.en_curso += 1
+            return True
+
+    def salir(self):
+        with self._cerrojo:
+            self.en_curso -= 1
+
+
+concurrencia = LimiteConcurrencia()
+
+
+def _rechazo(estado, espera, grupo, motivo):
+    metricas.incrementar('playliga_peticiones_limitadas_total', grupo=grupo, motivo=motivo)
+    mensaje = 'Demasiadas peticiones; inténtalo más tarde.' if estado == 429 else 'Servicio saturado; inténtalo más tarde.'
+    response = JsonResponse({'error': mensaje, 'reintentar_en': espera}, status=estado)
+    response['Retry-After'] = str(espera)
+    return response
+
+
+def limitar(grupo):
+    """
+    Decorador de vista para los métodos que escriben. Debe ir debajo de login_required, para
+    que el cubo por usuario sepa quién pide.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if request.method in METODOS_LECTURA or not getattr(settings, 'LIMITES_ACTIVOS', True):
+                return vista(request, *args, **kwargs)
+
+            # La plaza antes que las fichas: un 503 no gasta el cubo de nadie
+            if not concurrencia.entrar(getattr(settings, 'LIMITES_CONCURRENCIA', 8)):
+                return _rechazo(503, 1, grupo, 'concurrencia')
+            try:
+                ambitos = [('ip', ip_cliente(request), getattr(settings, 'LIMITES_IP', (60, 20.0)))]
+                if request.user.is_authenticated:
+                    ambitos.append(('usuario', request.user.pk, getattr(settings, 'LIMITES_USUARIO', (10, 2.0))))
+                rechazo, espera = tomar_fichas([
+                    (f'limite:{grupo}:{ambito}:{ident}', capacidad, tasa)
+                    for ambito, ident, (capacidad, tasa) in ambitos
+                ])
+                if rechazo is not None:
+                    return _rechazo(429, espera, grupo, ambitos[rechazo][0])
+                return vista(request, *args, **kwargs)
+            finally:
+                concurrencia.salir()
+        return envoltura
+    return decorador
@@ -0,0 +1,343 @@
+import io
+import json
+import math
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from mitorneo import urls as torneo_urls
+from mitorneo.models import Usuario, Equipo, Jugador, Arbitro, Partido, Trabajo
+
+# Parámetros de seed_liga para cada escala del benchmark
+ESCALAS = {
+    'pequena': {'equipos': 10, 'jugadores_por_equipo': 18, 'arbitros': 5, 'partidos': 90,
+                'apostadores': 100, 'recargas': 300, 'apuestas': 5000},
+    'mediana': {'equipos': 20, 'jugadores_por_equipo': 22, 'arbitros': 10, 'partidos': 380,
+                'apostadores': 1000, 'recargas': 5000, 'apuestas': 100000},
+    'grande': {'equipos': 40, 'jugadores_por_equipo': 30, 'arbitros': 20, 'partidos': 1560,
+               'apostadores': 10000, 'recargas': 40000, 'apuestas': 1000000},
+}
+
+
+def _percentil(valores, porcentaje):
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(porcentaje / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+class ContadorConsultas:
+    """execute_wrapper que cuenta consultas sin el límite de connection.queries."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+def escenarios(ctx):
+    """
+    Una petición representativa por cada URL de mitorneo/urls.py.
+    Cada escenario es (nombre, url_name, método, rol, kwargs de la URL, datos).
+    """
+    futuro = ctx['partido_futuro']
+    jugado = ctx['partido_simulado']
+    equipo = ctx['equipo']
+    return [
+        ('home', 'home', 'get', None, {}, None),
+        ('login', 'login', 'get', None, {}, None),
+        ('get_csrf_token', 'get_csrf_token', 'get', None, {}, None),
+        ('logout', 'logout', 'get', 'apostador', {}, None),
+        ('registro_jugador', 'registro_jugador', 'get', None, {}, None),
+        ('registro_arbitro', 'registro_arbitro', 'get', None, {}, None),
+        ('registro_apostador', 'registro_apostador', 'get', None, {}, None),
+        ('panel_admin', 'panel_admin', 'get', 'admin', {}, None),
+        ('panel_jugador', 'panel_jugador', 'get', 'jugador', {}, None),
+        ('panel_arbitro', 'panel_arbitro', 'get', 'arbitro', {}, None),
+        ('resultado_partido', 'resultado_partido', 'get', 'admin', {'partido_id': futuro.id}, None),
+        ('api_equipos', 'api_equipos', 'get', None, {}, None),
+        ('api_arbitros', 'api_arbitros', 'get', None, {}, None),
+        ('api_jugadores', 'api_jugadores', 'get', None, {}, None),
+        ('api_buscar_jugadores', 'api_buscar_jugadores', 'get', 'admin', {}, {'q': 'garsia', 'limite': 20}),
+        ('api_goleadores', 'api_goleadores', 'get', None, {}, None),
+        ('api_asistentes', 'api_asistentes', 'get', None, {}, {'limite': 100, 'despues': '1_0'}),
+        ('api_partidos', 'api_partidos', 'get', None, {}, None),
+        ('api_agregar_equipo', 'api_agregar_equipo', 'post', 'admin', {}, {'nombre': 'Equipo Benchmark'}),
+        ('api_crear_partido', 'api_crear_partido', 'post', 'admin', {}, {
+            'equipo_local_id': futuro.equipo_local_id,
+            'equipo_visitante_id': futuro.equipo_visitante_id,
+            'arbitro_id': ctx['arbitro'].id,
+            'fecha': futuro.fecha.isoformat(),
+        }),
+        ('api_asignar_jugador', 'api_asignar_jugador', 'post', 'admin', {}, {
+            'jugador_id': ctx['jugador'].id, 'equipo_id': equipo.id, 'posicion': ctx['jugador'].posicion,
+        }),
+        ('api_bfs_graph', 'api_bfs_graph', 'get', None, {}, None),
+        ('api_simular_partido', 'api_simular_partido', 'post', 'admin', {'partido_id': jugado.id}, None),
+        ('api_trabajo', 'api_trabajo', 'get', 'admin', {'trabajo_id': ctx['trabajo'].id}, None),
+        ('api_eventos_partido', 'api_eventos_partido', 'get', 'arbitro', {'partido_id': jugado.id}, None),
+        ('api_equipo_detail', 'api_equipo_detail', 'put', 'admin', {'equipo_id': equipo.id}, {'nombre': equipo.nombre}),
+        ('api_fuerza_equipo', 'api_fuerza_equipo', 'get', None, {'equipo_id': equipo.id}, None),
+        ('api_alineacion_optima', 'api_alineacion_optima', 'get', None, {'equipo_id': equipo.id}, None),
+        ('api_enumerar_alineaciones', 'api_enumerar_alineaciones', 'get', None, {'equipo_id': equipo.id},
+         {'tipo': 'permutaciones', 'pagina': 1000000, 'orden': 'fuerza'}),
+        ('api_partido_detail', 'api_partido_detail', 'put', 'admin', {'partido_id': futuro.id},
+         {'fecha': futuro.fecha.isoformat()}),
+        ('apuestas_page', 'apuestas_page', 'get', 'apostador', {}, None),
+        ('api_apuestas GET', 'api_apuestas', 'get', 'apostador', {}, None),
+        ('api_apuestas POST', 'api_apuestas', 'post', 'apostador', {}, {
+            'partido_id': futuro.id, 'equipo_id': futuro.equipo_local_id, 'monto': 1,
+        }),
+        ('api_recargar_saldo', 'api_recargar_saldo', 'post', 'apostador', {}, {'monto': 10, 'metodo_pago': 'tarjeta'}),
+        ('api_saldo', 'api_saldo', 'get', 'apostador', {}, None),
+        ('admin_asignar_jugador_page', 'admin_asignar_jugador_page', 'get', 'admin', {}, None),
+        ('admin_ganadores_apuestas', 'admin_ganadores_apuestas', 'get', 'admin', {}, None),
+        ('admin_importar', 'admin_importar', 'get', 'admin', {}, None),
+        ('api_aprovisionar', 'api_aprovisionar', 'post', 'admin', {}, {
+            # Con password, para medir también el hash en paralelo
+            'rol': 'apostadores',
+            'cuentas': [
+                {'username': f'bench_{i}', 'nombre': 'Bench', 'apellido': str(i),
+                 'correo': f'bench_{i}@example.com', 'password': f'clave-bench-{i}'}
+                for i in range(4)
+            ],
+        }),
+        ('admin_perfiles', 'admin_perfiles', 'get', 'admin', {}, None),
+        ('admin_perfil_archivo', 'admin_perfil_archivo', 'get', 'admin', {'nombre': ctx['perfil']}, None),
+        ('api_exportar', 'api_exportar', 'get', 'admin', {'tipo': 'apuestas'}, {'formato': 'csv'}),
+        ('api_consultas_lentas', 'api_consultas_lentas', 'get', 'admin', {}, None),
+        ('permutaciones_combinaciones_page', 'permutaciones_combinaciones_page', 'get', 'admin', {}, None),
+        ('api_estadisticas_equipo', 'api_estadisticas_equipo', 'get', None, {}, {'equipo_id': equipo.id}),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide latencia (p50/p95), número de consultas SQL y pico de memoria de cada URL de mitorneo '
+        'con el cliente de pruebas de Django y escribe un informe JSON comparable entre commits.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escalas', nargs='+', choices=list(ESCALAS), default=['pequena'])
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--calentamiento', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--salida', default='benchmark.json', help='Ruta del informe JSON.')
+        parser.add_argument('--bd-actual', action='store_true',
+                            help='Usa los datos de la base de datos configurada en lugar de una base de pruebas sembrada.')
+        parser.add_argument('--solo', nargs='+', help='Nombres de escenario a medir (por defecto todos).')
+        parser.add_argument('--comparar', help='Informe JSON anterior contra el que detectar regresiones.')
+        parser.add_argument('--umbral', type=float, default=0.2,
+                            help='Aumento relativo del p95 considerado regresión (0.2 = 20%%).')
+        parser.add_argument('--umbral-ms', type=float, default=1.0,
+                            help='Diferencias de p95 menores que esto se consideran ruido.')
+        parser.add_argument('--fallar-si-regresion', action='store_true')
+
+    def handle(self, *args, **opciones):
+        informe = {
+            'generado': timezone.now().isoformat(),
+            'commit': self._commit_actual(),
+            'base_datos': connection.vendor,
+            'repeticiones': opciones['repeticiones'],
+            'escalas': {},
+        }
+
+        setup_test_environment()
+        # Se mide el coste de cada vista repitiéndola; los límites por usuario la cortarían con 429.
+        # Los perfiles van a un directorio temporal para no rotar los del proyecto, y sin retraso
+        # las exportaciones incluyen los datos recién sembrados.
+        perfiles = tempfile.TemporaryDirectory()
+        limites = override_settings(LIMITES_ACTIVOS=False, PERFILADO_DIR=perfiles.name, EXPORTACION_RETRASO=0)
+        limites.enable()
+        try:
+            if opciones['bd_actual']:
+                informe['escalas']['bd_actual'] = self._medir_escala(opciones)
+            else:
+                for escala in opciones['escalas']:
+                    informe['escalas'][escala] = self._medir_en_bd_de_pruebas(escala, opciones)
+        finally:
+            limites.disable()
+            perfiles.cleanup()
+            teardown_test_environment()
+
+        with open(opciones['salida'], 'w', encoding='utf-8') as archivo:
+            json.dump(informe, archivo, indent=2, sort_keys=True, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'Informe escrito en {opciones["salida"]}'))
+
+        if opciones['comparar']:
+            regresiones = self._comparar(informe, opciones['comparar'], opciones['umbral'], opciones['umbral_ms'])
+            if regresiones and opciones['fallar_si_regresion']:
+                raise CommandError(f'{len(regresiones)} regresiones de rendimiento detectadas.')
+
+    def _medir_en_bd_de_pruebas(self, escala, opciones):
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f'Sembrando escala "{escala}"...')
+            inicio = time.monotonic()
+            call_command('seed_liga', seed=opciones['seed'], stdout=io.StringIO(), **ESCALAS[escala])
+            self.stdout.write(f'  datos generados en {time.monotonic() - inicio:.1f}s')
+            resultado = self._medir_escala(opciones)
+            resultado['parametros'] = ESCALAS[escala]
+            return resultado
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+    def _medir_escala(self, opciones):
+        # Todo lo que escribe el benchmark (usuario admin, sesiones, el perfil y el trabajo de
+        # ejemplo) se deshace al terminar, también con --bd-actual. Dentro de la transacción
+        # exterior los on_commit no se ejecutan, así que tampoco llega nada al hilo de auditoría.
+        with transaction.atomic():
+            resultado = self._medir_escala_en_transaccion(opciones)
+            transaction.set_rollback(True)
+        return resultado
+
+    def _medir_escala_en_transaccion(self, opciones):
+        ctx = self._contexto()
+        clientes = {rol: Client(raise_request_exception=False) for rol in ('admin', 'jugador', 'arbitro', 'apostador')}
+        for rol, cliente in clientes.items():
+            cliente.force_login(ctx['usuarios'][rol])
+        clientes[None] = Client(raise_request_exception=False)
+        # Un perfil real que admin_perfil_archivo pueda servir
+        ctx['perfil'] = clientes['admin'].get(reverse('api_equipos'), HTTP_X_PERFILAR='1')['X-Perfil']
+
+        # Un trabajo ya terminado que api_trabajo pueda consultar
+        ctx['trabajo'] = Trabajo.objects.create(
+            tipo='simular_partido', argumentos={'partido_id': ctx['partido_simulado'].id}, estado='completado',
+            intentos=1, iniciado=timezone.now(), terminado=timezone.now(), resultado={'success': True},
+        )
+
+        endpoints = {}
+        cubiertos = set()
+        for nombre, url_name, metodo, rol, kwargs, datos in escenarios(ctx):
+            cubiertos.add(url_name)
+            if opciones['solo'] and nombre not in opciones['solo']:
+                continue
+            url = reverse(url_name, kwargs=kwargs)
+            endpoints[nombre] = self._medir(clientes[rol], ctx['usuarios'].get(rol), metodo, url, datos, opciones)
+            self.stdout.write(
+                f'  {nombre:<36} p50 {endpoints[nombre]["p50_ms"]:>8.2f} ms  '
+                f'p95 {endpoints[nombre]["p95_ms"]:>8.2f} ms  {endpoints[nombre]["consultas"]:>5} consultas'
+            )
+
+        # Las URLs nuevas sin escenario quedan registradas para que no pasen desapercibidas
+        sin_escenario = sorted(p.name for p in torneo_urls.urlpatterns if p.name not in cubiertos)
+        for url_name in sin_escenario:
+            self.stdout.write(self.style.WARNING(f'  {url_name}: sin escenario de benchmark'))
+        return {'endpoints': endpoints, 'sin_escenario': sin_escenario}
+
+    def _contexto(self):
+        admin, _ = Usuario.objects.get_or_create(username='seed_admin_benchmark', defaults={'rol': 'admin'})
+        jugador = Jugador.objects.select_related('usuario').filter(equipo__isnull=False).first()
+        arbitro = Arbitro.objects.select_related('usuario').first()
+        apostador = Usuario.objects.filter(rol='apostador').order_by('-saldo_real').first()
+        partido_futuro = Partido.objects.filter(simulado=False, fecha__gt=timezone.now()).order_by('fecha').first()
+        partido_simulado = Partido.objects.filter(simulado=True).first()
+        if not all([jugador, arbitro, apostador, partido_futuro, partido_simulado]):
+            raise CommandError('La base de datos no tiene datos suficientes; ejecute primero seed_liga.')
+        return {
+            'usuarios': {'admin': admin, 'jugador': jugador.usuario, 'arbitro': arbitro.usuario, 'apostador': apostador},
+            'jugador': jugador,
+            'arbitro': arbitro,
+            'equipo': Equipo.objects.get(id=jugador.equipo_id),
+            'partido_futuro': partido_futuro,
+            'partido_simulado': partido_simulado,
+        }
+
+    def _peticion(self, cliente, metodo, url, datos):
+        if metodo == 'get':
+            return cliente.get(url, datos or {})
+        return getattr(cliente, metodo)(url, json.dumps(datos or {}), content_type='application/json')
+
+    def _medir(self, cliente, usuario, metodo, url, datos, opciones):
+        tiempos = []
+        consultas = []
+        estados = set()
+
+        def ejecutar():
+            # logout cierra la sesión del cliente; se vuelve a abrir fuera de la medición
+            if usuario is not None and '_auth_user_id' not in cliente.session:
+                cliente.force_login(usuario)
+            # Las escrituras se deshacen para que todas las repeticiones vean los mismos datos
+            with transaction.atomic():
+                contador = ContadorConsultas()
+                with connection.execute_wrapper(contador):
+                    inicio = time.perf_counter()
+                    respuesta = self._peticion(cliente, metodo, url, datos)
+                    if respuesta.streaming:
+                        # Exportaciones y descargas generan el cuerpo (y sus consultas) al leerlo;
+                        # al terminar, el cliente de pruebas cierra la respuesta
+                        for _ in respuesta.streaming_content:
+                            pass
+                    duracion = time.perf_counter() - inicio
+                transaction.set_rollback(True)
+            return respuesta, duracion, contador.total
+
+        for _ in range(opciones['calentamiento']):
+            ejecutar()
+        for _ in range(opciones['repeticiones']):
+            respuesta, duracion, num_consultas = ejecutar()
+            tiempos.append(duracion * 1000)
+            consultas.append(num_consultas)
+            estados.add(respuesta.status_code)
+
+        # El pico de memoria se mide aparte porque tracemalloc distorsiona la latencia
+        tracemalloc.start()
+        try:
+            ejecutar()
+            pico = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'url': url,
+            'metodo': metodo.upper(),
+            'estados': sorted(estados),
+            'p50_ms': round(_percentil(tiempos, 50), 3),
+            'p95_ms': round(_percentil(tiempos, 95), 3),
+            'media_ms': round(statistics.fmean(tiempos), 3),
+            'max_ms': round(max(tiempos), 3),
+            'consultas': max(consultas),
+            'pico_memoria_kb': round(pico / 1024, 1),
+        }
+
+    def _comparar(self, informe, ruta_anterior, umbral, umbral_ms):
+        with open(ruta_anterior, encoding='utf-8') as archivo:
+            anterior = json.load(archivo)
+        regresiones = []
+        for escala, datos in informe['escalas'].items():
+            previos = anterior.get('escalas', {}).get(escala, {}).get('endpoints', {})
+            for nombre, actual in datos['endpoints'].items():
+                previo = previos.get(nombre)
+                if not previo:
+                    continue
+                aumento = actual['p95_ms'] - previo['p95_ms']
+                if aumento > umbral_ms and actual['p95_ms'] > previo['p95_ms'] * (1 + umbral):
+                    regresiones.append(f'{escala}/{nombre}: p95 {previo["p95_ms"]} -> {actual["p95_ms"]} ms')
+                if actual['consultas'] > previo['consultas']:
+                    regresiones.append(f'{escala}/{nombre}: consultas {previo["consultas"]} -> {actual["consultas"]}')
+        for regresion in regresiones:
+            self.stdout.write(self.style.ERROR(f'REGRESIÓN {regresion}'))
+        if not regresiones:
+            self.stdout.write(self.style.SUCCESS(f'Sin regresiones respecto a {ruta_anterior}'))
+        return regresiones
+
+    @staticmethod
+    def _commit_actual():
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
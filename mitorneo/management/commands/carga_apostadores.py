@@ -0,0 +1,417 @@
+import asyncio
+import json
+import random
+import ssl
+import time
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from urllib import parse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from mitorneo.models import Usuario, Apuesta, ClaveIdempotencia, RecargaSaldo
+
+# Cotas superiores (ms) de los cubos del histograma de latencias
+CUBOS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+
+def _percentil(valores, porcentaje):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[max(0, int(round(porcentaje / 100 * len(ordenados))) - 1)]
+
+
+class PoolConexiones:
+    """
+    Conexiones HTTP/1.1 keep-alive con asyncio, como mucho `maximo` abiertas a la vez: los
+    apostadores simulados son corrutinas que comparten el pool, no un hilo por apostador.
+    """
+
+    def __init__(self, base_url, maximo):
+        url = parse.urlsplit(base_url)
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise CommandError(f'URL no válida: {base_url}')
+        self.host = url.hostname
+        self.ssl = ssl.create_default_context() if url.scheme == 'https' else None
+        self.puerto = url.port or (443 if self.ssl else 80)
+        self.cabecera_host = url.netloc
+        self.prefijo = url.path.rstrip('/')
+        self._libres = []
+        self._plazas = asyncio.Semaphore(maximo)
+
+    async def peticion(self, metodo, ruta, cabeceras, cuerpo, timeout):
+        """
+        (estado, cabeceras, cuerpo). El timeout cuenta desde que se obtiene plaza: la espera por
+        una conexión libre del pool no es latencia del servidor.
+        """
+        async with self._plazas:
+            return await asyncio.wait_for(self._enviar(metodo, ruta, cabeceras, cuerpo), timeout)
+
+    async def _enviar(self, metodo, ruta, cabeceras, cuerpo):
+        reutilizada = bool(self._libres)
+        conexion = None
+        try:
+            conexion = self._libres.pop() if reutilizada else await self._abrir()
+            try:
+                estado, respuesta, datos, abierta = await self._intercambiar(conexion, metodo, ruta, cabeceras, cuerpo)
+            except asyncio.IncompleteReadError as e:
+                # El servidor cerró la conexión ociosa sin leer la petición: se repite en una nueva
+                if not (reutilizada and not e.partial):
+                    raise
+                conexion[1].close()
+                conexion = await self._abrir()
+                estado, respuesta, datos, abierta = await self._intercambiar(conexion, metodo, ruta, cabeceras, cuerpo)
+        except BaseException:
+            # Incluye la cancelación por timeout: la conexión queda a medias y no se reutiliza
+            if conexion is not None:
+                conexion[1].close()
+            raise
+        if abierta:
+            self._libres.append(conexion)
+        else:
+            conexion[1].close()
+        return estado, respuesta, datos
+
+    async def _abrir(self):
+        return await asyncio.open_connection(self.host, self.puerto, ssl=self.ssl)
+
+    async def _intercambiar(self, conexion, metodo, ruta, cabeceras, cuerpo):
+        lector, escritor = conexion
+        lineas = [f'{metodo} {self.prefijo}{ruta} HTTP/1.1', f'Host: {self.cabecera_host}',
+                  f'Content-Length: {len(cuerpo)}']
+        lineas.extend(f'{nombre}: {valor}' for nombre, valor in cabeceras.items())
+        escritor.write(('\r\n'.join(lineas) + '\r\n\r\n').encode('latin-1') + cuerpo)
+        await escritor.drain()
+
+        version, estado = (await lector.readuntil(b'\r\n')).decode('latin-1').split(maxsplit=2)[:2]
+        estado = int(estado)
+        respuesta = []
+        while (linea := await lector.readuntil(b'\r\n')) != b'\r\n':
+            nombre, _, valor = linea.decode('latin-1').partition(':')
+            respuesta.append((nombre.strip().lower(), valor.strip()))
+        valores = dict(respuesta)
+        abierta = version != 'HTTP/1.0' and valores.get('connection', '').lower() != 'close'
+
+        if metodo == 'HEAD' or estado in (204, 304) or 100 <= estado < 200:
+            datos = b''
+        elif 'chunked' in valores.get('transfer-encoding', '').lower():
+            partes = []
+            while tamano := int((await lector.readuntil(b'\r\n')).split(b';')[0], 16):
+                partes.append(await lector.readexactly(tamano))
+                await lector.readexactly(2)
+            while await lector.readuntil(b'\r\n') != b'\r\n':
+                pass
+            datos = b''.join(partes)
+        elif 'content-length' in valores:
+            datos = await lector.readexactly(int(valores['content-length']))
+        else:
+            datos, abierta = await lector.read(), False
+        return estado, respuesta, datos, abierta
+
+
+class SesionApostador:
+    """Un apostador con sus cookies de sesión, sobre el pool de conexiones compartido."""
+
+    def __init__(self, pool, usuario, timeout):
+        self.pool = pool
+        self.usuario = usuario
+        self.timeout = timeout
+        self.cookies = {}
+
+    async def peticion(self, metodo, ruta, datos=None, formulario=False, cabeceras=None):
+        """(estado, cuerpo); lanza TimeoutError si no hay respuesta en `timeout` segundos."""
+        cabeceras = {'Accept': 'application/json', **(cabeceras or {})}
+        cuerpo = b''
+        if 'csrftoken' in self.cookies:
+            cabeceras['X-CSRFToken'] = self.cookies['csrftoken']
+        if self.cookies:
+            cabeceras['Cookie'] = '; '.join(f'{nombre}={valor}' for nombre, valor in self.cookies.items())
+        if datos is not None:
+            if formulario:
+                cuerpo = parse.urlencode(datos).encode()
+                cabeceras['Content-Type'] = 'application/x-www-form-urlencoded'
+            else:
+                cuerpo = json.dumps(datos).encode()
+                cabeceras['Content-Type'] = 'application/json'
+        estado, respuesta, datos = await self.pool.peticion(metodo, ruta, cabeceras, cuerpo, self.timeout)
+        for nombre, valor in respuesta:
+            if nombre == 'set-cookie':
+                clave, _, valor = valor.split(';', 1)[0].partition('=')
+                valor = valor.strip().strip('"')
+                if valor:
+                    self.cookies[clave.strip()] = valor
+                else:
+                    # delete_cookie (p. ej. al cerrar sesión) la deja vacía y caducada
+                    self.cookies.pop(clave.strip(), None)
+        return estado, datos
+
+    async def iniciar_sesion(self, password):
+        try:
+            estado, _ = await self.peticion('GET', '/torneo/get_csrf_token/')
+            if estado != 200 or 'csrftoken' not in self.cookies:
+                return False
+            await self.peticion('POST', '/torneo/login/', {
+                'username': self.usuario.username,
+                'password': password,
+                'rol': 'apostador',
+                'csrfmiddlewaretoken': self.cookies['csrftoken'],
+            }, formulario=True)
+        except (OSError, EOFError, ValueError):
+            return False
+        return 'sessionid' in self.cookies
+
+
+class Command(BaseCommand):
+    help = (
+        'Generador de carga concurrente contra un servidor en marcha: inicia sesión con muchos apostadores '
+        'y mezcla apuestas, consultas de saldo y de partidos. Al terminar verifica que ningún saldo quedó '
+        'negativo y que las apuestas registradas cuadran con los saldos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='URL base del servidor.')
+        parser.add_argument('--usuarios', type=int, default=50, help='Apostadores concurrentes.')
+        parser.add_argument('--conexiones', type=int, default=20,
+                            help='Conexiones HTTP abiertas como mucho a la vez, compartidas por los apostadores.')
+        parser.add_argument('--duracion', type=float, default=30, help='Segundos de carga.')
+        parser.add_argument('--prefijo', default='seed_apostador_',
+                            help='Prefijo del username de los apostadores (los de seed_liga por defecto).')
+        parser.add_argument('--password', default='playliga123')
+        parser.add_argument('--mezcla', default='apuestas=0.2,saldo=0.5,partidos=0.3',
+                            help='Peso relativo de cada operación.')
+        parser.add_argument('--monto-max', type=int, default=5, help='Monto máximo de cada apuesta.')
+        parser.add_argument('--pausa', type=float, default=0.0,
+                            help='Pausa media (s) entre peticiones de un mismo apostador.')
+        parser.add_argument('--timeout', type=float, default=10.0)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--salida', help='Ruta opcional para guardar el informe en JSON.')
+
+    def handle(self, *args, **opciones):
+        mezcla = self._parsear_mezcla(opciones['mezcla'])
+        usuarios = list(
+            Usuario.objects.filter(rol='apostador', username__startswith=opciones['prefijo'])
+            .order_by('id')[:opciones['usuarios']]
+        )
+        if not usuarios:
+            raise CommandError(f'No hay apostadores con prefijo "{opciones["prefijo"]}"; ejecute seed_liga.')
+
+        ids = [u.id for u in usuarios]
+        saldos_iniciales = dict(Usuario.objects.filter(id__in=ids).values_list('id', 'saldo_real'))
+        ultima_apuesta = Apuesta.objects.aggregate(m=Max('id'))['m'] or 0
+        ultima_recarga = RecargaSaldo.objects.aggregate(m=Max('id'))['m'] or 0
+
+        resultados = asyncio.run(self._ejecutar(usuarios, mezcla, opciones))
+        informe = self._informe(resultados, opciones)
+        verificacion = self._verificar(ids, saldos_iniciales, ultima_apuesta, ultima_recarga, resultados,
+                                       opciones['timeout'])
+        informe['verificacion'] = verificacion
+
+        if opciones['salida']:
+            with open(opciones['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(informe, archivo, indent=2, ensure_ascii=False, default=str)
+        if verificacion['errores']:
+            raise CommandError('La verificación de saldos falló: ' + '; '.join(verificacion['errores'][:10]))
+        self.stdout.write(self.style.SUCCESS('Verificación de saldos correcta.'))
+
+    @staticmethod
+    def _parsear_mezcla(texto):
+        mezcla = {}
+        for parte in texto.split(','):
+            nombre, _, peso = parte.partition('=')
+            if nombre.strip() not in ('apuestas', 'saldo', 'partidos'):
+                raise CommandError(f'Operación desconocida en --mezcla: {nombre}')
+            mezcla[nombre.strip()] = float(peso)
+        return mezcla
+
+    async def _ejecutar(self, usuarios, mezcla, opciones):
+        pool = PoolConexiones(opciones['url'], max(1, opciones['conexiones']))
+        sesiones = [SesionApostador(pool, u, opciones['timeout']) for u in usuarios]
+
+        inicio_login = time.perf_counter()
+        logins = await asyncio.gather(*(s.iniciar_sesion(opciones['password']) for s in sesiones))
+        sesiones = [s for s, ok in zip(sesiones, logins) if ok]
+        self.stdout.write(f'{len(sesiones)}/{len(logins)} sesiones iniciadas en {time.perf_counter() - inicio_login:.1f}s')
+        if not sesiones:
+            raise CommandError('Ningún apostador pudo iniciar sesión; revise --url y --password.')
+
+        mercados = await self._mercados_abiertos(sesiones[0])
+        if not mercados and mezcla.get('apuestas'):
+            self.stdout.write(self.style.WARNING('No hay partidos abiertos; no se harán apuestas.'))
+            mezcla['apuestas'] = 0
+
+        resultados = {'muestras': defaultdict(list), 'estados': defaultdict(lambda: defaultdict(int)),
+                      'apuestas_ok': defaultdict(Decimal), 'desconocidas': defaultdict(list),
+                      'inicio': time.perf_counter()}
+        limite = resultados['inicio'] + opciones['duracion']
+        rng = random.Random(opciones['seed'])
+        await asyncio.gather(*(
+            self._bucle(sesion, mercados, mezcla, opciones, limite, random.Random(rng.random()), resultados)
+            for sesion in sesiones
+        ))
+        resultados['fin'] = time.perf_counter()
+        return resultados
+
+    @staticmethod
+    async def _mercados_abiertos(sesion):
+        _, cuerpo = await sesion.peticion('GET', '/torneo/api/equipos/')
+        ids_equipo = {e['nombre']: e['id'] for e in json.loads(cuerpo)}
+        _, cuerpo = await sesion.peticion('GET', '/torneo/api/partidos/')
+        ahora = timezone.now()
+        mercados = []
+        for p in json.loads(cuerpo):
+            fecha = parse_datetime(p['fecha']) if isinstance(p['fecha'], str) else p['fecha']
+            if p['simulado'] or not fecha or fecha <= ahora:
+                continue
+            equipos = [ids_equipo.get(p['equipo_local']), ids_equipo.get(p['equipo_visitante'])]
+            if all(equipos):
+                mercados.append((p['id'], equipos))
+        return mercados
+
+    async def _bucle(self, sesion, mercados, mezcla, opciones, limite, rng, resultados):
+        operaciones = list(mezcla)
+        pesos = [mezcla[o] for o in operaciones]
+        while time.perf_counter() < limite:
+            operacion = rng.choices(operaciones, pesos)[0]
+            cabeceras = None
+            if operacion == 'apuestas':
+                partido_id, equipos = rng.choice(mercados)
+                monto = rng.randint(1, opciones['monto_max'])
+                # Con la clave se sabe después, en la base de datos, si una apuesta sin respuesta se cobró
+                clave = f'carga-{uuid.uuid4()}'
+                cabeceras = {'Idempotency-Key': clave}
+                args = ('POST', '/torneo/api/apuestas/',
+                        {'partido_id': partido_id, 'equipo_id': rng.choice(equipos), 'monto': monto})
+            elif operacion == 'saldo':
+                args = ('GET', '/torneo/api/saldo/')
+            else:
+                args = ('GET', '/torneo/api/partidos/')
+
+            inicio = time.perf_counter()
+            try:
+                estado, _ = await sesion.peticion(*args, cabeceras=cabeceras)
+            except TimeoutError:
+                estado = 'timeout'
+            except (OSError, EOFError, ValueError):
+                estado = 'conexion'
+            resultados['muestras'][operacion].append((time.perf_counter() - inicio) * 1000)
+            resultados['estados'][operacion][estado] += 1
+            if operacion == 'apuestas':
+                if estado == 200:
+                    resultados['apuestas_ok'][sesion.usuario.id] += Decimal(monto)
+                elif estado in ('timeout', 'conexion'):
+                    # El servidor pudo cobrarla igualmente: se resuelve contra la base de datos al final
+                    resultados['desconocidas'][sesion.usuario.id].append((clave, Decimal(monto)))
+
+            if opciones['pausa']:
+                await asyncio.sleep(rng.expovariate(1 / opciones['pausa']))
+
+    def _informe(self, resultados, opciones):
+        duracion = resultados['fin'] - resultados['inicio']
+        total = sum(len(m) for m in resultados['muestras'].values())
+        informe = {'duracion_s': round(duracion, 2), 'peticiones': total,
+                   'rendimiento_rps': round(total / duracion, 1) if duracion else 0, 'operaciones': {}}
+        self.stdout.write(f'\n{total} peticiones en {duracion:.1f}s ({informe["rendimiento_rps"]} req/s)')
+
+        for operacion, muestras in sorted(resultados['muestras'].items()):
+            estados = dict(resultados['estados'][operacion])
+            errores = sum(n for e, n in estados.items() if isinstance(e, str) or e >= 500)
+            rechazos = sum(n for e, n in estados.items() if not isinstance(e, str) and 400 <= e < 500)
+            histograma = {f'<={c}ms': 0 for c in CUBOS_MS}
+            histograma['>5000ms'] = 0
+            for valor in muestras:
+                cubo = next((f'<={c}ms' for c in CUBOS_MS if valor <= c), '>5000ms')
+                histograma[cubo] += 1
+            informe['operaciones'][operacion] = {
+                'peticiones': len(muestras),
+                'estados': {str(e): n for e, n in estados.items()},
+                'tasa_error': round(errores / len(muestras), 4),
+                'tasa_rechazo': round(rechazos / len(muestras), 4),
+                'p50_ms': round(_percentil(muestras, 50), 2),
+                'p95_ms': round(_percentil(muestras, 95), 2),
+                'p99_ms': round(_percentil(muestras, 99), 2),
+                'histograma': histograma,
+            }
+            datos = informe['operaciones'][operacion]
+            self.stdout.write(
+                f'  {operacion:<9} {len(muestras):>7} pet.  error {datos["tasa_error"]:.2%}  '
+                f'rechazo {datos["tasa_rechazo"]:.2%}  p50 {datos["p50_ms"]} ms  p95 {datos["p95_ms"]} ms  '
+                f'p99 {datos["p99_ms"]} ms'
+            )
+            self.stdout.write('            ' + '  '.join(f'{k}:{v}' for k, v in histograma.items() if v))
+        return informe
+
+    def _resolver_desconocidas(self, resultados, espera):
+        """
+        Las apuestas sin respuesta (timeout o conexión cortada) se buscan por su Idempotency-Key:
+        la vista y la respuesta se guardan en la misma transacción, así que se cobraron si la clave
+        guardó un 200. Sin fila, la petición no llegó o se deshizo. Las que siguen en curso se
+        esperan hasta `espera` segundos; devuelve las que quedan sin resolver.
+        """
+        pendientes = {
+            (usuario_id, clave): monto
+            for usuario_id, apuestas in resultados['desconocidas'].items() for clave, monto in apuestas
+        }
+        cobradas = 0
+        en_curso = set()
+        limite = time.monotonic() + espera
+        while pendientes:
+            en_curso.clear()
+            filas = ClaveIdempotencia.objects.filter(clave__in=[c for _, c in pendientes]).values_list(
+                'usuario_id', 'clave', 'estado',
+            )
+            for usuario_id, clave, estado in filas:
+                if (usuario_id, clave) not in pendientes:
+                    continue
+                if estado is None:
+                    en_curso.add((usuario_id, clave))
+                    continue
+                monto = pendientes.pop((usuario_id, clave))
+                if estado == 200:
+                    resultados['apuestas_ok'][usuario_id] += monto
+                    cobradas += 1
+            if not en_curso or time.monotonic() >= limite:
+                break
+            time.sleep(0.5)
+        # Las que no tienen fila no se cobraron; las que siguen en curso quedan sin resolver
+        total = sum(len(a) for a in resultados['desconocidas'].values())
+        if total:
+            self.stdout.write(f'{total} apuestas sin respuesta: {cobradas} se cobraron, {len(en_curso)} sin resolver')
+        return sorted(en_curso)
+
+    def _verificar(self, ids, saldos_iniciales, ultima_apuesta, ultima_recarga, resultados, espera):
+        errores = []
+        sin_resolver = self._resolver_desconocidas(resultados, espera)
+        for usuario_id, clave in sin_resolver:
+            errores.append(f'usuario {usuario_id}: la apuesta {clave} seguía en curso al verificar')
+        dudosos = {usuario_id for usuario_id, _ in sin_resolver}
+        negativos = list(Usuario.objects.filter(saldo_real__lt=0).values_list('username', flat=True)[:20])
+        if negativos:
+            errores.append(f'saldos negativos: {", ".join(negativos)}')
+
+        apostado = dict(
+            Apuesta.objects.filter(id__gt=ultima_apuesta, usuario_id__in=ids)
+            .values('usuario_id').annotate(total=Sum('monto')).values_list('usuario_id', 'total')
+        )
+        recargado = dict(
+            RecargaSaldo.objects.filter(id__gt=ultima_recarga, usuario_id__in=ids)
+            .values('usuario_id').annotate(total=Sum('monto')).values_list('usuario_id', 'total')
+        )
+        saldos_finales = dict(Usuario.objects.filter(id__in=ids).values_list('id', 'saldo_real'))
+        for usuario_id in ids:
+            esperado = saldos_iniciales[usuario_id] + recargado.get(usuario_id, 0) - apostado.get(usuario_id, 0)
+            if saldos_finales[usuario_id] != esperado:
+                errores.append(f'usuario {usuario_id}: saldo {saldos_finales[usuario_id]} != esperado {esperado}')
+            confirmado = resultados['apuestas_ok'].get(usuario_id, Decimal(0))
+            if usuario_id not in dudosos and apostado.get(usuario_id, 0) != confirmado:
+                errores.append(f'usuario {usuario_id}: apuestas en BD {apostado.get(usuario_id, 0)} '
+                               f'!= confirmadas al cliente {confirmado}')
+
+        for mensaje in errores[:20]:
+            self.stdout.write(self.style.ERROR(mensaje))
+        return {'usuarios': len(ids), 'saldos_negativos': len(negativos), 'sin_resolver': len(sin_resolver),
+                'errores': errores}
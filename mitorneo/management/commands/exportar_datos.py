@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mitorneo import exportacion
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta partidos, apuestas, recargas o jugadores en NDJSON o CSV leyendo en streaming. '
+        'Con --marcas guarda hasta cuándo se exportó cada tipo y la siguiente ejecución solo '
+        'exporta las filas nuevas o modificadas desde entonces.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipos', nargs='+', choices=sorted(exportacion.EXPORTACIONES))
+        parser.add_argument('--formato', choices=exportacion.FORMATOS, default='ndjson')
+        parser.add_argument('--salida', default='-',
+                            help='Archivo de salida; con varios tipos, plantilla con {tipo} (p. ej. export_{tipo}.ndjson). '
+                                 '"-" escribe en la salida estándar.')
+        parser.add_argument('--desde-id', type=int, help='Exporta solo filas con id mayor.')
+        parser.add_argument('--desde', help='Exporta solo filas desde esta fecha ISO 8601 (apuestas y recargas).')
+        parser.add_argument('--desde-marca', help='Exporta solo filas creadas o modificadas después de esta fecha ISO 8601.')
+        parser.add_argument('--marcas', help='Archivo JSON con la marca de cada tipo (se lee y se actualiza).')
+        parser.add_argument('--chunk', type=int, default=exportacion.TAMANO_CHUNK)
+
+    def handle(self, *args, **opciones):
+        if len(opciones['tipos']) > 1 and opciones['salida'] != '-' and '{tipo}' not in opciones['salida']:
+            raise CommandError('Con varios tipos, --salida debe contener {tipo}.')
+        try:
+            desde = exportacion.fecha_iso(opciones['desde'], '--desde') if opciones['desde'] else None
+            desde_marca = (
+                exportacion.fecha_iso(opciones['desde_marca'], '--desde-marca') if opciones['desde_marca'] else None
+            )
+        except ValueError as e:
+            raise CommandError(f'{e}.')
+        marcas = exportacion.leer_marcas(opciones['marcas']) if opciones['marcas'] else {}
+
+        for tipo in opciones['tipos']:
+            inicio = time.monotonic()
+            desde_id = opciones['desde_id']
+            desde_marca_tipo = desde_marca
+            guardada = marcas.get(tipo)
+            if desde_marca_tipo is None and isinstance(guardada, str):
+                desde_marca_tipo = exportacion.fecha_iso(guardada, 'marca')
+            elif desde_id is None and isinstance(guardada, int):
+                # Archivo de marcas anterior, con el último id exportado
+                desde_id = guardada
+            try:
+                filas, marca = exportacion.generar(
+                    tipo, opciones['formato'], desde_id, desde, opciones['chunk'], desde_marca=desde_marca_tipo,
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+
+            lineas = 0
+            if opciones['salida'] == '-':
+                for linea in filas:
+                    self.stdout.write(linea, ending='')
+                    lineas += 1
+            else:
+                ruta = opciones['salida'].format(tipo=tipo)
+                with open(ruta, 'w', encoding='utf-8', newline='') as archivo:
+                    for linea in filas:
+                        archivo.write(linea)
+                        lineas += 1
+
+            # La marca solo avanza cuando la exportación terminó bien
+            if opciones['marcas']:
+                marcas[tipo] = marca.isoformat()
+                exportacion.guardar_marcas(opciones['marcas'], marcas)
+            if opciones['formato'] == 'csv':
+                lineas -= 1
+            self.stderr.write(self.style.SUCCESS(
+                f'{tipo}: {max(lineas, 0)} filas en {time.monotonic() - inicio:.2f}s (marca {marca.isoformat()}).'
+            ))
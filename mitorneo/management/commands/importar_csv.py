@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mitorneo.importacion import IMPORTADORES, TAMANO_LOTE, importar_csv
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa equipos, jugadores, árbitros, partidos o apostadores desde un CSV con cabecera, leyéndolo en '
+        'streaming e insertando por lotes en una transacción. Las filas con errores se informan y se saltan.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(IMPORTADORES))
+        parser.add_argument('archivo', help='Ruta del CSV (UTF-8).')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Filas por lote.')
+        parser.add_argument('--delimitador', default=',')
+        parser.add_argument('--simular', action='store_true', help='Valida todo y deshace los cambios.')
+        parser.add_argument('--procesos', type=int, default=None,
+                            help='Procesos para hashear contraseñas (por defecto APROVISIONAMIENTO_PROCESOS o nº de CPUs).')
+        parser.add_argument('--max-errores', type=int, default=50, help='Errores a mostrar.')
+
+    def handle(self, *args, **opciones):
+        inicio = time.monotonic()
+
+        def progreso(resultado):
+            self.stdout.write(f'  {resultado.filas} filas, {resultado.creados} creados, {resultado.total_errores} errores...')
+
+        try:
+            with open(opciones['archivo'], encoding='utf-8-sig', newline='') as archivo:
+                resultado = importar_csv(
+                    opciones['tipo'], archivo, opciones['lote'], opciones['simular'],
+                    opciones['delimitador'], progreso, opciones['procesos'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for linea, mensaje in resultado.errores[:opciones['max_errores']]:
+            self.stderr.write(f'Línea {linea}: {mensaje}')
+        if resultado.total_errores > opciones['max_errores']:
+            self.stderr.write(f'... y {resultado.total_errores - opciones["max_errores"]} errores más')
+
+        accion = 'validados (simulación, sin guardar)' if opciones['simular'] else 'creados'
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.creados} {opciones["tipo"]} {accion} de {resultado.filas} filas en '
+            f'{time.monotonic() - inicio:.2f}s ({resultado.total_errores} con errores).'
+        ))
@@ -0,0 +1,48 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mitorneo import imagenes
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera variantes redimensionadas en AVIF, WebP y el formato original de las imágenes de '
+        'mitorneo/static/mitorneo/imagenes para servirlas con srcset/<picture> ({% load imagenes %}). '
+        'Requiere Pillow. Ejecútelo antes de collectstatic.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anchos', type=int, nargs='+', default=list(imagenes.ANCHOS),
+                            help='Anchos en píxeles (nunca se amplía el original, que siempre se incluye).')
+        parser.add_argument('--formatos', nargs='+', choices=imagenes.FORMATOS, default=list(imagenes.FORMATOS))
+        parser.add_argument('--forzar', action='store_true', help='Regenera aunque las variantes estén al día.')
+
+    def handle(self, *args, **opciones):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise CommandError('optimizar_imagenes requiere Pillow (pip install Pillow).')
+
+        inicio = time.monotonic()
+        origen = imagenes.directorio_origen()
+        indice = {}
+        for archivo in sorted(os.listdir(origen)):
+            ruta = os.path.join(origen, archivo)
+            if not os.path.isfile(ruta) or not archivo.lower().endswith(imagenes.EXTENSIONES_ORIGEN):
+                continue
+            entrada = imagenes.generar_variantes(ruta, opciones['anchos'], opciones['formatos'], forzar=opciones['forzar'])
+            indice[f'mitorneo/imagenes/{archivo}'] = entrada
+            original = os.path.getsize(ruta)
+            menor = min(v[2] for variantes in entrada['variantes'].values() for v in variantes)
+            resumen = ', '.join(f'{f}: {len(v)}' for f, v in entrada['variantes'].items())
+            self.stdout.write(f'  {archivo}: {original // 1024} KB -> desde {menor // 1024} KB ({resumen})')
+        if 'avif' in opciones['formatos'] and not any('avif' in e['variantes'] for e in indice.values()):
+            self.stderr.write('Esta instalación de Pillow no soporta AVIF; solo se generaron WebP y el formato original.')
+
+        imagenes.guardar_indice(indice)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(indice)} imágenes procesadas en {time.monotonic() - inicio:.2f}s '
+            f'({imagenes.directorio_variantes()}).'
+        ))
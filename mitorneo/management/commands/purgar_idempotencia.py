@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mitorneo.idempotencia import purgar
+
+
+class Command(BaseCommand):
+    help = (
+        'Borra por lotes las Idempotency-Key con más antigüedad que IDEMPOTENCIA_TTL. Pensado para '
+        'ejecutarse periódicamente (cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Claves borradas por consulta.')
+
+    def handle(self, *args, **opciones):
+        inicio = time.monotonic()
+        borradas = purgar(lote=opciones['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{borradas} claves de idempotencia borradas en {time.monotonic() - inicio:.2f}s.'
+        ))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mitorneo.eventos import reconstruir_estadisticas
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula goles, asistencias y partidos jugados de todos los jugadores a partir de '
+        'EventoPartido con una sola consulta agrupada.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Tamaño de lote de bulk_update.')
+
+    def handle(self, *args, **opciones):
+        inicio = time.monotonic()
+        actualizados = reconstruir_estadisticas(batch_size=opciones['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{actualizados} jugadores actualizados en {time.monotonic() - inicio:.2f}s.'
+        ))
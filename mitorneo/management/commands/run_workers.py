@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+import queue
+import signal
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Sin importar mitorneo aquí: el proceso hijo (spawn) importa este módulo antes de django.setup()
+ARRANQUE_MINIMO = 10  # un worker que muere antes de esto no se reinicia (error de configuración)
+
+
+def _proceso_trabajador(modulo_settings, indice, parar, informes, opciones):
+    # Ctrl+C llega a todo el grupo: el que decide parar es el proceso principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', modulo_settings)
+    import django
+    django.setup()
+    from mitorneo import trabajos as cola
+
+    cola.bucle_trabajador(
+        cola.nombre_trabajador(indice), parar, opciones['tipos'], opciones['lote'], opciones['intervalo'],
+        opciones['hasta_vaciar'], informar=lambda *ejecucion: informes.put(ejecucion),
+    )
+
+
+def _percentil(valores, p):
+    if len(valores) == 1:
+        return valores[0]
+    return statistics.quantiles(valores, n=100, method='inclusive')[p - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Arranca N procesos que ejecutan los trabajos encolados en la base de datos (Trabajo), '
+        'con reintentos y backoff, e informa periódicamente de la espera en cola y la duración.'
+    )
+
+    def add_arguments(self, parser):
+        from mitorneo import trabajos
+
+        parser.add_argument('--procesos', type=int, default=2)
+        parser.add_argument('--tipos', nargs='+', choices=sorted(trabajos.TAREAS),
+                            help='Solo ejecuta estos tipos de trabajo (por defecto todos).')
+        parser.add_argument('--lote', type=int, default=1, help='Trabajos que reclama cada worker de una vez.')
+        parser.add_argument('--intervalo', type=float, default=1.0,
+                            help='Segundos de espera cuando no hay trabajos disponibles.')
+        parser.add_argument('--informe', type=float, default=60.0, help='Segundos entre informes de latencia.')
+        parser.add_argument('--hasta-vaciar', action='store_true',
+                            help='Termina cuando no quedan trabajos disponibles (cron, pruebas).')
+
+    def handle(self, *args, **opciones):
+        from mitorneo import trabajos
+
+        if opciones['procesos'] < 1 or opciones['lote'] < 1:
+            raise CommandError('--procesos y --lote deben ser al menos 1.')
+        contexto = multiprocessing.get_context('spawn')
+        parar = contexto.Event()
+        informes = contexto.Queue()
+        self.ejecuciones = []
+
+        def detener(signum, frame):
+            self.stdout.write('Parando: los workers terminan el trabajo en curso...')
+            parar.set()
+
+        signal.signal(signal.SIGINT, detener)
+        signal.signal(signal.SIGTERM, detener)
+
+        modulo = os.environ.get('DJANGO_SETTINGS_MODULE', 'miproyectofutbol.settings')
+        argumentos = {k: opciones[k] for k in ('tipos', 'lote', 'intervalo', 'hasta_vaciar')}
+
+        def arrancar(indice):
+            proceso = contexto.Process(
+                target=_proceso_trabajador, args=(modulo, indice, parar, informes, argumentos),
+                name=f'worker-{indice}', daemon=False,
+            )
+            proceso.start()
+            proceso.arranque = time.monotonic()
+            return proceso
+
+        procesos = {indice: arrancar(indice) for indice in range(opciones['procesos'])}
+        self.stdout.write(f'{len(procesos)} workers arrancados.')
+        # Los colgados se revisan también al arrancar: puede que los dejara un run_workers anterior
+        ultimo_informe, ultima_revision = time.monotonic(), 0.0
+        while procesos:
+            self._recoger(informes, espera=0.5)
+            ahora = time.monotonic()
+            if ahora - ultima_revision >= 30:
+                recuperados = trabajos.recuperar_colgados()
+                if recuperados:
+                    self.stdout.write(self.style.WARNING(f'{recuperados} trabajos colgados devueltos a la cola.'))
+                ultima_revision = ahora
+            if ahora - ultimo_informe >= opciones['informe'] and self.ejecuciones:
+                self._informar()
+                ultimo_informe = ahora
+            for indice, proceso in list(procesos.items()):
+                if proceso.is_alive():
+                    continue
+                del procesos[indice]
+                if proceso.exitcode != 0 and not parar.is_set():
+                    if time.monotonic() - proceso.arranque < ARRANQUE_MINIMO:
+                        parar.set()
+                        raise CommandError(f'El worker {indice} terminó al arrancar con código {proceso.exitcode}.')
+                    self.stderr.write(f'El worker {indice} terminó con código {proceso.exitcode}; se reinicia.')
+                    procesos[indice] = arrancar(indice)
+
+        self._recoger(informes, espera=0)
+        if self.ejecuciones:
+            self._informar()
+        self.stdout.write(self.style.SUCCESS('Workers detenidos.'))
+
+    def _recoger(self, informes, espera):
+        try:
+            self.ejecuciones.append(informes.get(timeout=espera) if espera else informes.get_nowait())
+            while True:
+                self.ejecuciones.append(informes.get_nowait())
+        except queue.Empty:
+            pass
+
+    def _informar(self):
+        """Espera en cola y duración por tipo de trabajo desde el último informe."""
+        por_tipo = {}
+        for tipo, resultado, espera, duracion in self.ejecuciones:
+            por_tipo.setdefault(tipo, []).append((resultado, espera, duracion))
+        for tipo, filas in sorted(por_tipo.items()):
+            esperas = [f[1] * 1000 for f in filas]
+            duraciones = [f[2] * 1000 for f in filas]
+            resultados = {r: sum(1 for f in filas if f[0] == r) for r in ('completado', 'reintento', 'fallido')}
+            self.stdout.write(
+                f'  {tipo:<26} {len(filas):>6} ejecuciones '
+                f'({resultados["completado"]} ok, {resultados["reintento"]} reintentos, {resultados["fallido"]} fallidos)  '
+                f'espera p50 {_percentil(esperas, 50):8.1f} ms p95 {_percentil(esperas, 95):8.1f} ms  '
+                f'duración p50 {_percentil(duraciones, 50):8.1f} ms p95 {_percentil(duraciones, 95):8.1f} ms'
+            )
+        self.ejecuciones = []
@@ -0,0 +1,326 @@
+import io
+import random
+import time
+from datetime import datetime, time as dtime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from mitorneo import busqueda, mercados, paneles
+from mitorneo.autenticacion import invalidar_usuarios
+from mitorneo.eventos import generar_eventos, reconstruir_estadisticas, titulares_por_equipo
+from mitorneo.fuerzas import recalcular_fuerzas
+from mitorneo.models import Usuario, Equipo, Jugador, Arbitro, Partido, Apuesta, RecargaSaldo, EventoPartido
+
+# Todo lo generado lleva estos prefijos para poder limpiarlo sin tocar datos reales
+PREFIJO_USUARIO = 'seed_'
+PREFIJO_EQUIPO = 'Seed '
+
+NOMBRES = ['Juan', 'Carlos', 'Luis', 'Andrés', 'Miguel', 'Jorge', 'Santiago', 'Felipe',
+           'Diego', 'Camilo', 'Mateo', 'Sebastián', 'David', 'Daniel', 'Nicolás', 'Alejandro']
+APELLIDOS = ['García', 'Rodríguez', 'Martínez', 'López', 'González', 'Pérez', 'Sánchez',
+             'Ramírez', 'Torres', 'Flórez', 'Rivera', 'Gómez', 'Díaz', 'Vargas', 'Castro', 'Rojas']
+# Distribución de posiciones de una plantilla típica (se repite si hay más jugadores)
+POSICIONES_PLANTILLA = ['Portero', 'Defensa', 'Defensa', 'Defensa', 'Defensa', 'Mediocentro',
+                        'Mediocentro', 'Mediocentro', 'Delantero', 'Delantero', 'Delantero']
+METODOS_PAGO = ['tarjeta', 'paypal']
+
+
+def _en_lotes(iterable, tamano):
+    lote = []
+    for elemento in iterable:
+        lote.append(elemento)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera equipos, jugadores, árbitros, partidos, apuestas y recargas sintéticos para pruebas de carga. '
+        'Con la misma semilla y fecha base los datos generados son idénticos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--equipos', type=int, default=20)
+        parser.add_argument('--jugadores-por-equipo', type=int, default=22)
+        parser.add_argument('--arbitros', type=int, default=10)
+        parser.add_argument('--partidos', type=int, default=380)
+        parser.add_argument('--porcentaje-jugados', type=float, default=0.7,
+                            help='Fracción de partidos que se generan ya simulados (en el pasado).')
+        parser.add_argument('--apostadores', type=int, default=1000)
+        parser.add_argument('--recargas', type=int, default=5000,
+                            help='Recargas iniciales; se añaden recargas extra cuando un apostador se queda sin saldo.')
+        parser.add_argument('--apuestas', type=int, default=100000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--fecha-base', help='Fecha (AAAA-MM-DD) de referencia para el calendario. Por defecto hoy.')
+        parser.add_argument('--password', default='playliga123',
+                            help='Contraseña común de todos los usuarios generados.')
+        parser.add_argument('--lote', type=int, default=5000, help='Tamaño de lote para las inserciones.')
+        parser.add_argument('--sin-copy', action='store_true',
+                            help='No usar COPY en PostgreSQL, insertar por lotes con INSERT.')
+        parser.add_argument('--limpiar', action='store_true',
+                            help='Borra los datos generados previamente antes de generar nuevos.')
+
+    def handle(self, *args, **opciones):
+        if opciones['equipos'] < 2 and opciones['partidos']:
+            raise CommandError('Se necesitan al menos 2 equipos para generar partidos.')
+        if opciones['partidos'] and not opciones['arbitros']:
+            raise CommandError('Se necesita al menos 1 árbitro para generar partidos.')
+
+        if opciones['fecha_base']:
+            fecha = parse_date(opciones['fecha_base'])
+            if fecha is None:
+                raise CommandError('Fecha base inválida, use el formato AAAA-MM-DD.')
+        else:
+            fecha = timezone.now().date()
+        self.fecha_base = timezone.make_aware(datetime.combine(fecha, dtime(12, 0)), timezone.get_current_timezone())
+
+        self.rng = random.Random(opciones['seed'])
+        self.lote = opciones['lote']
+        self.usar_copy = connection.vendor == 'postgresql' and not opciones['sin_copy']
+        inicio = time.monotonic()
+
+        if opciones['limpiar']:
+            self._limpiar()
+
+        # Un único hash para todos: PBKDF2 por usuario haría el comando inviable
+        self.password = make_password(opciones['password'])
+
+        with transaction.atomic():
+            equipos = self._crear_equipos(opciones['equipos'])
+            self._crear_jugadores(equipos, opciones['jugadores_por_equipo'])
+            arbitros = self._crear_arbitros(opciones['arbitros'])
+            partidos = self._crear_partidos(equipos, arbitros, opciones['partidos'], opciones['porcentaje_jugados'])
+            self._crear_eventos(equipos, partidos)
+            apostadores = self._crear_usuarios('apostador', opciones['apostadores'])
+            self._crear_movimientos(apostadores, partidos, opciones['recargas'], opciones['apuestas'])
+            # bulk_create no dispara las señales que mantienen FuerzaEquipo
+            recalcular_fuerzas([e.id for e in equipos])
+            # ni las que invalidan los paneles cacheados
+            paneles.invalidar_todo()
+            mercados.invalidar()
+            transaction.on_commit(busqueda.invalidar)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Liga sintética generada en {time.monotonic() - inicio:.1f}s '
+            f'(semilla {opciones["seed"]}, {"COPY" if self.usar_copy else "INSERT por lotes"}).'
+        ))
+
+    def _limpiar(self):
+        usuarios = Usuario.objects.filter(username__startswith=PREFIJO_USUARIO)
+        equipos = Equipo.objects.filter(nombre__startswith=PREFIJO_EQUIPO)
+        with transaction.atomic():
+            # Se borra de hijos a padres para que cada DELETE sea una sola sentencia
+            Apuesta.objects.filter(usuario__in=usuarios).delete()
+            RecargaSaldo.objects.filter(usuario__in=usuarios).delete()
+            EventoPartido.objects.filter(partido__equipo_local__in=equipos).delete()
+            Partido.objects.filter(equipo_local__in=equipos).delete()
+            Jugador.objects.filter(usuario__in=usuarios).delete()
+            Arbitro.objects.filter(usuario__in=usuarios).delete()
+            usuarios.delete()
+            equipos.delete()
+        self.stdout.write('Datos generados anteriormente eliminados.')
+
+    def _insertar(self, modelo, objetos):
+        creados = []
+        for lote in _en_lotes(objetos, self.lote):
+            creados.extend(modelo.objects.bulk_create(lote))
+        return creados
+
+    def _crear_equipos(self, cantidad):
+        equipos = self._insertar(Equipo, (Equipo(nombre=f'{PREFIJO_EQUIPO}Equipo {i + 1:04d}') for i in range(cantidad)))
+        self.stdout.write(f'{len(equipos)} equipos')
+        return equipos
+
+    def _crear_usuarios(self, rol, cantidad):
+        usuarios = (
+            Usuario(
+                username=f'{PREFIJO_USUARIO}{rol}_{i + 1}',
+                email=f'{PREFIJO_USUARIO}{rol}_{i + 1}@playliga.test',
+                first_name=self.rng.choice(NOMBRES),
+                last_name=self.rng.choice(APELLIDOS),
+                password=self.password,
+                rol=rol,
+            )
+            for i in range(cantidad)
+        )
+        return self._insertar(Usuario, usuarios)
+
+    def _crear_jugadores(self, equipos, por_equipo):
+        usuarios = self._crear_usuarios('jugador', len(equipos) * por_equipo)
+        jugadores = []
+        for indice, usuario in enumerate(usuarios):
+            posicion_en_plantilla = indice % por_equipo
+            jugadores.append(Jugador(
+                usuario=usuario,
+                nombre=usuario.first_name,
+                apellido=usuario.last_name,
+                correo=usuario.email,
+                nivel=self.rng.randint(1, 10),
+                equipo=equipos[indice // por_equipo],
+                posicion=POSICIONES_PLANTILLA[posicion_en_plantilla % len(POSICIONES_PLANTILLA)],
+                numero_camiseta=posicion_en_plantilla + 1,
+            ))
+        self._insertar(Jugador, jugadores)
+        self.stdout.write(f'{len(jugadores)} jugadores')
+
+    def _crear_arbitros(self, cantidad):
+        usuarios = self._crear_usuarios('arbitro', cantidad)
+        arbitros = self._insertar(Arbitro, (
+            Arbitro(usuario=u, nombre=u.first_name, apellido=u.last_name, correo=u.email) for u in usuarios
+        ))
+        self.stdout.write(f'{len(arbitros)} árbitros')
+        return arbitros
+
+    def _crear_partidos(self, equipos, arbitros, cantidad, porcentaje_jugados):
+        jugados = int(cantidad * porcentaje_jugados)
+        partidos = []
+        for i in range(cantidad):
+            local, visitante = self.rng.sample(equipos, 2)
+            partido = Partido(equipo_local=local, equipo_visitante=visitante, arbitro=self.rng.choice(arbitros))
+            if i < jugados:
+                # Partidos pasados, ya simulados, repartidos en el último año
+                partido.fecha = self.fecha_base - timedelta(days=self.rng.randint(1, 365), hours=self.rng.randint(0, 10))
+                partido.goles_local = self.rng.randint(0, 5)
+                partido.goles_visitante = self.rng.randint(0, 5)
+                partido.simulado = True
+                if partido.goles_local > partido.goles_visitante:
+                    partido.ganador = local
+                elif partido.goles_visitante > partido.goles_local:
+                    partido.ganador = visitante
+            else:
+                # Partidos futuros abiertos a apuestas
+                partido.fecha = self.fecha_base + timedelta(days=self.rng.randint(1, 120), hours=self.rng.randint(0, 10))
+            partidos.append(partido)
+        partidos = self._insertar(Partido, partidos)
+        self.stdout.write(f'{len(partidos)} partidos ({jugados} simulados)')
+        return partidos
+
+    def _crear_eventos(self, equipos, partidos):
+        """Goles, asistencias, tarjetas y apariciones de los partidos ya jugados."""
+        titulares = titulares_por_equipo([e.id for e in equipos])
+        columnas = ['partido_id', 'jugador_id', 'tipo', 'minuto', 'fecha_registro']
+
+        def generar_filas():
+            for partido in partidos:
+                if not partido.simulado:
+                    continue
+                for evento in generar_eventos(partido, partido.goles_local, partido.goles_visitante, self.rng, titulares):
+                    yield (partido.pk, evento.jugador.pk, evento.tipo, evento.minuto, partido.fecha)
+
+        self._volcar(EventoPartido, columnas, generar_filas())
+        # Los eventos se vuelcan sin pasar por registrar_eventos: se recalculan los agregados de una vez
+        actualizados = reconstruir_estadisticas(batch_size=self.lote)
+        self.stdout.write(f'Eventos de partido generados ({actualizados} jugadores con estadísticas)')
+
+    def _crear_movimientos(self, apostadores, partidos, recargas, apuestas):
+        """
+        Genera recargas y apuestas respetando el saldo de cada apostador,
+        de modo que saldo_real = recargas - apuestas al terminar.
+        """
+        if not apostadores:
+            return
+        saldos = [Decimal('0.00')] * len(apostadores)
+        contadores = {'recargas': 0, 'apuestas': 0}
+
+        def recarga(indice, fecha):
+            monto = Decimal(self.rng.randint(20, 500))
+            saldos[indice] += monto
+            contadores['recargas'] += 1
+            return (apostadores[indice].pk, monto, self.rng.choice(METODOS_PAGO), '{}', fecha)
+
+        def generar_recargas():
+            for _ in range(recargas):
+                fecha = self.fecha_base - timedelta(days=400, minutes=self.rng.randint(0, 60 * 24 * 30))
+                yield recarga(self.rng.randrange(len(apostadores)), fecha)
+
+        extras = []
+
+        def generar_apuestas():
+            for _ in range(apuestas if partidos else 0):
+                indice = self.rng.randrange(len(apostadores))
+                partido = self.rng.choice(partidos)
+                fecha = partido.fecha - timedelta(minutes=self.rng.randint(5, 60 * 24 * 7))
+                monto = Decimal(self.rng.randint(1, 50))
+                while saldos[indice] < monto:
+                    # Recarga justo antes de apostar, como haría un apostador real
+                    extras.append(recarga(indice, fecha - timedelta(minutes=1)))
+                saldos[indice] -= monto
+                contadores['apuestas'] += 1
+                equipo_id = self.rng.choice((partido.equipo_local_id, partido.equipo_visitante_id))
+                ganador = partido.simulado and partido.ganador_id == equipo_id
+                yield (apostadores[indice].pk, partido.pk, equipo_id, monto, fecha, ganador)
+
+        columnas_recarga = ['usuario_id', 'monto', 'metodo_pago', 'datos_pago', 'fecha_recarga']
+        columnas_apuesta = ['usuario_id', 'partido_id', 'equipo_id', 'monto', 'fecha_apuesta', 'ganador']
+
+        self._volcar(RecargaSaldo, columnas_recarga, generar_recargas())
+        for lote in _en_lotes(generar_apuestas(), self.lote):
+            self._volcar(Apuesta, columnas_apuesta, lote)
+            if len(extras) >= self.lote:
+                self._volcar(RecargaSaldo, columnas_recarga, extras)
+                extras.clear()
+            self.stdout.write(f'  {contadores["apuestas"]} apuestas...', ending='\r')
+        self._volcar(RecargaSaldo, columnas_recarga, extras)
+
+        for apostador, saldo in zip(apostadores, saldos):
+            apostador.saldo_real = saldo
+        for lote in _en_lotes(apostadores, self.lote):
+            Usuario.objects.bulk_update(lote, ['saldo_real'])
+        # bulk_update no dispara post_save
+        invalidar_usuarios([apostador.id for apostador in apostadores])
+        self.stdout.write(f'{len(apostadores)} apostadores, {contadores["recargas"]} recargas, '
+                          f'{contadores["apuestas"]} apuestas')
+
+    def _volcar(self, modelo, columnas, filas):
+        for lote in _en_lotes(filas, self.lote):
+            if self.usar_copy:
+                self._copy(modelo, columnas, lote)
+            else:
+                self._insert(modelo, columnas, lote)
+
+    def _insert(self, modelo, columnas, filas):
+        # bulk_create aplicaría auto_now_add y perderíamos las fechas generadas,
+        # así que se inserta con executemany preparando cada valor con su campo
+        campos = [modelo._meta.get_field(columna) for columna in columnas]
+        tabla = connection.ops.quote_name(modelo._meta.db_table)
+        sql = f'INSERT INTO {tabla} ({", ".join(columnas)}) VALUES ({", ".join(["%s"] * len(columnas))})'
+        valores = [
+            [campo.get_db_prep_save(valor, connection) for campo, valor in zip(campos, fila)]
+            for fila in filas
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, valores)
+
+    def _copy(self, modelo, columnas, filas):
+        buffer = io.StringIO()
+        for fila in filas:
+            buffer.write('\t'.join(self._valor_copy(valor) for valor in fila))
+            buffer.write('\n')
+        buffer.seek(0)
+        tabla = connection.ops.quote_name(modelo._meta.db_table)
+        sql = f'COPY {tabla} ({", ".join(columnas)}) FROM STDIN'
+        with connection.cursor() as cursor:
+            crudo = cursor.cursor
+            if hasattr(crudo, 'copy_expert'):  # psycopg2
+                crudo.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with crudo.copy(sql) as copia:
+                    copia.write(buffer.getvalue())
+
+    @staticmethod
+    def _valor_copy(valor):
+        if valor is None:
+            return '\\N'
+        if isinstance(valor, bool):
+            return 't' if valor else 'f'
+        if isinstance(valor, datetime):
+            return valor.isoformat()
+        return str(valor)
@@ -0,0 +1,76 @@
+import signal
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from mitorneo import simulacion
+
+# Margen tras la hora de inicio para despertar con el partido ya vencido
+MARGEN = 0.05
+ESPERA_TRAS_FALLO = 5.0
+
+
+class Command(BaseCommand):
+    help = (
+        'Simula automáticamente los partidos cuya hora de inicio ya pasó, por lotes, y duerme '
+        'hasta el siguiente inicio (como mucho --espera-maxima segundos, para ver partidos nuevos '
+        'o reprogramados).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=100, help='Partidos simulados por lote.')
+        parser.add_argument('--espera-maxima', type=float, default=60.0,
+                            help='Segundos máximos de espera entre comprobaciones.')
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Simula los partidos vencidos y termina (cron).')
+
+    def handle(self, *args, **opciones):
+        if opciones['lote'] < 1 or opciones['espera_maxima'] <= 0:
+            raise CommandError('--lote y --espera-maxima deben ser positivos.')
+        parar = threading.Event()
+
+        def detener(signum, frame):
+            self.stdout.write('Parando tras el lote en curso...')
+            parar.set()
+
+        signal.signal(signal.SIGINT, detener)
+        signal.signal(signal.SIGTERM, detener)
+
+        total = 0
+        while not parar.is_set():
+            inicio = time.monotonic()
+            simulados, fallidos = simulacion.simular_vencidos(opciones['lote'])
+            if simulados or fallidos:
+                total += len(simulados)
+                self._informar(simulados, fallidos, time.monotonic() - inicio)
+            # Lote completo: puede que queden más vencidos, se sigue sin esperar
+            if simulados and len(simulados) + fallidos >= opciones['lote']:
+                continue
+            if opciones['una_vez']:
+                break
+
+            proximo = simulacion.proximo_inicio()
+            espera = opciones['espera_maxima']
+            if proximo is not None:
+                espera = min(max((proximo - timezone.now()).total_seconds() + MARGEN, 0), espera)
+            if fallidos:
+                espera = max(espera, min(ESPERA_TRAS_FALLO, opciones['espera_maxima']))
+            close_old_connections()
+            parar.wait(espera)
+
+        self.stdout.write(self.style.SUCCESS(f'{total} partidos simulados.'))
+
+    def _informar(self, simulados, fallidos, segundos):
+        ahora = timezone.now()
+        # Retraso entre la hora de inicio y la simulación
+        retrasos = [(ahora - partido.fecha).total_seconds() for partido in simulados]
+        linea = f'{len(simulados)} partidos simulados en {segundos:.2f}s'
+        if retrasos:
+            linea += f' (retraso mediano {statistics.median(retrasos):.1f}s, máximo {max(retrasos):.1f}s)'
+        if fallidos:
+            linea += f', {fallidos} con error'
+        self.stdout.write(linea)
@@ -0,0 +1,155 @@
+"""
+Mercados de apuestas abiertos en memoria de cada proceso y registro de apuestas.
+
+Validar una apuesta solo necesita saber si el partido sigue abierto y qué equipos juegan. Cada
+worker guarda en un dict partido_id -> (local_id, visitante_id, fecha) de los partidos sin
+simular que aún no han empezado. Lo recarga cuando cambia la versión en la caché (las señales de
+Partido la suben al confirmar la transacción) y, como la caché puede no ser compartida, también
+cada MERCADOS_CACHE_TIMEOUT segundos. El dict es solo un atajo: un partido que no aparece se
+consulta en la base de datos (puede haberlo creado otro proceso) y la apuesta se valida de nuevo
+en el propio UPDATE del saldo, así que un partido ya simulado o empezado nunca la admite.
+
+registrar_apuesta descuenta el saldo con un UPDATE condicional (saldo_real >= monto y el partido
+abierto), que no deja el saldo en negativo aunque lleguen dos apuestas a la vez, e inserta la
+apuesta: son las únicas consultas de una apuesta válida.
+"""
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Exists, F, Q
+from django.utils import timezone
+
+from .autenticacion import invalidar_usuarios
+from .models import Apuesta, Partido, Usuario
+
+CLAVE_VERSION = 'mercados:version'
+CENTIMOS = Decimal('0.01')
+
+_cerrojo = threading.Lock()
+_estado = {'version': None, 'cargado': 0.0, 'mercados': {}}
+
+
+class SaldoInsuficiente(Exception):
+    pass
+
+
+class MercadoCerrado(Exception):
+    pass
+
+
+def _version():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(CLAVE_VERSION, version, None):
+            version = cache.get(CLAVE_VERSION, version)
+    return version
+
+
+def invalidar():
+    """Los procesos recargan los mercados en la siguiente apuesta, tras confirmar la transacción."""
+    transaction.on_commit(lambda: cache.set(CLAVE_VERSION, time.time_ns(), None))
+
+
+def _timeout():
+    return getattr(settings, 'MERCADOS_CACHE_TIMEOUT', 5)
+
+
+def _mercados():
+    version = _version()
+    with _cerrojo:
+        if _estado['version'] != version or time.monotonic() - _estado['cargado'] >= _timeout():
+            _estado['mercados'] = {
+                partido_id: (local_id, visitante_id, fecha)
+                for partido_id, local_id, visitante_id, fecha in Partido.objects.filter(
+                    simulado=False, fecha__gt=timezone.now(),
+                ).values_list('id', 'equipo_local_id', 'equipo_visitante_id', 'fecha')
+            }
+            _estado['version'] = version
+            _estado['cargado'] = time.monotonic()
+        return _estado['mercados']
+
+
+def _olvidar(partido_id):
+    with _cerrojo:
+        _estado['mercados'].pop(partido_id, None)
+
+
+def abierto(partido_id):
+    """(local_id, visitante_id, fecha) si el partido admite apuestas ahora mismo, o None."""
+    mercados = _mercados()
+    mercado = mercados.get(partido_id)
+    if mercado is None:
+        # Puede ser un partido creado en otro proceso después de la última recarga
+        mercado = Partido.objects.filter(id=partido_id, simulado=False, fecha__gt=timezone.now()).values_list(
+            'equipo_local_id', 'equipo_visitante_id', 'fecha',
+        ).first()
+        if mercado is None:
+            return None
+        with _cerrojo:
+            mercados[partido_id] = mercado
+    if mercado[2] <= timezone.now():
+        return None
+    return mercado
+
+
+def _descontar_con_returning(usuario_id, monto, partido_id, equipo_id, ahora):
+    tabla = Usuario._meta.db_table
+    partidos = Partido._meta.db_table
+    columna = {f.name: f.column for f in Partido._meta.concrete_fields}
+    # En PostgreSQL, FOR SHARE espera a una simulación en curso del partido y vuelve a comprobarlo
+    bloqueo = ' FOR SHARE' if connection.vendor == 'postgresql' else ''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {tabla} SET saldo_real = saldo_real - %s WHERE id = %s AND saldo_real >= %s '
+            f'AND EXISTS (SELECT 1 FROM {partidos} WHERE id = %s AND NOT {columna["simulado"]} '
+            f'AND {columna["fecha"]} > %s AND %s IN ({columna["equipo_local"]}, {columna["equipo_visitante"]}){bloqueo}) '
+            f'RETURNING saldo_real',
+            [monto, usuario_id, monto, partido_id, connection.ops.adapt_datetimefield_value(ahora), equipo_id],
+        )
+        fila = cursor.fetchone()
+    return None if fila is None else Decimal(str(fila[0])).quantize(CENTIMOS)
+
+
+def descontar_saldo(usuario_id, monto, partido_id, equipo_id):
+    """
+    Resta `monto` si hay saldo suficiente y el partido sigue abierto con `equipo_id` en juego;
+    devuelve el saldo resultante o None si no se pudo.
+    """
+    ahora = timezone.now()
+    if connection.vendor == 'postgresql' or (connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 35)):
+        # UPDATE ... RETURNING: el saldo nuevo sin una segunda consulta
+        return _descontar_con_returning(usuario_id, monto, partido_id, equipo_id, ahora)
+    partido_abierto = Partido.objects.filter(
+        Q(equipo_local_id=equipo_id) | Q(equipo_visitante_id=equipo_id),
+        id=partido_id, simulado=False, fecha__gt=ahora,
+    )
+    if not Usuario.objects.filter(Exists(partido_abierto), pk=usuario_id, saldo_real__gte=monto).update(
+        saldo_real=F('saldo_real') - monto,
+    ):
+        return None
+    return Usuario.objects.values_list('saldo_real', flat=True).get(pk=usuario_id)
+
+
+def registrar_apuesta(usuario_id, partido_id, equipo_id, monto):
+    """
+    Descuenta el saldo e inserta la apuesta; devuelve (apuesta, saldo nuevo). Lanza
+    MercadoCerrado si el partido ya empezó o se simuló, y SaldoInsuficiente si falta saldo.
+    """
+    with transaction.atomic():
+        saldo = descontar_saldo(usuario_id, monto, partido_id, equipo_id)
+        if saldo is None:
+            # Solo al fallar se consulta el motivo
+            if not Partido.objects.filter(id=partido_id, simulado=False, fecha__gt=timezone.now()).exists():
+                _olvidar(partido_id)
+                raise MercadoCerrado
+            raise SaldoInsuficiente
+        apuesta = Apuesta.objects.create(usuario_id=usuario_id, partido_id=partido_id, equipo_id=equipo_id, monto=monto)
+    # El saldo cambió con un UPDATE, sin señales: el usuario cacheado de la sesión ya no vale
+    invalidar_usuarios([usuario_id])
+    return apuesta, saldo
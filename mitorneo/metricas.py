@@ -0,0 +1,331 @@
+"""
+Métricas en formato de texto de Prometheus.
+
+Cada proceso acumula sus contadores e histogramas en memoria. Si METRICAS_DIR está
+configurado, cada proceso vuelca periódicamente su estado a un archivo propio y /metrics
+suma los de todos los workers (gunicorn, uwsgi...), igual que el modo multiproceso del
+cliente oficial de Prometheus.
+
+El archivo de un worker que ha terminado no se borra sin más, o los contadores retrocederían:
+en su primer volcado cada proceso recoge los de los procesos muertos (y el de un proceso
+anterior con su mismo PID), los suma a los suyos como heredados y los borra.
+
+/metrics solo responde a administradores o con METRICAS_TOKEN en la cabecera
+Authorization: Bearer (bearer_token en la configuración de Prometheus).
+"""
+import atexit
+import hmac
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, JsonResponse
+
+# Cotas de los cubos de latencia, en segundos
+CUBOS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPCIONES = {
+    'playliga_peticiones_total': ('counter', 'Peticiones HTTP atendidas por vista, método y estado.'),
+    'playliga_peticion_duracion_segundos': ('histogram', 'Duración de las peticiones HTTP por vista.'),
+    'playliga_consultas_sql_total': ('counter', 'Consultas SQL ejecutadas por vista.'),
+    'playliga_tiempo_bd_segundos_total': ('counter', 'Tiempo acumulado en la base de datos por vista.'),
+    'playliga_apuestas_total': ('counter', 'Apuestas realizadas.'),
+    'playliga_monto_apostado_total': ('counter', 'Monto total apostado.'),
+    'playliga_partidos_simulados_total': ('counter', 'Partidos simulados.'),
+    'playliga_auth_cache_total': ('counter', 'Usuarios de la sesión servidos desde la caché (acierto) o la base de datos (fallo).'),
+    'playliga_auditoria_registros_total': ('counter', 'Registros de auditoría escritos por lotes o descartados por error.'),
+    'playliga_trabajos_total': ('counter', 'Ejecuciones de trabajos en segundo plano por tipo y resultado.'),
+    'playliga_trabajos_espera_segundos': ('histogram', 'Tiempo en cola desde que un trabajo está disponible hasta que un worker lo reclama.'),
+    'playliga_trabajos_duracion_segundos': ('histogram', 'Duración de la ejecución de los trabajos en segundo plano.'),
+    'playliga_peticiones_limitadas_total': ('counter', 'Peticiones de escritura rechazadas por límite de tasa (429) o de concurrencia (503).'),
+}
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.contadores = {}
+        self.histogramas = {}
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, tuple(sorted((k, str(v)) for k, v in etiquetas.items())))
+        with self.lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        clave = (nombre, tuple(sorted((k, str(v)) for k, v in etiquetas.items())))
+        with self.lock:
+            histograma = self.histogramas.get(clave)
+            if histograma is None:
+                # Un contador por cubo (no acumulado), más el cubo +Inf, la suma y el total
+                histograma = self.histogramas[clave] = [0] * (len(CUBOS_LATENCIA) + 1) + [0.0, 0]
+            histograma[bisect_left(CUBOS_LATENCIA, valor)] += 1
+            histograma[-2] += valor
+            histograma[-1] += 1
+
+    def exportar(self):
+        with self.lock:
+            return {
+                'contadores': [[n, list(e), v] for (n, e), v in self.contadores.items()],
+                'histogramas': [[n, list(e), list(h)] for (n, e), h in self.histogramas.items()],
+            }
+
+
+registro = RegistroMetricas()
+incrementar = registro.incrementar
+observar = registro.observar
+
+_ultimo_volcado = 0.0
+_cerrojo_volcado = threading.Lock()
+# Estado sumado de los procesos terminados que recogió este proceso (formato de exportar())
+_heredados = {'recogidos': False, 'estado': None}
+
+_ARCHIVO_PROCESO = re.compile(r'^metricas_(?P<pid>\d+)\.json$')
+
+
+def _ruta_proceso(directorio):
+    return os.path.join(directorio, f'metricas_{os.getpid()}.json')
+
+
+def _proceso_vivo(pid):
+    if os.name != 'posix':
+        # En Windows os.kill terminaría el proceso: solo se recoge el archivo del propio PID
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _recoger_terminados(directorio):
+    """
+    Suma a _heredados los archivos de procesos que ya no existen. Devuelve las rutas que
+    reclamó, para borrarlas cuando el volcado propio ya los incluya.
+    """
+    propio = os.getpid()
+    estados, reclamadas = [], []
+    for nombre in os.listdir(directorio):
+        coincidencia = _ARCHIVO_PROCESO.match(nombre)
+        if not coincidencia:
+            continue
+        pid = int(coincidencia['pid'])
+        # Antes del primer volcado, un archivo con nuestro PID es de un proceso anterior
+        if pid != propio and _proceso_vivo(pid):
+            continue
+        ruta = os.path.join(directorio, nombre)
+        reclamada = f'{ruta}.{propio}.recogido'
+        try:
+            # Solo un proceso gana el rename: ningún archivo se suma dos veces
+            os.rename(ruta, reclamada)
+        except OSError:
+            continue
+        reclamadas.append(reclamada)
+        try:
+            with open(reclamada, encoding='utf-8') as archivo:
+                estados.append(json.load(archivo))
+        except (OSError, ValueError):
+            continue
+    if estados:
+        if _heredados['estado']:
+            estados.append(_heredados['estado'])
+        _heredados['estado'] = _a_estado(*_combinar(estados))
+    return reclamadas
+
+
+def _reiniciar_tras_fork():
+    # El hijo no hereda los contadores del padre (ya están en su archivo) y recoge por su cuenta
+    global _cerrojo_volcado, _ultimo_volcado
+    registro.__init__()
+    _heredados.update(recogidos=False, estado=None)
+    _cerrojo_volcado = threading.Lock()
+    _ultimo_volcado = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+def volcar(forzar=False):
+    """Escribe el estado de este proceso en METRICAS_DIR (como mucho cada METRICAS_INTERVALO segundos)."""
+    global _ultimo_volcado
+    directorio = getattr(settings, 'METRICAS_DIR', None)
+    if not directorio:
+        return
+    # Con workers de hilos varias peticiones pueden llegar a la vez: solo una vuelca y las demás
+    # siguen sin esperar. Un volcado forzado (atexit) sí espera a que termine el que esté en curso.
+    if not _cerrojo_volcado.acquire(blocking=forzar):
+        return
+    try:
+        ahora = time.monotonic()
+        if not forzar and ahora - _ultimo_volcado < getattr(settings, 'METRICAS_INTERVALO', 5):
+            return
+        _ultimo_volcado = ahora
+        os.makedirs(directorio, exist_ok=True)
+        recogidos = []
+        if not _heredados['recogidos']:
+            recogidos = _recoger_terminados(directorio)
+            _heredados['recogidos'] = True
+        ruta = _ruta_proceso(directorio)
+        # Temporal propio del hilo: nunca se comparte a medio escribir aunque se fuerce otro volcado
+        temporal = f'{ruta}.{threading.get_ident()}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(_estado_propio(), archivo)
+        os.replace(temporal, ruta)
+        # Ya están sumados en nuestro archivo
+        for reclamada in recogidos:
+            try:
+                os.remove(reclamada)
+            except FileNotFoundError:
+                pass
+    finally:
+        _cerrojo_volcado.release()
+
+
+atexit.register(volcar, forzar=True)
+
+
+def _estado_propio():
+    estado = registro.exportar()
+    if _heredados['estado']:
+        return _a_estado(*_combinar([estado, _heredados['estado']]))
+    return estado
+
+
+def _estados_a_combinar():
+    estados = [_estado_propio()]
+    directorio = getattr(settings, 'METRICAS_DIR', None)
+    if not directorio or not os.path.isdir(directorio):
+        return estados
+    propio = _ruta_proceso(directorio)
+    for nombre in os.listdir(directorio):
+        ruta = os.path.join(directorio, nombre)
+        if _ARCHIVO_PROCESO.match(nombre) and ruta != propio:
+            try:
+                with open(ruta, encoding='utf-8') as archivo:
+                    estados.append(json.load(archivo))
+            except (OSError, ValueError):
+                continue
+    return estados
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(etiquetas, extra=None):
+    pares = list(etiquetas) + ([extra] if extra else [])
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{k}="{_escapar(v)}"' for k, v in pares) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _combinar(estados):
+    contadores = {}
+    histogramas = {}
+    for estado in estados:
+        for nombre, etiquetas, valor in estado['contadores']:
+            clave = (nombre, tuple(tuple(e) for e in etiquetas))
+            contadores[clave] = contadores.get(clave, 0) + valor
+        for nombre, etiquetas, valores in estado['histogramas']:
+            clave = (nombre, tuple(tuple(e) for e in etiquetas))
+            previo = histogramas.get(clave)
+            histogramas[clave] = valores if previo is None else [a + b for a, b in zip(previo, valores)]
+    return contadores, histogramas
+
+
+def _a_estado(contadores, histogramas):
+    return {
+        'contadores': [[n, [list(e) for e in etiquetas], v] for (n, etiquetas), v in contadores.items()],
+        'histogramas': [[n, [list(e) for e in etiquetas], list(h)] for (n, etiquetas), h in histogramas.items()],
+    }
+
+
+def formato_prometheus():
+    contadores, histogramas = _combinar(_estados_a_combinar())
+
+    series = {}
+    for (nombre, etiquetas), valor in sorted(contadores.items()):
+        series.setdefault(nombre, []).append(f'{nombre}{_etiquetas(etiquetas)} {_numero(valor)}')
+    for (nombre, etiquetas), valores in sorted(histogramas.items()):
+        lineas = series.setdefault(nombre, [])
+        acumulado = 0
+        for cota, cantidad in zip(CUBOS_LATENCIA + ('+Inf',), valores):
+            acumulado += cantidad
+            lineas.append(f'{nombre}_bucket{_etiquetas(etiquetas, ("le", cota))} {acumulado}')
+        lineas.append(f'{nombre}_sum{_etiquetas(etiquetas)} {_numero(valores[-2])}')
+        lineas.append(f'{nombre}_count{_etiquetas(etiquetas)} {valores[-1]}')
+
+    salida = []
+    for nombre in sorted(series):
+        tipo, ayuda = DESCRIPCIONES.get(nombre, ('untyped', nombre))
+        salida.append(f'# HELP {nombre} {ayuda}')
+        salida.append(f'# TYPE {nombre} {tipo}')
+        salida.extend(series[nombre])
+    return '\n'.join(salida) + '\n'
+
+
+def _autorizado(request):
+    token = getattr(settings, 'METRICAS_TOKEN', None)
+    cabecera = request.headers.get('Authorization', '')
+    if token and cabecera.startswith('Bearer ') and hmac.compare_digest(cabecera[len('Bearer '):].encode(), token.encode()):
+        return True
+    usuario = getattr(request, 'user', None)
+    return bool(usuario and usuario.is_authenticated and usuario.rol == 'admin')
+
+
+def vista_metricas(request):
+    if not _autorizado(request):
+        response = JsonResponse({'error': 'No autorizado'}, status=401)
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(formato_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class TiempoBaseDatos:
+    """execute_wrapper que cuenta las consultas de la petición y el tiempo pasado en ellas."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+class MetricasMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        bd = TiempoBaseDatos()
+        with connection.execute_wrapper(bd):
+            response = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        coincidencia = getattr(request, 'resolver_match', None)
+        vista = (coincidencia.url_name or coincidencia.view_name) if coincidencia else 'sin_resolver'
+        incrementar('playliga_peticiones_total', vista=vista, metodo=request.method, estado=response.status_code)
+        observar('playliga_peticion_duracion_segundos', duracion, vista=vista)
+        if bd.consultas:
+            incrementar('playliga_consultas_sql_total', bd.consultas, vista=vista)
+            incrementar('playliga_tiempo_bd_segundos_total', bd.segundos, vista=vista)
+        volcar()
+        return response
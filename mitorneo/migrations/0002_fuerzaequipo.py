@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mitorneo', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FuerzaEquipo',
+            fields=[
+                ('equipo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fuerza', serialize=False, to='mitorneo.equipo')),
+                ('jugadores', models.IntegerField(default=0)),
+                ('nivel_total', models.IntegerField(default=0)),
+                ('nivel_promedio', models.FloatField(default=0)),
+                ('nivel_maximo', models.IntegerField(default=0)),
+                ('nivel_por_posicion', models.JSONField(default=dict)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mitorneo', '0002_fuerzaequipo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoPartido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('gol', 'Gol'), ('asistencia', 'Asistencia'), ('tarjeta', 'Tarjeta'), ('aparicion', 'Aparición')], max_length=20)),
+                ('minuto', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('fecha_registro', models.DateTimeField(auto_now_add=True)),
+                ('jugador', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos', to='mitorneo.jugador')),
+                ('partido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos', to='mitorneo.partido')),
+                ('registrado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='eventos_registrados', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['partido', 'minuto', 'id'],
+                'indexes': [models.Index(fields=['partido', 'tipo'], name='mitorneo_ev_partido_e85fbf_idx'), models.Index(fields=['jugador', 'tipo'], name='mitorneo_ev_jugador_f288cf_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mitorneo', '0003_eventopartido'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='jugador',
+            index=models.Index(fields=['-goles', 'id'], name='jugador_goles_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jugador',
+            index=models.Index(fields=['-asistencias', 'id'], name='jugador_asist_desc_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+CAMPOS = ('nombre', 'apellido', 'correo')
+
+
+def crear_indices(apps, schema_editor):
+    # Los índices GIN de trigramas solo existen en PostgreSQL; en SQLite la búsqueda usa un
+    # índice en memoria (mitorneo/busqueda.py)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for campo in CAMPOS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS jugador_{campo}_trgm_idx '
+            f'ON mitorneo_jugador USING gin (lower({campo}) gin_trgm_ops)'
+        )
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for campo in CAMPOS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS jugador_{campo}_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mitorneo', '0004_indices_ranking_jugador'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
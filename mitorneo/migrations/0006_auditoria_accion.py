@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mitorneo', '0005_indices_trigramas_jugador'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditoriarol',
+            name='fecha_cambio',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='AuditoriaAccion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('accion', models.CharField(max_length=50)),
+                ('objeto', models.CharField(blank=True, max_length=100)),
+                ('detalles', models.JSONField(blank=True, default=dict)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='acciones_auditadas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['accion', 'fecha'], name='mitorneo_au_accion_a44590_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mitorneo', '0007_trabajo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='partido',
+            index=models.Index(fields=['simulado', 'fecha'], name='partido_simulado_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mitorneo', '0008_indice_partidos_pendientes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=255)),
+                ('huella', models.CharField(max_length=64)),
+                ('estado', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('tipo_contenido', models.CharField(blank=True, max_length=100)),
+                ('respuesta', models.TextField(blank=True)),
+                ('creada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['creada'], name='idempotencia_creada_idx')],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'clave'), name='idempotencia_usuario_clave_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mitorneo', '0009_clave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='partido',
+            name='intentos_simulacion',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='partido',
+            name='reintento_simulacion',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
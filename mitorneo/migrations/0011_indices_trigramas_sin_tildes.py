@@ -0,0 +1,46 @@
+from django.db import migrations
+
+CAMPOS = ('nombre', 'apellido', 'correo')
+# Debe quitar las mismas tildes que busqueda.normalizar (la ñ se conserva). translate() es
+# IMMUTABLE, a diferencia de unaccent(), así que sirve para un índice de expresión
+CON_TILDE = 'áàâäãåéèêëíìîïóòôöõúùûüýÿç'
+SIN_TILDE = 'aaaaaaeeeeiiiiooooouuuuyyc'
+
+
+def crear_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE OR REPLACE FUNCTION mitorneo_normalizar(texto text) RETURNS text '
+        f"AS $$ SELECT translate(lower(texto), '{CON_TILDE}', '{SIN_TILDE}') $$ "
+        'LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE'
+    )
+    for campo in CAMPOS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS jugador_{campo}_norm_trgm_idx '
+            f'ON mitorneo_jugador USING gin (mitorneo_normalizar({campo}) gin_trgm_ops)'
+        )
+        schema_editor.execute(f'DROP INDEX IF EXISTS jugador_{campo}_trgm_idx')
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for campo in CAMPOS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS jugador_{campo}_trgm_idx '
+            f'ON mitorneo_jugador USING gin (lower({campo}) gin_trgm_ops)'
+        )
+        schema_editor.execute(f'DROP INDEX IF EXISTS jugador_{campo}_norm_trgm_idx')
+    schema_editor.execute('DROP FUNCTION IF EXISTS mitorneo_normalizar(text)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mitorneo', '0010_reintentos_simulacion_partido'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:33
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mitorneo', '0011_indices_trigramas_sin_tildes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apuesta',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now(), db_index=True),
+        ),
+        migrations.AddField(
+            model_name='jugador',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now(), db_index=True),
+        ),
+        migrations.AddField(
+            model_name='partido',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now(), db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='recargasaldo',
+            name='fecha_recarga',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
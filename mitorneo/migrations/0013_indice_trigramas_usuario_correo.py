@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# La búsqueda compara el correo solo por la parte del usuario (busqueda._expresion_postgresql)
+USUARIO_CORREO = "split_part(mitorneo_normalizar(correo), '@', 1)"
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS jugador_correo_usuario_trgm_idx '
+        f'ON mitorneo_jugador USING gin (({USUARIO_CORREO}) gin_trgm_ops)'
+    )
+    schema_editor.execute('DROP INDEX IF EXISTS jugador_correo_norm_trgm_idx')
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS jugador_correo_norm_trgm_idx '
+        'ON mitorneo_jugador USING gin (mitorneo_normalizar(correo) gin_trgm_ops)'
+    )
+    schema_editor.execute('DROP INDEX IF EXISTS jugador_correo_usuario_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mitorneo', '0012_marcas_exportacion'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.db.models import Sum
+from django.db.models.functions import Now
+from django.utils import timezone
 
 # Roles de usuario con mejor estructura
 USER_ROLES = [
@@ -10,6 +12,47 @@ USER_ROLES = [
     ('apostador', 'Apostador'),
 ]
 
+# Posiciones normalizadas; Jugador.posicion es texto libre ("Delantero", "Defensa central"...)
+POSICIONES = [
+    ('portero', 'Portero'),
+    ('defensa', 'Defensa'),
+    ('medio', 'Mediocampista'),
+    ('delantero', 'Delantero'),
+]
+
+_PALABRAS_POSICION = [
+    ('portero', ('port', 'arquer', 'guardameta')),
+    ('medio', ('medi', 'volante', 'centrocamp', 'interior')),
+    ('delantero', ('delant', 'extremo', 'punta', 'ariete')),
+    ('defensa', ('defens', 'lateral', 'central', 'zaguer', 'carrilero')),
+]
+
+
+TIPOS_EVENTO = [
+    ('gol', 'Gol'),
+    ('asistencia', 'Asistencia'),
+    ('tarjeta', 'Tarjeta'),
+    ('aparicion', 'Aparición'),
+]
+
+ESTADOS_TRABAJO = [
+    ('pendiente', 'Pendiente'),
+    ('en_curso', 'En curso'),
+    ('completado', 'Completado'),
+    ('fallido', 'Fallido'),
+]
+
+
+def normalizar_posicion(posicion):
+    """Devuelve la clave de POSICIONES que corresponde al texto libre, o None."""
+    if not posicion:
+        return None
+    texto = posicion.strip().lower()
+    for clave, palabras in _PALABRAS_POSICION:
+        if any(p in texto for p in palabras):
+            return clave
+    return None
+
 # Usuario personalizado con rol mejorado
 class Usuario(AbstractUser):
     rol = models.CharField(max_length=20, choices=USER_ROLES, default='apostador')
@@ -44,6 +87,23 @@ class Equipo(models.Model):
         return self.nombre
 
 
+class FuerzaEquipo(models.Model):
+    """
+    Agregados de nivel de la plantilla de un equipo, mantenidos por las señales de Jugador
+    para que la probabilidad de un partido cueste una fila por equipo.
+    """
+    equipo = models.OneToOneField(Equipo, on_delete=models.CASCADE, primary_key=True, related_name='fuerza')
+    jugadores = models.IntegerField(default=0)
+    nivel_total = models.IntegerField(default=0)
+    nivel_promedio = models.FloatField(default=0)
+    nivel_maximo = models.IntegerField(default=0)
+    nivel_por_posicion = models.JSONField(default=dict)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Fuerza de {self.equipo_id}: {self.nivel_total}"
+
+
 class Arbitro(models.Model):
     usuario = models.OneToOneField(Usuario, on_delete=models.CASCADE)
     nombre = models.CharField(max_length=50)
@@ -67,10 +127,19 @@ class Jugador(models.Model):
     partidos_jugados = models.IntegerField(default=0)
     goles = models.IntegerField(default=0)
     asistencias = models.IntegerField(default=0)
+    # Marca de las exportaciones incrementales; quien actualice con .update() o bulk_update la pone
+    actualizado = models.DateTimeField(auto_now=True, db_default=Now(), db_index=True)
 
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
 
+    class Meta:
+        # Rankings de goleadores y asistentes ordenados por (valor desc, id) con paginación por clave
+        indexes = [
+            models.Index(fields=['-goles', 'id'], name='jugador_goles_desc_idx'),
+            models.Index(fields=['-asistencias', 'id'], name='jugador_asist_desc_idx'),
+        ]
+
 
 class Partido(models.Model):
     fecha = models.DateTimeField()
@@ -82,10 +151,40 @@ class Partido(models.Model):
     simulado = models.BooleanField(default=False)
     ganador = models.ForeignKey(Equipo, on_delete=models.SET_NULL, null=True, blank=True, related_name='partidos_ganados')
     resultado = models.CharField(max_length=20, null=True, blank=True)
+    # Fallos de la simulación automática (simular_programados) y cuándo reintentarla
+    intentos_simulacion = models.PositiveIntegerField(default=0)
+    reintento_simulacion = models.DateTimeField(null=True, blank=True)
+    # Marca de las exportaciones incrementales; quien actualice con .update() o bulk_update la pone
+    actualizado = models.DateTimeField(auto_now=True, db_default=Now(), db_index=True)
 
     def __str__(self):
         return f"{self.equipo_local} vs {self.equipo_visitante} - {self.fecha.strftime('%d/%m/%Y %H:%M')}"
 
+    class Meta:
+        indexes = [
+            # Partidos pendientes por hora de inicio: el programador (simular_programados) y apuestas
+            models.Index(fields=['simulado', 'fecha'], name='partido_simulado_fecha_idx'),
+        ]
+
+
+class EventoPartido(models.Model):
+    partido = models.ForeignKey(Partido, on_delete=models.CASCADE, related_name='eventos')
+    jugador = models.ForeignKey(Jugador, on_delete=models.CASCADE, related_name='eventos')
+    tipo = models.CharField(max_length=20, choices=TIPOS_EVENTO)
+    minuto = models.PositiveSmallIntegerField(null=True, blank=True)
+    registrado_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='eventos_registrados')
+    fecha_registro = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} de {self.jugador} en {self.partido}"
+
+    class Meta:
+        ordering = ['partido', 'minuto', 'id']
+        indexes = [
+            models.Index(fields=['partido', 'tipo']),
+            models.Index(fields=['jugador', 'tipo']),
+        ]
+
 
 class Apuesta(models.Model):
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='apuestas')
@@ -94,6 +193,8 @@ class Apuesta(models.Model):
     monto = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     fecha_apuesta = models.DateTimeField(auto_now_add=True)
     ganador = models.BooleanField(default=False)
+    # Marca de las exportaciones incrementales: cambia al liquidar la apuesta
+    actualizado = models.DateTimeField(auto_now=True, db_default=Now(), db_index=True)
 
     def __str__(self):
         return f"Apuesta de {self.usuario.username} en {self.equipo.nombre} por {self.monto}"
@@ -108,7 +209,8 @@ class RecargaSaldo(models.Model):
     monto = models.DecimalField(max_digits=10, decimal_places=2)
     metodo_pago = models.CharField(max_length=50)
     datos_pago = models.TextField(blank=True, null=True)
-    fecha_recarga = models.DateTimeField(auto_now_add=True)
+    # Las recargas no cambian: la fecha es la marca de las exportaciones incrementales
+    fecha_recarga = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
         return f"Recarga de {self.monto} por {self.usuario.username} via {self.metodo_pago}"
@@ -118,8 +220,78 @@ class AuditoriaRol(models.Model):
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
     rol_anterior = models.CharField(max_length=20, choices=USER_ROLES)
     rol_nuevo = models.CharField(max_length=20, choices=USER_ROLES)
-    fecha_cambio = models.DateTimeField(auto_now_add=True)
+    # La fecha del cambio, no la del volcado por lotes (auditoria.py): auto_now_add la pisaría
+    fecha_cambio = models.DateTimeField(default=timezone.now)
     cambiado_por = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='auditorias_realizadas', null=True, blank=True)
 
     def __str__(self):
-        return f"{self.usuario.username}: {self.rol_anterior} → {self.rol_nuevo} por {self.cambiado_por.username if self.cambiado_por else 'Sistema'}"
\ No newline at end of file
+        return f"{self.usuario.username}: {self.rol_anterior} → {self.rol_nuevo} por {self.cambiado_por.username if self.cambiado_por else 'Sistema'}"
+
+
+class AuditoriaAccion(models.Model):
+    """Acción sensible de un administrador (crear o simular partidos, importar, exportar...)."""
+    usuario = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='acciones_auditadas')
+    accion = models.CharField(max_length=50)
+    objeto = models.CharField(max_length=100, blank=True)
+    detalles = models.JSONField(default=dict, blank=True)
+    fecha = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.accion} {self.objeto} por {self.usuario.username if self.usuario else 'Sistema'}"
+
+    class Meta:
+        ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['accion', 'fecha']),
+        ]
+
+
+class Trabajo(models.Model):
+    """Trabajo de la cola en segundo plano (trabajos.py), ejecutado por run_workers."""
+    tipo = models.CharField(max_length=50)
+    argumentos = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS_TRABAJO, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=5)
+    # Tras un fallo, el reintento espera hasta aquí (backoff exponencial)
+    disponible_desde = models.DateTimeField(default=timezone.now)
+    creado = models.DateTimeField(default=timezone.now)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+    trabajador = models.CharField(max_length=100, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.tipo} #{self.id} ({self.estado})"
+
+    class Meta:
+        indexes = [
+            # Los workers buscan los pendientes ya disponibles, los más antiguos primero
+            models.Index(fields=['estado', 'disponible_desde', 'id'], name='trabajo_cola_idx'),
+        ]
+
+
+class ClaveIdempotencia(models.Model):
+    """Primera respuesta a un POST con cabecera Idempotency-Key (idempotencia.py)."""
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='+')
+    clave = models.CharField(max_length=255)
+    # sha256 de método, ruta y cuerpo: reutilizar la clave con otra petición es un error del cliente
+    huella = models.CharField(max_length=64)
+    # Sin estado, la primera petición sigue en curso
+    estado = models.PositiveSmallIntegerField(null=True, blank=True)
+    tipo_contenido = models.CharField(max_length=100, blank=True)
+    respuesta = models.TextField(blank=True)
+    creada = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.clave} ({self.estado or 'en curso'})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='idempotencia_usuario_clave_uniq'),
+        ]
+        indexes = [
+            # purgar_idempotencia borra por antigüedad
+            models.Index(fields=['creada'], name='idempotencia_creada_idx'),
+        ]
@@ -0,0 +1,90 @@
+"""
+Caché de los paneles de jugador, árbitro y apuestas.
+
+La lista de partidos de un equipo o de un árbitro se cachea como fragmento de plantilla
+({% cache %}) con una clave que incluye la versión de ese equipo o árbitro: al guardar o borrar
+un partido (signals.py) se incrementa la versión de sus equipos y su árbitro, así que la
+siguiente visita vuelve a renderizar y las claves viejas caducan solas. Una versión global
+invalida todo de una vez (importaciones, cambios de nombre de equipo).
+
+Los próximos partidos de la página de apuestas se cachean como lista y se filtran por fecha al
+leerlos, de modo que un partido que empieza desaparece sin invalidar nada.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Partido
+
+
+def timeout():
+    return getattr(settings, 'PANELES_CACHE_TIMEOUT', 3600)
+
+
+def _clave_version(tipo, ident):
+    return f'paneles:version:{tipo}:{ident}'
+
+
+def _version(tipo, ident):
+    clave = _clave_version(tipo, ident)
+    version = cache.get(clave)
+    if version is None:
+        # Si la caché expulsa la versión, la nueva no coincide con ninguna anterior
+        version = time.time_ns()
+        if not cache.add(clave, version, None):
+            version = cache.get(clave, version)
+    return version
+
+
+def _incrementar(tipo, idents):
+    for ident in idents:
+        try:
+            cache.incr(_clave_version(tipo, ident))
+        except ValueError:
+            cache.set(_clave_version(tipo, ident), time.time_ns(), None)
+
+
+def clave_equipo(equipo_id):
+    """Clave para {% cache %} del fragmento de partidos de un equipo (o de "sin equipo")."""
+    return f'{_version("global", 0)}.{_version("equipo", equipo_id or 0)}'
+
+
+def clave_arbitro(arbitro_id):
+    return f'{_version("global", 0)}.{_version("arbitro", arbitro_id)}'
+
+
+def invalidar_partido(equipo_ids, arbitro_ids):
+    """Nueva versión para los equipos y árbitros de un partido, tras el commit."""
+    equipo_ids = {e for e in equipo_ids if e}
+    arbitro_ids = {a for a in arbitro_ids if a}
+
+    def invalidar():
+        _incrementar('equipo', equipo_ids)
+        _incrementar('arbitro', arbitro_ids)
+        _incrementar('proximos', [0])
+
+    transaction.on_commit(invalidar)
+
+
+def invalidar_todo():
+    transaction.on_commit(lambda: _incrementar('global', [0]))
+
+
+def proximos_partidos():
+    """Partidos sin simular que aún no han empezado, como dicts ordenados por fecha."""
+    clave = f'paneles:proximos:{_version("global", 0)}.{_version("proximos", 0)}'
+    partidos = cache.get(clave)
+    if partidos is None:
+        # Con la misma forma que un Partido para la plantilla (partido.equipo_local.nombre)
+        partidos = [
+            {'id': id_, 'fecha': fecha, 'equipo_local': {'nombre': local}, 'equipo_visitante': {'nombre': visitante}}
+            for id_, fecha, local, visitante in Partido.objects.filter(simulado=False, fecha__gt=timezone.now())
+            .order_by('fecha')
+            .values_list('id', 'fecha', 'equipo_local__nombre', 'equipo_visitante__nombre')
+        ]
+        cache.set(clave, partidos, timeout())
+    ahora = timezone.now()
+    return [p for p in partidos if p['fecha'] > ahora]
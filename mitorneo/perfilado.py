@@ -0,0 +1,115 @@
+"""
+Perfilado bajo demanda de peticiones reales con cProfile.
+
+Se perfila una petición cuando un administrador envía la cabecera X-Perfilar o, al azar,
+con probabilidad PERFILADO_MUESTREO. Cada perfil se guarda en PERFILADO_DIR como archivo
+.prof (abrible con pstats, snakeviz...) junto a un resumen .txt, y solo se conservan los
+PERFILADO_MAX_ARCHIVOS más recientes.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import time
+from datetime import datetime
+
+from django.conf import settings
+
+_NOMBRE_PERFIL = re.compile(r'^(?P<fecha>\d{8}-\d{6}-\d{6})_(?P<vista>[\w.:-]+)_(?P<ms>\d+)ms\.prof$')
+
+
+def directorio_perfiles():
+    return str(getattr(settings, 'PERFILADO_DIR', os.path.join(settings.BASE_DIR, 'perfiles')))
+
+
+def _debe_perfilar(request):
+    if request.META.get('HTTP_X_PERFILAR'):
+        usuario = getattr(request, 'user', None)
+        return bool(usuario and usuario.is_authenticated and usuario.rol == 'admin')
+    muestreo = getattr(settings, 'PERFILADO_MUESTREO', 0)
+    return muestreo > 0 and random.random() < muestreo
+
+
+def _rotar(directorio):
+    maximo = getattr(settings, 'PERFILADO_MAX_ARCHIVOS', 200)
+    perfiles = sorted(n for n in os.listdir(directorio) if _NOMBRE_PERFIL.match(n))
+    for nombre in perfiles[:max(0, len(perfiles) - maximo)]:
+        for ruta in (nombre, nombre[:-len('.prof')] + '.txt'):
+            try:
+                os.remove(os.path.join(directorio, ruta))
+            except FileNotFoundError:
+                pass
+
+
+def guardar_perfil(perfil, vista, duracion, request):
+    directorio = directorio_perfiles()
+    os.makedirs(directorio, exist_ok=True)
+    vista = re.sub(r'[^\w.:-]', '_', vista)
+    base = f'{datetime.now():%Y%m%d-%H%M%S-%f}_{vista}_{int(duracion * 1000)}ms'
+    perfil.dump_stats(os.path.join(directorio, base + '.prof'))
+
+    resumen = io.StringIO()
+    resumen.write(f'{request.method} {request.get_full_path()}\n{duracion * 1000:.1f} ms\n\n')
+    pstats.Stats(perfil, stream=resumen).strip_dirs().sort_stats('cumulative').print_stats(40)
+    with open(os.path.join(directorio, base + '.txt'), 'w', encoding='utf-8') as archivo:
+        archivo.write(resumen.getvalue())
+
+    _rotar(directorio)
+    return base + '.prof'
+
+
+def listar_perfiles():
+    """Perfiles guardados, del más reciente al más antiguo."""
+    directorio = directorio_perfiles()
+    if not os.path.isdir(directorio):
+        return []
+    perfiles = []
+    for nombre in sorted(os.listdir(directorio), reverse=True):
+        coincidencia = _NOMBRE_PERFIL.match(nombre)
+        if coincidencia:
+            perfiles.append({
+                'archivo': nombre,
+                'resumen': nombre[:-len('.prof')] + '.txt',
+                'fecha': datetime.strptime(coincidencia['fecha'], '%Y%m%d-%H%M%S-%f'),
+                'vista': coincidencia['vista'],
+                'duracion_ms': int(coincidencia['ms']),
+            })
+    return perfiles
+
+
+def ruta_perfil(nombre):
+    """Ruta de un archivo de perfil o resumen, o None si el nombre no es válido."""
+    base = nombre[:-len('.txt')] + '.prof' if nombre.endswith('.txt') else nombre
+    if not _NOMBRE_PERFIL.match(base):
+        return None
+    ruta = os.path.join(directorio_perfiles(), nombre)
+    return ruta if os.path.isfile(ruta) else None
+
+
+class PerfiladoMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _debe_perfilar(request):
+            return self.get_response(request)
+
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Ya hay otro perfilador activo en este hilo
+            return self.get_response(request)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            perfil.disable()
+        duracion = time.perf_counter() - inicio
+
+        coincidencia = getattr(request, 'resolver_match', None)
+        vista = (coincidencia.url_name or coincidencia.view_name) if coincidencia else 'sin_resolver'
+        response['X-Perfil'] = guardar_perfil(perfil, vista, duracion, request)
+        return response
@@ -0,0 +1,169 @@
+"""
+Rankings de goleadores y asistentes.
+
+El top RANKING_TOP_N de cada estadística se guarda en caché y, cuando cambian las estadísticas
+de unos jugadores, se corrige en el sitio (se quitan esos jugadores y se vuelven a insertar con
+su valor nuevo) en lugar de volver a ordenar la tabla de jugadores. Solo si un jugador del top
+baja y deja un hueco que podría ocupar alguien de fuera se descarta y se recalcula al pedirlo.
+Más allá del top se pagina por clave (valor, id) sobre los índices descendentes de Jugador.
+
+Corregir es leer, modificar y escribir: dos commits simultáneos perderían una corrección. Por eso
+las correcciones y la reconstrucción del top se hacen con un cerrojo en la caché (cache.add); quien
+no lo consigue descarta el top y lo marca como sucio, para que una reconstrucción en curso, que
+pudo leer los valores de antes del commit, tampoco lo deje guardado.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Jugador
+
+ESTADISTICAS = ('goles', 'asistencias')
+MAX_LIMITE = 100
+# Segundos tras los que caduca el cerrojo de un proceso que murió con él
+CERROJO_TIMEOUT = 10
+
+
+def _top_n():
+    return getattr(settings, 'RANKING_TOP_N', 50)
+
+
+def _clave(campo):
+    return f'ranking:{campo}'
+
+
+def _tomar_cerrojo(campo):
+    return cache.add(f'{_clave(campo)}:cerrojo', 1, CERROJO_TIMEOUT)
+
+
+def _soltar_cerrojo(campo):
+    cache.delete(f'{_clave(campo)}:cerrojo')
+
+
+def _descartar(campo):
+    cache.set(f'{_clave(campo)}:sucio', 1, CERROJO_TIMEOUT)
+    cache.delete(_clave(campo))
+
+
+def _consulta(campo):
+    # Solo entran jugadores con al menos un gol (o asistencia)
+    return (
+        Jugador.objects.filter(**{f'{campo}__gt': 0})
+        .order_by(f'-{campo}', 'id')
+        .values('id', 'nombre', 'apellido', 'equipo_id', 'equipo__nombre', campo)
+    )
+
+
+def _fila(valores, campo):
+    return {
+        'id': valores['id'],
+        'nombre': valores['nombre'],
+        'apellido': valores['apellido'],
+        'equipo_id': valores['equipo_id'],
+        'equipo': valores['equipo__nombre'],
+        'valor': valores[campo],
+    }
+
+
+def _orden(fila):
+    return (-fila['valor'], fila['id'])
+
+
+def top(campo):
+    """Top RANKING_TOP_N de la estadística, desde la caché si está."""
+    filas = cache.get(_clave(campo))
+    if filas is not None:
+        return filas
+    if not _tomar_cerrojo(campo):
+        # Otro proceso lo está reconstruyendo o corrigiendo: se sirve sin guardarlo
+        return [_fila(v, campo) for v in _consulta(campo)[:_top_n()]]
+    try:
+        cache.delete(f'{_clave(campo)}:sucio')
+        filas = [_fila(v, campo) for v in _consulta(campo)[:_top_n()]]
+        cache.set(_clave(campo), filas, getattr(settings, 'RANKING_TIMEOUT', 600))
+        if cache.get(f'{_clave(campo)}:sucio'):
+            # Una corrección llegó mientras se leía: estas filas pueden ser de antes de su commit
+            cache.delete(_clave(campo))
+    finally:
+        _soltar_cerrojo(campo)
+    return filas
+
+
+def pagina(campo, limite=20, despues=None):
+    """
+    Devuelve (filas, cursor_siguiente). `despues` es el cursor (valor, id) de la última fila vista;
+    las páginas que caen dentro del top se sirven de la caché.
+    """
+    filas = top(campo)
+    if despues is not None:
+        filas = [f for f in filas if _orden(f) > (-despues[0], despues[1])]
+    if len(filas) < limite and len(top(campo)) >= _top_n():
+        # La página se sale del top cacheado: el resto se lee por clave sobre el índice
+        ultimo = filas[-1] if filas else ({'valor': despues[0], 'id': despues[1]} if despues else None)
+        consulta = _consulta(campo)
+        if ultimo is not None:
+            consulta = consulta.filter(**{f'{campo}__lte': ultimo['valor']}).exclude(
+                **{campo: ultimo['valor'], 'id__lte': ultimo['id']}
+            )
+        filas = filas + [_fila(v, campo) for v in consulta[:limite - len(filas)]]
+    filas = filas[:limite]
+    siguiente = (filas[-1]['valor'], filas[-1]['id']) if len(filas) == limite else None
+    return filas, siguiente
+
+
+def _parchear(campo, jugadores):
+    if not _tomar_cerrojo(campo):
+        # Otra corrección o reconstrucción en curso: corregir ahora perdería una de las dos
+        _descartar(campo)
+        return
+    try:
+        _parchear_con_cerrojo(campo, jugadores)
+    finally:
+        _soltar_cerrojo(campo)
+
+
+def _parchear_con_cerrojo(campo, jugadores):
+    filas = cache.get(_clave(campo))
+    if filas is None:
+        return
+    n = _top_n()
+    lleno = len(filas) >= n
+    ultimo = filas[-1] if filas else None
+    nuevas = [f for f in filas if f['id'] not in jugadores]
+    for valores in jugadores.values():
+        fila = _fila(valores, campo)
+        # Con el top lleno solo entra quien supera al último; si no, cualquiera con valor > 0
+        if fila['valor'] > 0 and (not lleno or _orden(fila) < _orden(ultimo)):
+            nuevas.append(fila)
+    nuevas.sort(key=_orden)
+    if lleno and len(nuevas) < n:
+        # Alguien del top bajó o desapareció: su hueco podría ocuparlo un jugador de fuera
+        cache.delete(_clave(campo))
+        return
+    cache.set(_clave(campo), nuevas[:n], getattr(settings, 'RANKING_TIMEOUT', 600))
+
+
+def actualizar(jugador_ids):
+    """Corrige los tops cacheados con los valores actuales de esos jugadores (una consulta)."""
+    jugador_ids = set(jugador_ids)
+    campos = list(ESTADISTICAS)
+    jugadores = {
+        v['id']: v for v in Jugador.objects.filter(id__in=jugador_ids)
+        .values('id', 'nombre', 'apellido', 'equipo_id', 'equipo__nombre', *campos)
+    }
+    # Los que ya no existen quedan fuera del top con valor 0
+    for jugador_id in jugador_ids - set(jugadores):
+        jugadores[jugador_id] = dict.fromkeys(('nombre', 'apellido', 'equipo_id', 'equipo__nombre'), None)
+        jugadores[jugador_id].update(dict.fromkeys(campos, 0), id=jugador_id)
+    for campo in ESTADISTICAS:
+        _parchear(campo, jugadores)
+
+
+def actualizar_al_confirmar(jugador_ids):
+    """Como actualizar(), pero tras el commit: si la transacción se deshace la caché no cambia."""
+    jugador_ids = list(jugador_ids)
+    transaction.on_commit(lambda: actualizar(jugador_ids))
+
+
+def invalidar():
+    cache.delete_many([_clave(c) for c in ESTADISTICAS])
@@ -0,0 +1,89 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import auditoria, busqueda, mercados, paneles, rankings
+from .autenticacion import invalidar_usuarios
+from .eventos import anular_eventos
+from .fuerzas import recalcular_fuerzas
+from .models import Equipo, Jugador, Partido, Usuario
+
+
+@receiver(post_init, sender=Jugador)
+def recordar_equipo_original(sender, instance, **kwargs):
+    # Guardamos el equipo al cargar para saber, al guardar, si el jugador cambió de equipo
+    instance._equipo_id_original = instance.__dict__.get('equipo_id')
+
+
+@receiver(post_save, sender=Jugador)
+def actualizar_agregados_al_guardar_jugador(sender, instance, **kwargs):
+    recalcular_fuerzas([instance.equipo_id, instance._equipo_id_original])
+    instance._equipo_id_original = instance.equipo_id
+    rankings.actualizar_al_confirmar([instance.id])
+    # Al confirmar: otro proceso podría reconstruir el índice con los datos de antes del commit
+    transaction.on_commit(busqueda.invalidar)
+
+
+@receiver(post_delete, sender=Jugador)
+def actualizar_agregados_al_borrar_jugador(sender, instance, **kwargs):
+    recalcular_fuerzas([instance.equipo_id, instance._equipo_id_original])
+    rankings.actualizar_al_confirmar([instance.id])
+    transaction.on_commit(busqueda.invalidar)
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_usuario_en_cache(sender, instance, **kwargs):
+    # Rol, contraseña, saldo_real...: la siguiente petición vuelve a leer el usuario
+    invalidar_usuarios([instance.pk])
+
+
+@receiver(post_init, sender=Usuario)
+def recordar_rol_original(sender, instance, **kwargs):
+    # None si el rol no se cargó (.only()/.defer()): entonces no se audita
+    instance._rol_original = instance.__dict__.get('rol')
+
+
+@receiver(post_save, sender=Usuario)
+def auditar_cambio_de_rol(sender, instance, created, **kwargs):
+    anterior = instance._rol_original
+    if not created and anterior is not None and anterior != instance.rol:
+        auditoria.registrar_cambio_rol(instance.pk, anterior, instance.rol)
+    instance._rol_original = instance.rol
+
+
+@receiver(post_init, sender=Partido)
+def recordar_participantes_originales(sender, instance, **kwargs):
+    # Equipos y árbitro al cargar: si cambian, también hay que invalidar los paneles anteriores
+    instance._participantes_originales = (
+        instance.__dict__.get('equipo_local_id'),
+        instance.__dict__.get('equipo_visitante_id'),
+        instance.__dict__.get('arbitro_id'),
+    )
+
+
+@receiver(post_save, sender=Partido)
+@receiver(post_delete, sender=Partido)
+def invalidar_paneles_del_partido(sender, instance, **kwargs):
+    local, visitante, arbitro = instance._participantes_originales
+    paneles.invalidar_partido(
+        [instance.equipo_local_id, instance.equipo_visitante_id, local, visitante],
+        [instance.arbitro_id, arbitro],
+    )
+    instance._participantes_originales = (instance.equipo_local_id, instance.equipo_visitante_id, instance.arbitro_id)
+    # Partido creado, reprogramado, simulado o borrado: los workers recargan los mercados
+    mercados.invalidar()
+
+
+@receiver(pre_delete, sender=Partido)
+def anular_eventos_del_partido(sender, instance, **kwargs):
+    # El CASCADE borraría los eventos sin descontarlos de goles, asistencias y rankings; también
+    # cuando el partido cae por borrar uno de sus equipos
+    anular_eventos(instance)
+
+
+@receiver(post_save, sender=Equipo)
+@receiver(post_delete, sender=Equipo)
+def invalidar_paneles_del_equipo(sender, instance, **kwargs):
+    # El nombre aparece en los paneles de los rivales: se invalidan todos
+    paneles.invalidar_todo()
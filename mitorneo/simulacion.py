@@ -0,0 +1,151 @@
+"""
+Simulación de partidos: marcador ponderado por la fuerza de las plantillas, eventos de los
+jugadores y liquidación de las apuestas. La usan api_simular_partido (en la petición o
+encolada en trabajos.py) y el comando simular_programados, que simula por lotes los partidos
+cuya hora de inicio ya pasó.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from . import metricas
+from .eventos import anular_eventos, generar_eventos, registrar_eventos, titulares_por_equipo
+from .fuerzas import obtener_fuerzas, simular_goles
+from .models import Apuesta, EventoPartido, Partido
+
+logger = logging.getLogger(__name__)
+
+
+class EventosDeArbitro(Exception):
+    pass
+
+
+def _eventos_de_arbitro():
+    return EventoPartido.objects.filter(registrado_por__isnull=False)
+
+
+def tiene_eventos_de_arbitro(partido):
+    return _eventos_de_arbitro().filter(partido=partido).exists()
+
+
+def simular_partido(partido, rng=random, fuerzas=None, titulares=None):
+    """
+    Simula `partido` (con equipo_local y equipo_visitante cargados) y liquida sus apuestas.
+    `fuerzas` y `titulares` precargados evitan consultarlos por partido al simular muchos.
+    Devuelve el resumen que responde la API. Un partido con eventos registrados por su árbitro
+    no se simula (EventosDeArbitro): el marcador simulado no cuadraría con ellos.
+    """
+    if tiene_eventos_de_arbitro(partido):
+        raise EventosDeArbitro(f'El partido {partido.id} tiene eventos registrados por el árbitro.')
+    if fuerzas is None:
+        fuerzas = obtener_fuerzas([partido.equipo_local_id, partido.equipo_visitante_id])
+    goles_local, goles_visitante = simular_goles(fuerzas[partido.equipo_local_id], fuerzas[partido.equipo_visitante_id], rng)
+
+    partido.goles_local = goles_local
+    partido.goles_visitante = goles_visitante
+    partido.simulado = True
+    if goles_local > goles_visitante:
+        partido.ganador = partido.equipo_local
+    elif goles_visitante > goles_local:
+        partido.ganador = partido.equipo_visitante
+    else:
+        partido.ganador = None
+
+    with transaction.atomic():
+        partido.save()
+        # Goles, asistencias y apariciones de los jugadores; re-simular reemplaza los simulados
+        anular_eventos(partido, solo_simulados=True)
+        eventos = registrar_eventos(generar_eventos(partido, goles_local, goles_visitante, rng, titulares))
+        # Liquidar apuestas
+        ahora = timezone.now()
+        Apuesta.objects.filter(partido=partido).update(ganador=False, actualizado=ahora)
+        if partido.ganador:
+            Apuesta.objects.filter(partido=partido, equipo=partido.ganador).update(ganador=True)
+    metricas.incrementar('playliga_partidos_simulados_total')
+
+    return {
+        'success': True,
+        'partido_id': partido.id,
+        'goles_local': goles_local,
+        'goles_visitante': goles_visitante,
+        'equipo_local': partido.equipo_local.nombre,
+        'equipo_visitante': partido.equipo_visitante.nombre,
+        'ganador': partido.ganador.nombre if partido.ganador else 'Empate',
+        'eventos': len(eventos),
+        'mensaje': 'Partido simulado exitosamente.',
+    }
+
+
+def cargar_partido(partido_id):
+    return Partido.objects.select_related('equipo_local', 'equipo_visitante').get(id=partido_id)
+
+
+def _vencidos(ahora):
+    # Índice (simulado, fecha): solo recorre los pendientes ya empezados. Los que fallaron
+    # esperan su reintento para no ocupar la cabeza de todos los lotes, y los que ya tienen
+    # eventos del árbitro no se simulan
+    return Partido.objects.filter(simulado=False, fecha__lte=ahora).filter(
+        Q(reintento_simulacion__isnull=True) | Q(reintento_simulacion__lte=ahora)
+    ).exclude(Exists(_eventos_de_arbitro().filter(partido=OuterRef('pk'))))
+
+
+def backoff(intentos):
+    """Segundos hasta reintentar la simulación de un partido tras `intentos` fallos."""
+    base = getattr(settings, 'SIMULACION_BACKOFF_BASE', 60)
+    maximo = getattr(settings, 'SIMULACION_BACKOFF_MAX', 3600)
+    return min(base * 2 ** (intentos - 1), maximo)
+
+
+def _registrar_fallo(partido, ahora):
+    intentos = partido.intentos_simulacion + 1
+    Partido.objects.filter(id=partido.id, simulado=False).update(
+        intentos_simulacion=F('intentos_simulacion') + 1,
+        reintento_simulacion=ahora + timedelta(seconds=backoff(intentos)),
+    )
+
+
+def simular_vencidos(lote=100, ahora=None, rng=random):
+    """
+    Simula hasta `lote` partidos sin simular cuya fecha ya pasó, los más antiguos primero.
+    Fuerzas y titulares se cargan una vez para todo el lote. Cada partido se reclama con un
+    UPDATE condicional dentro de su transacción, así que dos programadores a la vez no simulan
+    el mismo. Un partido que falla se aparta con backoff exponencial (intentos_simulacion,
+    reintento_simulacion). Devuelve (partidos simulados, cuántos fallaron).
+    """
+    ahora = ahora or timezone.now()
+    partidos = list(
+        _vencidos(ahora).select_related('equipo_local', 'equipo_visitante').order_by('fecha', 'id')[:lote]
+    )
+    if not partidos:
+        return [], 0
+    equipo_ids = list({e for p in partidos for e in (p.equipo_local_id, p.equipo_visitante_id)})
+    fuerzas = obtener_fuerzas(equipo_ids)
+    titulares = titulares_por_equipo(equipo_ids)
+
+    simulados, fallidos = [], 0
+    for partido in partidos:
+        try:
+            with transaction.atomic():
+                if not Partido.objects.filter(id=partido.id, simulado=False).update(simulado=True):
+                    continue
+                simular_partido(partido, rng, fuerzas, titulares)
+            simulados.append(partido)
+        except Exception:
+            # Un partido que falla no detiene al resto del lote; se reintenta más tarde
+            logger.exception('No se pudo simular el partido %s (intento %s)', partido.id, partido.intentos_simulacion + 1)
+            _registrar_fallo(partido, ahora)
+            fallidos += 1
+    return simulados, fallidos
+
+
+def proximo_inicio(ahora=None):
+    """Fecha del siguiente partido sin simular que aún no ha empezado, o None."""
+    return (
+        Partido.objects.filter(simulado=False, fecha__gt=ahora or timezone.now())
+        .order_by('fecha').values_list('fecha', flat=True).first()
+    )
@@ -1,6 +1,7 @@
-function calcularProbabilidades(jugadoresLocal, jugadoresVisitante, equipo1, equipo2) {
-    const sumaLocal = jugadoresLocal.reduce((total, jugador) => total + parseInt(jugador.nivel), 0);
-    const sumaVisitante = jugadoresVisitante.reduce((total, jugador) => total + parseInt(jugador.nivel), 0);
+// fuerzaLocal / fuerzaVisitante: agregados de /torneo/api/equipo/<id>/fuerza/
+function calcularProbabilidades(fuerzaLocal, fuerzaVisitante, equipo1, equipo2) {
+    const sumaLocal = fuerzaLocal.nivel_total;
+    const sumaVisitante = fuerzaVisitante.nivel_total;
     const total = sumaLocal + sumaVisitante;
 
     const probLocal = total === 0 ? 50 : Math.round((sumaLocal / total) * 100);
@@ -13,24 +14,29 @@ function calcularProbabilidades(jugadoresLocal, jugadoresVisitante, equipo1, equ
     document.getElementById('equipo2-barra').style.width = probVisitante + '%';
 }
 
-function generarCombinacionesAlineacion(nombresLocal, nombresVisitante) {
-  const posiciones = ["Delantero", "Mediocentro", "Defensa"];
-  const contenedor = document.getElementById("combinaciones");
-
-  contenedor.innerHTML = ""; // Limpiar para mostrar nuevas combinaciones
+// alineacionLocal / alineacionVisitante: respuestas de /torneo/api/equipo/<id>/alineacion/
+function generarCombinacionesAlineacion(alineacionLocal, alineacionVisitante, equipo1, equipo2) {
+  const nombresPosicion = {
+    portero: "Portero",
+    defensa: "Defensa",
+    medio: "Mediocentro",
+    delantero: "Delantero",
+  };
+  const contenedor = document.getElementById("alineaciones");
 
-  const crearLista = (jugadores, titulo) => {
-    const div = document.createElement("div");
-    div.innerHTML = `<h3>${titulo}</h3>`;
-    jugadores.forEach(nombre => {
-      const posicion = posiciones[Math.floor(Math.random() * posiciones.length)];
-      const p = document.createElement("p");
-      p.textContent = `${nombre} - Alineación: ${posicion}`;
-      div.appendChild(p);
+  const generarHTML = (nombreEquipo, alineacion) => {
+    if (alineacion.error) {
+      return `<h3>${nombreEquipo}</h3><p>${alineacion.error}</p>`;
+    }
+    let html = `<h3>${nombreEquipo} — ${alineacion.formacion} (fuerza ${alineacion.fuerza})</h3><ul>`;
+    alineacion.titulares.forEach(jugador => {
+      const aviso = jugador.valor === jugador.nivel ? "" : " (fuera de posición)";
+      html += `<li>${jugador.nombre} ${jugador.apellido} — Alineación: <strong>${nombresPosicion[jugador.posicion_asignada]}</strong>${aviso}</li>`;
     });
-    return div;
+    html += "</ul>";
+    return html;
   };
 
-  contenedor.appendChild(crearLista(nombresLocal, "Equipo Local"));
-  contenedor.appendChild(crearLista(nombresVisitante, "Equipo Visitante"));
-}    
+  contenedor.innerHTML = generarHTML(equipo1, alineacionLocal) + generarHTML(equipo2, alineacionVisitante);
+  contenedor.style.display = "block";
+}
@@ -0,0 +1,80 @@
+"""
+{% imagen %} y {% fondo %}: imágenes estáticas con las variantes de optimizar_imagenes.
+
+    {% load imagenes %}
+    {% imagen 'mitorneo/imagenes/Logo PlayLiga.png' alt='Logo PlayLiga' sizes='180px' class='login-logo' %}
+    {% fondo 'mitorneo/imagenes/fondopng.jpg' 'body' %}
+
+imagen emite un <picture> con un <source> por formato (AVIF, WebP) y un <img> con srcset del
+formato original; el navegador elige formato y ancho según `sizes`. fondo emite un <style> que
+pone la imagen como fondo del selector con image-set() por formato y una media query por ancho,
+de modo que un móvil de 360 px descarga la variante de 480 y no el JPEG completo. Sin variantes
+generadas ambos emiten la imagen original.
+"""
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from .. import imagenes
+
+register = template.Library()
+
+
+def _srcset(variantes):
+    return ', '.join(f'{static(nombre)} {ancho}w' for ancho, nombre, _ in variantes)
+
+
+@register.simple_tag
+def imagen(nombre, alt='', sizes='100vw', loading='lazy', **atributos):
+    entrada = imagenes.indice().get(nombre)
+    extra = format_html_join('', ' {}="{}"', sorted(atributos.items()))
+    if entrada is None:
+        return format_html('<img src="{}" alt="{}" loading="{}"{}>', static(nombre), alt, loading, extra)
+
+    propio = entrada['formato_original']
+    fuentes = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((imagenes.TIPOS[formato], _srcset(variantes), sizes)
+         for formato, variantes in entrada['variantes'].items() if formato != propio),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}"{}></picture>',
+        fuentes, static(nombre), _srcset(entrada['variantes'][propio]), sizes,
+        entrada['ancho'], entrada['alto'], alt, loading, extra,
+    )
+
+
+def _regla(selector, urls):
+    """background-image con image-set(); la primera declaración es para navegadores sin soporte."""
+    conjunto = ', '.join(f'url("{url}") type("{tipo}")' for tipo, url in urls)
+    return (f'{selector} {{ background-image: url("{urls[-1][1]}") !important; '
+            f'background-image: image-set({conjunto}) !important; }}')
+
+
+def _estilo(reglas):
+    # El contenido de <style> no se decodifica como HTML: no se escapa, solo se impide cerrarlo
+    css = '\n'.join(reglas).replace('<', '\\3C ')
+    return mark_safe(f'<style>{css}</style>')
+
+
+@register.simple_tag
+def fondo(nombre, selector='body'):
+    entrada = imagenes.indice().get(nombre)
+    if entrada is None:
+        return _estilo([f'{selector} {{ background-image: url("{static(nombre)}") !important; }}'])
+
+    # Formatos en orden de preferencia, terminando por el original
+    propio = entrada['formato_original']
+    formatos = [f for f in entrada['variantes'] if f != propio] + [propio]
+    por_ancho = {}
+    for formato in formatos:
+        for ancho, variante, _ in entrada['variantes'][formato]:
+            por_ancho.setdefault(ancho, []).append((imagenes.TIPOS[formato], static(variante)))
+
+    anchos = sorted(por_ancho)
+    reglas = [_regla(selector, por_ancho[anchos[-1]])]
+    # De mayor a menor: en pantallas estrechas gana la última media query que se cumple
+    for ancho in reversed(anchos[:-1]):
+        reglas.append(f'@media (max-width: {ancho}px) {{ {_regla(selector, por_ancho[ancho])} }}')
+    return _estilo(reglas)
@@ -1,3 +1,1338 @@
-from django.test import TestCase
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password, is_password_usable
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.http import HttpResponse, JsonResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import alineaciones, aprovisionamiento, auditoria, autenticacion, busqueda, consultas_lentas, estaticos, exportacion, idempotencia, imagenes, importacion, limites, mercados, metricas, paneles, perfilado, rankings, simulacion, trabajos
+from .management.commands import carga_apostadores
+from .models import Apuesta, Arbitro, AuditoriaAccion, AuditoriaRol, ClaveIdempotencia, Equipo, EventoPartido, Jugador, Partido, RecargaSaldo, Trabajo, Usuario
+
+
+class DatosLiga(TestCase):
+    def setUp(self):
+        cache.clear()
+        mercados._estado.update(version=None, cargado=0.0, mercados={})
+        self.local = Equipo.objects.create(nombre='Local')
+        self.visitante = Equipo.objects.create(nombre='Visitante')
+        self.apostador = Usuario.objects.create_user('apostador', password='x', rol='apostador', saldo_real=Decimal('100.00'))
+        self.client.force_login(self.apostador)
+
+    def crear_partido(self, **campos):
+        campos.setdefault('fecha', timezone.now() + timedelta(days=1))
+        return Partido.objects.create(equipo_local=self.local, equipo_visitante=self.visitante, **campos)
+
+    def saldo(self, usuario=None):
+        return Usuario.objects.values_list('saldo_real', flat=True).get(pk=(usuario or self.apostador).pk)
+
+
+@override_settings(LIMITES_ACTIVOS=False)
+class ApuestasTests(DatosLiga):
+    def apostar(self, partido, equipo=None, monto=10, **extra):
+        cuerpo = {'partido_id': partido.id, 'equipo_id': (equipo or self.local).id, 'monto': monto}
+        return self.client.post(reverse('api_apuestas'), json.dumps(cuerpo), content_type='application/json', **extra)
+
+    def test_apuesta_valida_descuenta_saldo(self):
+        partido = self.crear_partido()
+        respuesta = self.apostar(partido)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['nuevo_saldo'], 90.0)
+        self.assertEqual(self.saldo(), Decimal('90.00'))
+        self.assertEqual(Apuesta.objects.filter(partido=partido).count(), 1)
+
+    def test_saldo_insuficiente(self):
+        partido = self.crear_partido()
+        respuesta = self.apostar(partido, monto=500)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['error'], 'Saldo insuficiente.')
+        self.assertEqual(self.saldo(), Decimal('100.00'))
+
+    def test_equipo_que_no_juega(self):
+        otro = Equipo.objects.create(nombre='Otro')
+        respuesta = self.apostar(self.crear_partido(), equipo=otro)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(Apuesta.objects.exists())
+
+    def test_partido_empezado(self):
+        partido = self.crear_partido(fecha=timezone.now() - timedelta(minutes=1))
+        respuesta = self.apostar(partido)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self.saldo(), Decimal('100.00'))
+
+    def test_partido_creado_en_otro_proceso(self):
+        # Mercados ya cargados en este proceso; bulk_create no lanza señales ni sube la versión
+        self.apostar(self.crear_partido())
+        partido = Partido.objects.bulk_create([
+            Partido(equipo_local=self.local, equipo_visitante=self.visitante, fecha=timezone.now() + timedelta(hours=2)),
+        ])[0]
+        respuesta = self.apostar(partido)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(Apuesta.objects.filter(partido=partido).count(), 1)
+
+    def test_partido_simulado_en_otro_proceso(self):
+        partido = self.crear_partido()
+        self.assertEqual(self.apostar(partido).status_code, 200)
+        # La memoria aún lo da por abierto; update() no sube la versión
+        Partido.objects.filter(pk=partido.pk).update(simulado=True)
+        respuesta = self.apostar(partido)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self.saldo(), Decimal('90.00'))
+        self.assertEqual(Apuesta.objects.filter(partido=partido).count(), 1)
+
+    @override_settings(MERCADOS_CACHE_TIMEOUT=0)
+    def test_mercados_caducan_sin_version_compartida(self):
+        partido = self.crear_partido()
+        self.assertIsNotNone(mercados.abierto(partido.id))
+        Partido.objects.filter(pk=partido.pk).update(fecha=timezone.now() - timedelta(minutes=1))
+        self.assertIsNone(mercados.abierto(partido.id))
+
+
+class UsuarioCacheTests(DatosLiga):
+    def setUp(self):
+        super().setUp()
+        self.backend = autenticacion.UsuarioCacheBackend()
+
+    def test_sin_cache_compartida_lee_la_base_de_datos(self):
+        self.assertFalse(autenticacion.cache_compartida())
+        self.backend.get_user(self.apostador.pk)
+        Usuario.objects.filter(pk=self.apostador.pk).update(rol='admin')
+        # Sin invalidar: otro proceso pudo cambiarlo y aquí se ve igualmente
+        self.assertEqual(self.backend.get_user(self.apostador.pk).rol, 'admin')
+
+    def test_cache_compartida_se_invalida_al_guardar(self):
+        # El registro de auditoría del cambio de rol lo escribe otro hilo, fuera de la transacción del test
+        with mock.patch.object(autenticacion, 'cache_compartida', return_value=True), \
+                mock.patch('mitorneo.auditoria.registrar_cambio_rol'):
+            self.backend.get_user(self.apostador.pk)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.backend.get_user(self.apostador.pk).rol, 'apostador')
+            with self.captureOnCommitCallbacks(execute=True):
+                usuario = Usuario.objects.get(pk=self.apostador.pk)
+                usuario.rol = 'admin'
+                usuario.save()
+            self.assertEqual(self.backend.get_user(self.apostador.pk).rol, 'admin')
+
+    def test_cache_compartida_se_invalida_tras_update(self):
+        with mock.patch.object(autenticacion, 'cache_compartida', return_value=True):
+            self.backend.get_user(self.apostador.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                Usuario.objects.filter(pk=self.apostador.pk).update(saldo_real=Decimal('5.00'))
+                autenticacion.invalidar_usuarios([self.apostador.pk])
+            self.assertEqual(self.backend.get_user(self.apostador.pk).saldo_real, Decimal('5.00'))
+            self.assertEqual(self.client.get(reverse('api_saldo')).json()['saldo'], 5.0)
+
+
+class EventosTests(DatosLiga):
+    def setUp(self):
+        super().setUp()
+        posiciones = ['Portero'] + ['Defensa'] * 4 + ['Medio'] * 4 + ['Delantero'] * 2
+        for equipo in (self.local, self.visitante):
+            for i, posicion in enumerate(posiciones):
+                usuario = Usuario.objects.create_user(f'j{equipo.id}_{i}', rol='jugador')
+                # Nivel 0: todos los pesos de la elección son nulos
+                Jugador.objects.create(usuario=usuario, nombre='J', apellido=str(i), nivel=0, equipo=equipo, posicion=posicion)
+
+    def simular(self):
+        partido = simulacion.cargar_partido(self.crear_partido().id)
+        simulacion.simular_partido(partido, rng=random.Random(7))
+        return partido
+
+    def totales(self):
+        return [sum(Jugador.objects.values_list(campo, flat=True)) for campo in ('goles', 'asistencias', 'partidos_jugados')]
+
+    def test_simular_con_nivel_cero(self):
+        self.simular()
+        goles, _, jugados = self.totales()
+        self.assertEqual(goles, EventoPartido.objects.filter(tipo='gol').count())
+        self.assertEqual(jugados, 22)
+
+    def test_simular_con_niveles_negativos(self):
+        # Con un suplente por equipo la alineación sale de mejor_alineacion y no de la plantilla entera
+        for equipo, nivel in ((self.local, -3), (self.visitante, 0)):
+            usuario = Usuario.objects.create_user(f'suplente{equipo.id}', rol='jugador')
+            Jugador.objects.create(usuario=usuario, nombre='S', apellido='S', nivel=nivel, equipo=equipo, posicion='Medio')
+        Jugador.objects.filter(equipo=self.local).update(nivel=-3)
+        Jugador.objects.filter(equipo=self.visitante, posicion='Defensa').update(nivel=-1)
+        self.simular()
+        self.assertEqual(self.totales()[2], 22)
+
+    def test_borrar_partido_descuenta_eventos(self):
+        partido = self.simular()
+        self.simular()
+        partido.delete()
+        goles, asistencias, jugados = self.totales()
+        self.assertEqual(goles, EventoPartido.objects.filter(tipo='gol').count())
+        self.assertEqual(asistencias, EventoPartido.objects.filter(tipo='asistencia').count())
+        self.assertEqual(jugados, 22)
+
+    def registrar_como_arbitro(self, partido, eventos):
+        self.client.force_login(Usuario.objects.create_user('arbitraje', password='x', rol='admin'))
+        return self.client.post(
+            reverse('api_eventos_partido', args=[partido.id]), json.dumps({'eventos': eventos}), content_type='application/json',
+        )
+
+    def test_eventos_del_arbitro_sustituyen_a_los_simulados(self):
+        partido = self.simular()
+        goleador = Jugador.objects.filter(equipo=self.local).first()
+        response = self.registrar_como_arbitro(partido, [
+            {'tipo': 'aparicion', 'jugador_id': goleador.id, 'minuto': 0},
+            {'tipo': 'gol', 'jugador_id': goleador.id, 'minuto': 10},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(partido.eventos.filter(registrado_por__isnull=True).exists())
+        self.assertEqual(self.totales(), [1, 0, 1])
+
+    def test_no_se_simula_un_partido_con_eventos_del_arbitro(self):
+        partido = self.crear_partido(fecha=timezone.now() - timedelta(hours=1))
+        jugador = Jugador.objects.filter(equipo=self.local).first()
+        self.registrar_como_arbitro(partido, [{'tipo': 'gol', 'jugador_id': jugador.id, 'minuto': 5}])
+
+        response = self.client.post(reverse('api_simular_partido', args=[partido.id]))
+        self.assertEqual(response.status_code, 409)
+        with self.assertRaises(simulacion.EventosDeArbitro):
+            simulacion.simular_partido(simulacion.cargar_partido(partido.id))
+        self.assertEqual(simulacion.simular_vencidos(), ([], 0))
+        self.assertEqual(self.totales(), [1, 0, 0])
+        self.assertEqual(partido.eventos.count(), 1)
+
+    def test_admin_no_borra_eventos(self):
+        self.simular()
+        evento = EventoPartido.objects.first()
+        admin = Usuario.objects.create_superuser('raiz', password='x', rol='admin')
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:mitorneo_eventopartido_delete', args=[evento.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(EventoPartido.objects.filter(pk=evento.pk).exists())
+
+    def test_borrar_equipo_descuenta_eventos_en_cascada(self):
+        self.simular()
+        self.local.delete()
+        self.assertFalse(EventoPartido.objects.exists())
+        self.assertEqual(self.totales(), [0, 0, 0])
+
+
+class AlineacionesTests(SimpleTestCase):
+    POSICIONES = ('Portero', 'Defensa', 'Medio', 'Delantero')
+
+    def plantilla(self, rng, n, niveles):
+        return [{'id': i, 'nivel': rng.choice(niveles), 'posicion': rng.choice(self.POSICIONES)} for i in range(n)]
+
+    def fuerza_bruta(self, jugadores, cupos):
+        puestos = [p for p in alineaciones.ORDEN_POSICIONES for _ in range(cupos[p])]
+        return max(
+            sum(alineaciones.valor_en_posicion(j['nivel'], alineaciones.normalizar_posicion(j['posicion']), p)
+                for j, p in zip(elegidos, puestos))
+            for elegidos in itertools.permutations(jugadores, len(puestos))
+        )
+
+    @mock.patch.object(alineaciones, 'TITULARES', 4)
+    def test_coincide_con_fuerza_bruta(self):
+        # Formación reducida 1-1-1 (cuatro titulares) para poder recorrer todas las asignaciones
+        rng = random.Random(3)
+        for niveles in ((-5, -3, -1), (0,), (-2, 0, 3), range(1, 100)):
+            for n in (4, 5, 6, 7):
+                jugadores = self.plantilla(rng, n, niveles)
+                fuerza, titulares, suplentes = alineaciones.mejor_alineacion(jugadores, '1-1-1')
+                self.assertAlmostEqual(fuerza, self.fuerza_bruta(jugadores, alineaciones.parsear_formacion('1-1-1')))
+                self.assertAlmostEqual(fuerza, sum(valor for _, _, valor in titulares))
+                self.assertEqual(len(titulares) + len(suplentes), n)
+
+    def test_once_con_niveles_negativos(self):
+        jugadores = [{'id': i, 'nivel': -3, 'posicion': 'Medio'} for i in range(12)]
+        fuerza, titulares, suplentes = alineaciones.mejor_alineacion(jugadores)
+        self.assertEqual([p for _, p, _ in titulares].count('defensa'), 4)
+        self.assertEqual(len(suplentes), 1)
+        self.assertAlmostEqual(fuerza, 3 * -3 + 8 * -1.5)
+
+
+class EnumeracionAlineacionesTests(SimpleTestCase):
+    def test_rank_y_unrank_son_inversas(self):
+        for n, k in ((1, 1), (5, 2), (6, 6), (8, 3)):
+            combinaciones = list(itertools.combinations(range(n), k))
+            for rango, indices in enumerate(combinaciones):
+                self.assertEqual(alineaciones.unrank_combinacion(rango, n, k), list(indices))
+                self.assertEqual(alineaciones.rank_combinacion(list(indices), n), rango)
+            permutaciones = list(itertools.permutations(range(n), k))
+            for rango, indices in enumerate(permutaciones):
+                self.assertEqual(alineaciones.unrank_permutacion(rango, n, k), list(indices))
+                self.assertEqual(alineaciones.rank_permutacion(list(indices), n), rango)
+
+    def test_extremos_de_un_rango_enorme(self):
+        n, k = 40, 11
+        total = math.comb(n, k)
+        self.assertEqual(alineaciones.unrank_combinacion(0, n, k), list(range(k)))
+        self.assertEqual(alineaciones.unrank_combinacion(total - 1, n, k), list(range(n - k, n)))
+        ultima = alineaciones.unrank_permutacion(math.perm(n, k) - 1, n, k)
+        self.assertEqual(ultima, list(range(n - 1, n - k - 1, -1)))
+        self.assertEqual(alineaciones.rank_permutacion(ultima, n), math.perm(n, k) - 1)
+
+    def test_paginas_primera_ultima_y_fuera_de_rango(self):
+        jugadores = [{'id': i, 'nivel': i} for i in range(6)]
+        primera = alineaciones.pagina_alineaciones(jugadores, 'combinaciones', 4, 1, 10)
+        self.assertEqual((primera['total'], primera['paginas']), (15, 2))
+        self.assertEqual(primera['alineaciones'][0]['jugadores'], [0, 1, 2, 3])
+        ultima = alineaciones.pagina_alineaciones(jugadores, 'combinaciones', 4, 2, 10)
+        self.assertEqual([a['rango'] for a in ultima['alineaciones']], list(range(10, 15)))
+        self.assertEqual(ultima['alineaciones'][-1]['jugadores'], [2, 3, 4, 5])
+        fuera = alineaciones.pagina_alineaciones(jugadores, 'combinaciones', 4, 3, 10)
+        self.assertEqual(fuera['alineaciones'], [])
+        with self.assertRaises(ValueError):
+            alineaciones.pagina_alineaciones(jugadores, 'combinaciones', 4, 0, 10)
+
+    def test_orden_por_fuerza(self):
+        rng = random.Random(5)
+        jugadores = [{'id': i, 'nivel': rng.randint(-2, 9)} for i in range(8)]
+        for tipo, generar in (('combinaciones', itertools.combinations), ('permutaciones', itertools.permutations)):
+            total = alineaciones.total_alineaciones(tipo, 8, 3)
+            pagina = alineaciones.pagina_alineaciones(jugadores, tipo, 3, 1, 100, 'fuerza')['alineaciones']
+            pagina += alineaciones.pagina_alineaciones(jugadores, tipo, 3, 2, 100, 'fuerza')['alineaciones']
+            niveles = [a['nivel_total'] for a in pagina]
+            self.assertEqual(niveles, sorted(niveles, reverse=True))
+            esperados = sorted((sum(j['nivel'] for j in c) for c in generar(jugadores, 3)), reverse=True)
+            self.assertEqual(niveles, esperados[:200])
+            self.assertEqual(len({tuple(a['jugadores']) for a in pagina}), min(200, total))
+
+    @mock.patch.object(alineaciones, 'MAX_RANGO_FUERZA', 10)
+    def test_orden_por_fuerza_limitado(self):
+        jugadores = [{'id': i, 'nivel': i} for i in range(8)]
+        self.assertEqual(len(alineaciones.pagina_alineaciones(jugadores, 'combinaciones', 3, 1, 10, 'fuerza')['alineaciones']), 10)
+        with self.assertRaises(ValueError):
+            alineaciones.pagina_alineaciones(jugadores, 'combinaciones', 3, 2, 10, 'fuerza')
+        # Con permutaciones, las diez combinaciones más fuertes dan 10 * 3! rangos
+        ultima = alineaciones.pagina_alineaciones(jugadores, 'permutaciones', 3, 6, 10, 'fuerza')['alineaciones']
+        self.assertEqual(ultima[-1]['rango'], 59)
+
+
+class SimularVencidosTests(DatosLiga):
+    def test_partidos_que_fallan_no_bloquean_los_siguientes(self):
+        rotos = [self.crear_partido(fecha=timezone.now() - timedelta(hours=2)) for _ in range(2)]
+        bueno = self.crear_partido(fecha=timezone.now() - timedelta(hours=1))
+        original = simulacion.simular_partido
+
+        def simular(partido, *args, **kwargs):
+            if partido.id in {p.id for p in rotos}:
+                raise ValueError('datos rotos')
+            return original(partido, *args, **kwargs)
+
+        with mock.patch.object(simulacion, 'simular_partido', side_effect=simular), \
+                self.assertLogs('mitorneo.simulacion', 'ERROR'):
+            self.assertEqual(simulacion.simular_vencidos(lote=2), ([], 2))
+            simulados, fallidos = simulacion.simular_vencidos(lote=2)
+        self.assertEqual(([p.id for p in simulados], fallidos), ([bueno.id], 0))
+        for partido in Partido.objects.filter(id__in=[p.id for p in rotos]):
+            self.assertFalse(partido.simulado)
+            self.assertEqual(partido.intentos_simulacion, 1)
+            self.assertGreater(partido.reintento_simulacion, timezone.now())
+
+
+class BusquedaTests(DatosLiga):
+    def indice(self):
+        return busqueda.IndiceNgramas([
+            (1, 'Juan Carlos', 'García Pérez', 'jc.garcia@playliga.test'),
+            (2, 'Carla', 'Garcés', 'carla@playliga.test'),
+            (3, 'Ana', 'Muñoz', 'ana.munoz@playliga.test'),
+            (4, 'Carlos', 'Ruiz', None),
+        ])
+
+    def buscar(self, consulta, incluir_correo=False, limite=10):
+        campos = busqueda.CAMPOS if incluir_correo else busqueda.CAMPOS[:2]
+        return self.indice().buscar(busqueda.terminos(consulta), campos, limite)
+
+    def test_prefijo_de_cualquier_palabra(self):
+        # La palabra entera puntúa más que el prefijo; 'carlos' también es la segunda de 'Juan Carlos'
+        resultado = self.buscar('carlos')
+        self.assertEqual(resultado[:2], [(1, 1.5), (4, 1.5)])
+        # 'Carla' solo por parecido, detrás
+        self.assertEqual(resultado[2][0], 2)
+        self.assertLess(resultado[2][1], 1)
+        self.assertEqual([j for j, _ in self.buscar('carl')], [1, 2, 4])
+        self.assertEqual(self.buscar('PÉR'), [(1, 1.0)])
+        self.assertEqual(self.buscar('muñ'), [(3, 1.0)])
+
+    def test_erratas(self):
+        resultado = dict(self.buscar('garsia'))
+        self.assertEqual(list(resultado), [1])
+        self.assertGreaterEqual(resultado[1], busqueda.UMBRAL_PARECIDO)
+        self.assertLess(resultado[1], 1)
+        self.assertEqual(self.buscar('xyzw'), [])
+
+    def test_todos_los_terminos_deben_coincidir(self):
+        self.assertEqual(self.buscar('carlos garcia')[0], (1, 3.0))
+        self.assertEqual(self.buscar('juan garcia'), [(1, 3.0)])
+        self.assertEqual([j for j, _ in self.buscar('car garc')], [1, 2])
+        self.assertEqual(self.buscar('carlos muñoz'), [])
+
+    def test_correo_solo_si_se_pide_y_sin_dominio(self):
+        self.assertEqual(self.buscar('jc'), [])
+        self.assertEqual(self.buscar('jc', incluir_correo=True), [(1, 1.5)])
+        self.assertEqual(self.buscar('jc ruiz', incluir_correo=True), [])
+        # El dominio no cuenta ni por prefijo ni por parecido
+        self.assertEqual(self.buscar('playliga', incluir_correo=True), [])
+        self.assertEqual(self.buscar('playlija', incluir_correo=True), [])
+
+    def test_api_oculta_el_correo_a_quien_no_es_admin(self):
+        usuario = Usuario.objects.create_user('jc', rol='jugador')
+        Jugador.objects.create(usuario=usuario, nombre='Juan Carlos', apellido='García', correo='jc@liga.test')
+        busqueda.invalidar()
+        url = reverse('api_buscar_jugadores')
+        resultados = self.client.get(url, {'q': 'carlos'}).json()['resultados']
+        self.assertEqual([r['id'] for r in resultados], [usuario.jugador.id])
+        self.assertNotIn('correo', resultados[0])
+        self.assertEqual(self.client.get(url, {'q': 'jc'}).json()['resultados'], [])
+
+        self.client.force_login(Usuario.objects.create_user('jefa', rol='admin'))
+        resultados = self.client.get(url, {'q': 'jc'}).json()['resultados']
+        self.assertEqual(resultados[0]['correo'], 'jc@liga.test')
+
+    def test_indice_se_invalida_al_confirmar(self):
+        usuario = Usuario.objects.create_user('perez', rol='jugador')
+        version = busqueda._version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Jugador.objects.create(usuario=usuario, nombre='Ana', apellido='Pérez', equipo=self.local)
+            self.assertEqual(busqueda._version(), version)
+        self.assertNotEqual(busqueda._version(), version)
+        self.assertEqual([j['apellido'] for j in busqueda.buscar('Pérez')], ['Pérez'])
+
+
+@override_settings(LIMITES_ACTIVOS=False)
+class IdempotenciaTests(DatosLiga):
+    def recargar(self, clave, monto=50):
+        cuerpo = json.dumps({'monto': monto, 'metodo_pago': 'tarjeta'})
+        return self.client.post(reverse('api_recargar_saldo'), cuerpo, content_type='application/json',
+                                headers={'Idempotency-Key': clave})
+
+    def test_reintento_repite_la_primera_respuesta(self):
+        primera = self.recargar('k1')
+        segunda = self.recargar('k1')
+        self.assertEqual(segunda.status_code, 200)
+        self.assertEqual(segunda.json(), primera.json())
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.saldo(), Decimal('150.00'))
+        self.assertEqual(RecargaSaldo.objects.count(), 1)
+
+    def test_apuesta_repetida_no_cobra_dos_veces(self):
+        partido = self.crear_partido()
+        cuerpo = json.dumps({'partido_id': partido.id, 'equipo_id': self.local.id, 'monto': 10})
+        for _ in range(2):
+            respuesta = self.client.post(reverse('api_apuestas'), cuerpo, content_type='application/json',
+                                         headers={'Idempotency-Key': 'a1'})
+            self.assertEqual(respuesta.json()['nuevo_saldo'], 90.0)
+        self.assertEqual(Apuesta.objects.count(), 1)
+        self.assertEqual(self.saldo(), Decimal('90.00'))
+
+    def test_misma_clave_con_otro_cuerpo(self):
+        self.recargar('k1')
+        respuesta = self.recargar('k1', monto=60)
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(self.saldo(), Decimal('150.00'))
+
+    def test_peticion_en_curso(self):
+        ClaveIdempotencia.objects.create(usuario=self.apostador, clave='k1', huella='x')
+        respuesta = self.recargar('k1')
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta['Retry-After'], '1')
+        self.assertEqual(self.saldo(), Decimal('100.00'))
+
+    def test_reserva_abandonada_se_retoma(self):
+        ClaveIdempotencia.objects.create(usuario=self.apostador, clave='k1', huella='x',
+                                         creada=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.recargar('k1').status_code, 200)
+        self.assertEqual(self.saldo(), Decimal('150.00'))
+
+    def test_peticion_lenta_cuya_clave_tomo_un_reintento_se_deshace(self):
+        def vista(request):
+            Usuario.objects.filter(pk=request.user.pk).update(saldo_real=F('saldo_real') + 50)
+            # Mientras tanto, un reintento da la reserva por abandonada y la toma
+            ClaveIdempotencia.objects.filter(clave='k1').update(creada=timezone.now() + timedelta(seconds=1))
+            return JsonResponse({'success': True})
+
+        request = RequestFactory().post('/', b'{}', content_type='application/json', headers={'Idempotency-Key': 'k1'})
+        request.user = self.apostador
+        respuesta = idempotencia.idempotente(vista)(request)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(self.saldo(), Decimal('100.00'))
+
+    def test_reintento_tras_error_del_servidor_se_ejecuta(self):
+        llamadas = []
+
+        def vista(request):
+            llamadas.append(1)
+            Usuario.objects.filter(pk=request.user.pk).update(saldo_real=F('saldo_real') + 50)
+            return JsonResponse({'error': 'fallo'}, status=500 if len(llamadas) == 1 else 200)
+
+        request = RequestFactory().post('/', b'{}', content_type='application/json', headers={'Idempotency-Key': 'k1'})
+        request.user = self.apostador
+        self.assertEqual(idempotencia.idempotente(vista)(request).status_code, 500)
+        self.assertEqual(self.saldo(), Decimal('100.00'))
+        self.assertEqual(idempotencia.idempotente(vista)(request).status_code, 200)
+        self.assertEqual(self.saldo(), Decimal('150.00'))
+
+
+@override_settings(LIMITES_USUARIO=(3, 0.5), LIMITES_IP=(100, 50.0), LIMITES_CONCURRENCIA=8)
+class LimitesTests(DatosLiga):
+    def recargar(self):
+        cuerpo = json.dumps({'monto': 1, 'metodo_pago': 'tarjeta'})
+        return self.client.post(reverse('api_recargar_saldo'), cuerpo, content_type='application/json')
+
+    def test_rafaga_por_usuario_responde_429(self):
+        estados = [self.recargar().status_code for _ in range(4)]
+        self.assertEqual(estados, [200, 200, 200, 429])
+        respuesta = self.recargar()
+        # Sin fichas, a 0.5 por segundo la siguiente llega en 2 s
+        self.assertEqual(respuesta['Retry-After'], '2')
+        self.assertEqual(self.saldo(), Decimal('103.00'))
+
+    def test_lecturas_sin_limite(self):
+        for _ in range(5):
+            self.recargar()
+        self.assertEqual(self.client.get(reverse('api_apuestas')).status_code, 200)
+
+    def test_cubo_por_ip(self):
+        with override_settings(LIMITES_USUARIO=(100, 50.0), LIMITES_IP=(2, 0.5)):
+            estados = [self.recargar().status_code for _ in range(3)]
+        self.assertEqual(estados, [200, 200, 429])
+
+    def test_rechazo_por_usuario_no_gasta_la_ip(self):
+        with override_settings(LIMITES_USUARIO=(1, 0.01), LIMITES_IP=(3, 0.01)):
+            estados = [self.recargar().status_code for _ in range(5)]
+            # Mismo NAT, otro usuario: la IP conserva las dos fichas que el primero no usó
+            self.client.force_login(Usuario.objects.create_user('vecino', rol='apostador'))
+            estados += [self.recargar().status_code for _ in range(3)]
+        self.assertEqual(estados, [200, 429, 429, 429, 429, 200, 429, 429])
+        self.assertEqual(limites.tomar_ficha('limite:saldo:ip:127.0.0.1', 3, 0.01), 0)
+
+    def test_concurrencia_responde_503(self):
+        with mock.patch.object(limites.concurrencia, 'en_curso', 8):
+            respuesta = self.recargar()
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertEqual(respuesta['Retry-After'], '1')
+        self.assertEqual(self.saldo(), Decimal('100.00'))
+        # El 503 no gastó fichas: la ráfaga completa sigue disponible
+        estados = [self.recargar().status_code for _ in range(4)]
+        self.assertEqual(estados, [200, 200, 200, 429])
+
+    def test_desactivados(self):
+        with override_settings(LIMITES_ACTIVOS=False):
+            estados = {self.recargar().status_code for _ in range(5)}
+        self.assertEqual(estados, {200})
+
+
+class RankingsTests(DatosLiga):
+    def setUp(self):
+        super().setUp()
+        self.jugadores = []
+        for i, goles in enumerate((5, 3)):
+            usuario = Usuario.objects.create_user(f'goleador{i}', rol='jugador')
+            self.jugadores.append(Jugador.objects.create(usuario=usuario, nombre='G', apellido=str(i), goles=goles))
+
+    def test_correccion_en_el_sitio(self):
+        rankings.top('goles')
+        Jugador.objects.filter(pk=self.jugadores[1].pk).update(goles=9)
+        rankings.actualizar([self.jugadores[1].pk])
+        self.assertEqual([f['valor'] for f in cache.get('ranking:goles')], [9, 5])
+
+    def test_correccion_concurrente_descarta_el_top(self):
+        rankings.top('goles')
+        # Otro proceso está corrigiendo: esta corrección no puede esperar ni pisarlo
+        self.assertTrue(rankings._tomar_cerrojo('goles'))
+        Jugador.objects.filter(pk=self.jugadores[1].pk).update(goles=9)
+        rankings.actualizar([self.jugadores[1].pk])
+        self.assertIsNone(cache.get('ranking:goles'))
+        # Mientras el otro no termine, el top se sirve sin guardarlo
+        self.assertEqual([f['valor'] for f in rankings.top('goles')], [9, 5])
+        self.assertIsNone(cache.get('ranking:goles'))
+        rankings._soltar_cerrojo('goles')
+        self.assertEqual([f['valor'] for f in rankings.top('goles')], [9, 5])
+        self.assertIsNotNone(cache.get('ranking:goles'))
+
+
+class ExportacionTests(DatosLiga):
+    def exportar(self, desde_marca=None):
+        filas, marca = exportacion.generar('partidos', desde_marca=desde_marca)
+        return [json.loads(linea) for linea in filas], marca
+
+    def test_filas_recientes_esperan_al_retraso(self):
+        self.crear_partido()
+        self.assertEqual(self.exportar()[0], [])
+
+    @override_settings(EXPORTACION_RETRASO=0)
+    def test_incremental_incluye_partidos_modificados(self):
+        partido = self.crear_partido()
+        otro = self.crear_partido()
+        filas, marca = self.exportar()
+        self.assertEqual([f['id'] for f in filas], [partido.id, otro.id])
+        self.assertEqual(self.exportar(marca)[0], [])
+
+        simulacion.simular_partido(simulacion.cargar_partido(partido.id), rng=random.Random(1))
+        filas, _ = self.exportar(marca)
+        self.assertEqual([(f['id'], f['simulado']) for f in filas], [(partido.id, True)])
+
+
+class MetricasTests(SimpleTestCase):
+    def test_volcados_simultaneos_dejan_un_archivo_valido(self):
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS_DIR=directorio):
+            metricas.incrementar('playliga_apuestas_total')
+            hilos = [threading.Thread(target=metricas.volcar, kwargs={'forzar': True}) for _ in range(8)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            self.assertEqual(os.listdir(directorio), [f'metricas_{os.getpid()}.json'])
+            with open(os.path.join(directorio, f'metricas_{os.getpid()}.json'), encoding='utf-8') as archivo:
+                self.assertIn('contadores', json.load(archivo))
+
+    def escribir(self, directorio, pid, valor):
+        estado = {'contadores': [['playliga_apuestas_total', [], valor]],
+                  'histogramas': [['playliga_peticion_duracion_segundos', [['vista', 'home']], [1] + [0] * 11 + [0.001, 1]]]}
+        with open(os.path.join(directorio, f'metricas_{pid}.json'), 'w', encoding='utf-8') as archivo:
+            json.dump(estado, archivo)
+
+    def test_recoge_los_archivos_de_procesos_terminados(self):
+        terminado = subprocess.Popen([sys.executable, '-c', ''])
+        terminado.wait()
+        propio = metricas.RegistroMetricas()
+        propio.incrementar('playliga_apuestas_total', 1)
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS_DIR=directorio), \
+                mock.patch.object(metricas, 'registro', propio), \
+                mock.patch.dict(metricas._heredados, {'recogidos': False, 'estado': None}):
+            self.escribir(directorio, terminado.pid, 5)
+            # Un proceso anterior con nuestro mismo PID y otro que sigue vivo
+            self.escribir(directorio, os.getpid(), 20)
+            self.escribir(directorio, os.getppid(), 100)
+
+            metricas.volcar(forzar=True)
+            self.assertEqual(sorted(os.listdir(directorio)), sorted([f'metricas_{os.getpid()}.json', f'metricas_{os.getppid()}.json']))
+            texto = metricas.formato_prometheus()
+            self.assertIn('playliga_apuestas_total 126', texto)
+            self.assertIn('playliga_peticion_duracion_segundos_count{vista="home"} 3', texto)
+
+            # Lo heredado sigue sumando en los siguientes volcados, sin recogerlo otra vez
+            propio.incrementar('playliga_apuestas_total', 1)
+            metricas.volcar(forzar=True)
+            self.assertIn('playliga_apuestas_total 127', metricas.formato_prometheus())
+            with open(os.path.join(directorio, f'metricas_{os.getpid()}.json'), encoding='utf-8') as archivo:
+                self.assertEqual(json.load(archivo)['contadores'], [['playliga_apuestas_total', [], 27]])
+
+
+class MetricasVistaTests(DatosLiga):
+    def test_solo_admin_o_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        with override_settings(METRICAS_TOKEN='secreto'):
+            self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer otro'}).status_code, 401)
+            self.client.logout()
+            response = self.client.get(url, headers={'Authorization': 'Bearer secreto'})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'# TYPE', response.content)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer '}).status_code, 401)
+        self.client.force_login(Usuario.objects.create_user('jefa', rol='admin'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class Contador:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+@override_settings(CONSULTAS_LENTAS_UMBRAL_MS=0, CONSULTAS_LENTAS_EXPLAIN=False)
+class ConsultasLentasTests(TestCase):
+    def setUp(self):
+        consultas_lentas.reiniciar()
+
+    def test_origen_salta_otros_execute_wrapper(self):
+        registrador = consultas_lentas.RegistradorConsultas(RequestFactory().get('/'))
+        with self.assertLogs('mitorneo.consultas_lentas', 'WARNING'):
+            # Como en benchmark_api: su contador y el de metricas envuelven al registrador
+            with connection.execute_wrapper(Contador()), connection.execute_wrapper(Contador()), \
+                    connection.execute_wrapper(registrador):
+                Equipo.objects.count()
+            with connection.execute_wrapper(registrador), connection.execute_wrapper(Contador()):
+                Equipo.objects.count()
+        origenes = consultas_lentas.resumen()[0]['origenes']
+        self.assertEqual(sum(origenes.values()), 2)
+        for origen in origenes:
+            self.assertRegex(origen, r'^mitorneo/tests\.py:\d+ en test_origen_salta_otros_execute_wrapper$')
+
+
+class JugadoresApiTests(DatosLiga):
+    def test_filtra_por_equipo(self):
+        for nombre, equipo in (('Ana', self.local), ('Eva', self.visitante)):
+            usuario = Usuario.objects.create_user(nombre.lower(), rol='jugador')
+            Jugador.objects.create(usuario=usuario, nombre=nombre, apellido='X', equipo=equipo)
+        response = self.client.get(reverse('api_jugadores'), {'equipo_id': self.local.id})
+        self.assertEqual([j['nombre'] for j in response.json()], ['Ana'])
+
+    def test_equipo_id_no_numerico(self):
+        response = self.client.get(reverse('api_jugadores'), {'equipo_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SimularPartidoApiTests(DatosLiga):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(Usuario.objects.create_user('jefe', password='x', rol='admin'))
+        self.partido = self.crear_partido()
+
+    def test_json_mal_formado(self):
+        for cuerpo in ('{"asincrono": ', '[1]'):
+            response = self.client.post(
+                reverse('api_simular_partido', args=[self.partido.id]), cuerpo, content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 400)
+        self.partido.refresh_from_db()
+        self.assertFalse(self.partido.simulado)
+
+    def test_asincrono_encola_y_un_worker_lo_simula(self):
+        response = self.client.post(reverse('api_simular_partido', args=[self.partido.id]), {'asincrono': True},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        url = response.json()['url']
+        self.assertEqual(url, reverse('api_trabajo', args=[response.json()['trabajo_id']]))
+        self.assertEqual(self.client.get(url).json()['estado'], 'pendiente')
+        self.partido.refresh_from_db()
+        self.assertFalse(self.partido.simulado)
+
+        trabajo, = trabajos.reclamar('w1')
+        self.assertEqual(trabajos.ejecutar(trabajo)[0], 'completado')
+        estado = self.client.get(url).json()
+        self.assertEqual((estado['estado'], estado['intentos'], estado['error']), ('completado', 1, None))
+        self.assertIsNotNone(estado['terminado'])
+        self.partido.refresh_from_db()
+        self.assertTrue(self.partido.simulado)
+        self.assertEqual(estado['resultado']['goles_local'], self.partido.goles_local)
+
+        self.client.force_login(self.apostador)
+        self.assertNotEqual(self.client.get(url).status_code, 200)
+
+
+@override_settings(TRABAJOS_BACKOFF_BASE=5, TRABAJOS_BACKOFF_MAX=60, TRABAJOS_TIMEOUT=600)
+class TrabajosTests(TestCase):
+    def setUp(self):
+        self.fallos = []
+        tareas = mock.patch.dict(trabajos.TAREAS, {
+            'prueba': lambda valor: {'doble': valor * 2},
+            'falla': lambda: self.fallos.append(1) or 1 / 0,
+        })
+        tareas.start()
+        self.addCleanup(tareas.stop)
+
+    def test_reclamar_en_orden_y_solo_los_disponibles(self):
+        ahora = timezone.now()
+        segundo = trabajos.encolar('prueba', valor=2, disponible_desde=ahora - timedelta(seconds=1))
+        primero = trabajos.encolar('prueba', valor=1, disponible_desde=ahora - timedelta(seconds=2))
+        trabajos.encolar('prueba', valor=3, disponible_desde=ahora + timedelta(minutes=1))
+        otro_tipo = trabajos.encolar('falla')
+        with self.assertRaises(ValueError):
+            trabajos.encolar('no_existe')
+
+        reclamados = trabajos.reclamar('w1', tipos=['prueba'], limite=5)
+        self.assertEqual([t.id for t in reclamados], [primero.id, segundo.id])
+        self.assertEqual({(t.estado, t.trabajador, t.intentos) for t in reclamados}, {('en_curso', 'w1', 1)})
+        # Ya no están pendientes: otro worker no los reclama
+        self.assertEqual([t.id for t in trabajos.reclamar('w2', limite=5)], [otro_tipo.id])
+        self.assertEqual(trabajos.reclamar('w3', limite=5), [])
+
+        self.assertEqual(trabajos.ejecutar(reclamados[0])[0], 'completado')
+        primero.refresh_from_db()
+        self.assertEqual((primero.estado, primero.resultado), ('completado', {'doble': 2}))
+
+    def test_reintentos_con_backoff_hasta_max_intentos(self):
+        trabajo = trabajos.encolar('falla', max_intentos=3)
+        esperas = []
+        with mock.patch.object(trabajos.random, 'uniform', return_value=1.0):
+            for _ in range(3):
+                Trabajo.objects.filter(pk=trabajo.pk).update(disponible_desde=timezone.now())
+                reclamado, = trabajos.reclamar('w1')
+                resultado = trabajos.ejecutar(reclamado)[0]
+                trabajo.refresh_from_db()
+                esperas.append(round((trabajo.disponible_desde - timezone.now()).total_seconds()))
+                if resultado == 'reintento':
+                    self.assertEqual((trabajo.estado, trabajo.trabajador), ('pendiente', ''))
+                    # Hasta que pase el backoff no se vuelve a reclamar
+                    self.assertEqual(trabajos.reclamar('w1'), [])
+        self.assertEqual(len(self.fallos), 3)
+        self.assertEqual(esperas[:2], [5, 10])
+        self.assertEqual((trabajo.estado, trabajo.intentos), ('fallido', 3))
+        self.assertIn('ZeroDivisionError', trabajo.error)
+        self.assertIsNotNone(trabajo.terminado)
+
+    def test_backoff_acotado_y_con_jitter(self):
+        for intentos in (1, 4, 10, 30):
+            espera = trabajos.backoff(intentos)
+            maximo = min(5 * 2 ** (intentos - 1), 60)
+            self.assertGreaterEqual(espera, maximo / 2)
+            self.assertLessEqual(espera, maximo)
+
+    def test_recuperar_colgados(self):
+        hace_rato = timezone.now() - timedelta(minutes=20)
+        colgado = trabajos.encolar('prueba', valor=1)
+        agotado = trabajos.encolar('prueba', valor=2, max_intentos=1)
+        reciente = trabajos.encolar('prueba', valor=3)
+        for trabajo in trabajos.reclamar('muerto', limite=3):
+            if trabajo.id != reciente.id:
+                Trabajo.objects.filter(pk=trabajo.pk).update(iniciado=hace_rato)
+        viejo, = Trabajo.objects.filter(pk=colgado.pk)
+
+        self.assertEqual(trabajos.recuperar_colgados(), 2)
+        estados = dict(Trabajo.objects.values_list('id', 'estado'))
+        self.assertEqual(estados, {colgado.id: 'pendiente', agotado.id: 'fallido', reciente.id: 'en_curso'})
+
+        # El worker que se creía muerto termina tarde: el trabajo ya no es suyo y no lo pisa
+        nuevo, = trabajos.reclamar('w2')
+        self.assertEqual(nuevo.id, colgado.id)
+        trabajos.ejecutar(viejo)
+        nuevo.refresh_from_db()
+        self.assertEqual((nuevo.estado, nuevo.trabajador, nuevo.intentos), ('en_curso', 'w2', 2))
+
+
+class EstaticosTests(SimpleTestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        self.raiz = os.path.join(self.directorio.name, 'static')
+        os.makedirs(os.path.join(self.raiz, 'mitorneo'))
+        for nombre, contenido in (('mitorneo/app.css', b'body{}'), ('mitorneo/app.css.gz', b'gz'),
+                                  ('mitorneo/app.css.br', b'br'), ('mitorneo/app.1a2b3c.css', b'body{}'),
+                                  ('mitorneo/solo.js', b'x')):
+            with open(os.path.join(self.raiz, nombre), 'wb') as archivo:
+                archivo.write(contenido)
+        with open(os.path.join(self.directorio.name, 'secreto.txt'), 'wb') as archivo:
+            archivo.write(b'secreto')
+        ajustes = override_settings(STATIC_ROOT=self.raiz, STATIC_URL='/static/', ESTATICOS_SERVIR=True)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.middleware = estaticos.EstaticosMiddleware(lambda request: HttpResponse('vista'))
+        self.middleware.con_hash = frozenset({'mitorneo/app.1a2b3c.css'})
+
+    def pedir(self, ruta, **cabeceras):
+        response = self.middleware(RequestFactory().get(ruta, headers=cabeceras))
+        cuerpo = b''.join(response.streaming_content) if response.streaming else response.content
+        if response.streaming:
+            response.close()
+        return response, cuerpo
+
+    def test_negociacion_de_codificacion(self):
+        casos = (
+            ('gzip, br', 'br', b'br'),
+            ('gzip, br;q=0', 'gzip', b'gz'),
+            ('br; q=0.0, GZIP', 'gzip', b'gz'),
+            ('gzip;q=0', None, b'body{}'),
+            ('', None, b'body{}'),
+        )
+        for aceptadas, codificacion, esperado in casos:
+            response, cuerpo = self.pedir('/static/mitorneo/app.css', accept_encoding=aceptadas)
+            self.assertEqual(response.get('Content-Encoding'), codificacion, aceptadas)
+            self.assertEqual(cuerpo, esperado)
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+        # Sin variantes comprimidas se sirve el original
+        response, cuerpo = self.pedir('/static/mitorneo/solo.js', accept_encoding='gzip, br')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(cuerpo, b'x')
+
+    def test_inmutable_solo_con_hash(self):
+        response, _ = self.pedir('/static/mitorneo/app.1a2b3c.css')
+        self.assertEqual(response['Cache-Control'], estaticos.CACHE_INMUTABLE)
+        response, _ = self.pedir('/static/mitorneo/app.css')
+        self.assertEqual(response['Cache-Control'], estaticos.CACHE_SIN_HASH)
+
+    def test_no_modificado(self):
+        response, _ = self.pedir('/static/mitorneo/app.css')
+        response, cuerpo = self.pedir('/static/mitorneo/app.css', if_modified_since=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(cuerpo, b'')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_fuera_de_la_raiz_y_variantes_directas(self):
+        for ruta in ('/static/../secreto.txt', '/static/mitorneo/../../secreto.txt', '/static/mitorneo/app.css.gz',
+                     '/static/mitorneo/no_existe.css'):
+            response, cuerpo = self.pedir(ruta)
+            self.assertEqual(cuerpo, b'vista', ruta)
+        # Sin pasar por la normalización de la URL
+        for nombre in ('../secreto.txt', 'mitorneo/../../secreto.txt', '/../secreto.txt'):
+            self.assertIsNone(self.middleware.servir(RequestFactory().get('/'), nombre), nombre)
+
+
+class PlantillasTests(DatosLiga):
+    def test_plantilla_con_static_sin_collectstatic(self):
+        self.client.logout()
+        response = self.client.get(reverse('registro_apostador'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '/static/')
+
+
+class GanadoresApuestasTests(DatosLiga):
+    def test_consultas_acotadas(self):
+        partido = self.crear_partido()
+        for i in range(5):
+            usuario = Usuario.objects.create_user(f'ganador{i}', rol='apostador')
+            Apuesta.objects.create(usuario=usuario, partido=partido, equipo=self.local, monto=Decimal('1.00'))
+        admin = Usuario.objects.create_user('jefa', password='x', rol='admin')
+        self.client.force_login(admin)
+        url = reverse('admin_ganadores_apuestas')
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, 'ganador4')
+
+
+class CargaApostadoresTests(DatosLiga):
+    def verificar(self, desconocidas, apuestas_ok=None):
+        comando = carga_apostadores.Command(stdout=open(os.devnull, 'w'))
+        resultados = {'apuestas_ok': defaultdict(Decimal, apuestas_ok or {}),
+                      'desconocidas': defaultdict(list, desconocidas)}
+        ids = [self.apostador.id]
+        return comando._verificar(ids, {self.apostador.id: Decimal('100.00')}, 0, 0, resultados, espera=0)
+
+    def test_apuestas_sin_respuesta_se_resuelven_por_su_clave(self):
+        partido = self.crear_partido()
+        cuerpo = json.dumps({'partido_id': partido.id, 'equipo_id': self.local.id, 'monto': 10})
+        self.client.post(reverse('api_apuestas'), cuerpo, content_type='application/json',
+                         headers={'Idempotency-Key': 'carga-1'})
+        # carga-1 se cobró aunque el cliente agotó su timeout; carga-2 nunca llegó al servidor
+        verificacion = self.verificar({self.apostador.id: [('carga-1', Decimal(10)), ('carga-2', Decimal(5))]})
+        self.assertEqual(verificacion['errores'], [])
+        self.assertEqual(verificacion['sin_resolver'], 0)
+
+    def test_apuesta_aun_en_curso_queda_sin_resolver(self):
+        ClaveIdempotencia.objects.create(usuario=self.apostador, clave='carga-1', huella='x')
+        verificacion = self.verificar({self.apostador.id: [('carga-1', Decimal(10))]})
+        self.assertEqual(verificacion['sin_resolver'], 1)
+        self.assertEqual(len(verificacion['errores']), 1)
+        self.assertIn('seguía en curso', verificacion['errores'][0])
+
+
+class SeedLigaTests(TestCase):
+    def sembrar(self, **opciones):
+        opciones = {'equipos': 4, 'jugadores_por_equipo': 12, 'arbitros': 2, 'partidos': 10, 'apostadores': 5,
+                    'recargas': 5, 'apuestas': 200, 'lote': 37, 'seed': 7, 'fecha_base': '2026-01-10', **opciones}
+        call_command('seed_liga', stdout=StringIO(), **opciones)
+
+    def movimientos(self):
+        return (list(Apuesta.objects.order_by('id').values_list('usuario__username', 'partido__fecha', 'monto')),
+                list(RecargaSaldo.objects.order_by('id').values_list('usuario__username', 'monto')))
+
+    def test_saldo_igual_a_recargas_menos_apuestas(self):
+        self.sembrar()
+        self.assertEqual(Apuesta.objects.count(), 200)
+        self.assertEqual(Jugador.objects.count(), 48)
+        self.assertEqual(Partido.objects.filter(simulado=True).count(), 7)
+        for usuario in Usuario.objects.filter(rol='apostador'):
+            recargado = RecargaSaldo.objects.filter(usuario=usuario).aggregate(t=Sum('monto'))['t'] or 0
+            apostado = Apuesta.objects.filter(usuario=usuario).aggregate(t=Sum('monto'))['t'] or 0
+            self.assertGreaterEqual(usuario.saldo_real, 0)
+            self.assertEqual(usuario.saldo_real, recargado - apostado, usuario.username)
+        # Las apuestas guardan la fecha generada, no la de inserción
+        self.assertFalse(Apuesta.objects.filter(fecha_apuesta__gt=F('partido__fecha')).exists())
+
+    def test_misma_semilla_genera_lo_mismo_y_limpiar_borra_lo_anterior(self):
+        real = Equipo.objects.create(nombre='Real')
+        self.sembrar()
+        primera = self.movimientos()
+        self.sembrar(limpiar=True)
+        self.assertEqual(self.movimientos(), primera)
+        self.assertEqual(Equipo.objects.count(), 5)
+        self.assertTrue(Equipo.objects.filter(pk=real.pk).exists())
+        self.sembrar(limpiar=True, seed=8)
+        self.assertNotEqual(self.movimientos(), primera)
+
+
+class PerfiladoTests(DatosLiga):
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        ajustes = override_settings(PERFILADO_DIR=self.directorio.name, PERFILADO_MUESTREO=0, PERFILADO_MAX_ARCHIVOS=2)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.admin = Usuario.objects.create_user('jefa', password='x', rol='admin')
+
+    def perfilar(self):
+        return self.client.get(reverse('api_saldo'), headers={'X-Perfilar': '1'})
+
+    def test_solo_un_admin_pide_perfil(self):
+        self.assertNotIn('X-Perfil', self.perfilar())
+        self.assertEqual(os.listdir(self.directorio.name), [])
+
+        self.client.force_login(self.admin)
+        response = self.perfilar()
+        nombre = response['X-Perfil']
+        self.assertRegex(nombre, r'_api_saldo_\d+ms\.prof$')
+        self.assertEqual(sorted(os.listdir(self.directorio.name)), [nombre, nombre[:-len('.prof')] + '.txt'])
+        self.assertEqual(perfilado.listar_perfiles()[0]['vista'], 'api_saldo')
+
+    def test_rotacion_conserva_los_mas_recientes(self):
+        self.client.force_login(self.admin)
+        nombres = [self.perfilar()['X-Perfil'] for _ in range(3)]
+        self.assertEqual([p['archivo'] for p in perfilado.listar_perfiles()], nombres[:0:-1])
+        self.assertEqual(len(os.listdir(self.directorio.name)), 4)
+
+    def test_vistas_de_administracion(self):
+        self.client.force_login(self.admin)
+        nombre = self.perfilar()['X-Perfil']
+        self.assertContains(self.client.get(reverse('admin_perfiles')), nombre)
+        resumen = self.client.get(reverse('admin_perfil_archivo', args=[nombre[:-len('.prof')] + '.txt']))
+        self.assertIn(b'GET /torneo/api/saldo/', b''.join(resumen.streaming_content))
+        resumen.close()
+        volcado = self.client.get(reverse('admin_perfil_archivo', args=[nombre]))
+        self.assertIn('attachment', volcado['Content-Disposition'])
+        volcado.close()
+        for invalido in ('..%2Fsettings.py', 'otro.txt', nombre.replace('.prof', '.py'), '20260101-000000-000000_x_1ms.prof'):
+            self.assertEqual(self.client.get(f'/torneo/admin/perfiles/{invalido}').status_code, 404, invalido)
+        self.assertIsNone(perfilado.ruta_perfil('../' + nombre))
+
+        self.client.force_login(self.apostador)
+        self.assertNotEqual(self.client.get(reverse('admin_perfil_archivo', args=[nombre])).status_code, 200)
+
+
+class ImportacionTests(DatosLiga):
+    def importar(self, tipo, texto, **opciones):
+        return importacion.importar_csv(tipo, StringIO(texto), procesos=1, **opciones)
+
+    def test_jugadores_duplicados_y_correos_no_validos(self):
+        existente = Usuario.objects.create_user('existente', rol='jugador')
+        Jugador.objects.create(usuario=existente, nombre='E', apellido='X', correo='usado@liga.test')
+        resultado = self.importar('jugadores', (
+            'username,nombre,apellido,correo,equipo,nivel\n'
+            'ana,Ana,Ruiz,ana@liga.test,Local,5\n'
+            'beto,Beto,Gil,no-es-correo,Local,\n'
+            'ana,Ana,Otra,otra@liga.test,Local,\n'
+            'carla,Carla,Paz,ANA@liga.test,,\n'
+            'dani,Dani,Sol,ana@liga.test,Visitante,\n'
+            'existente,Eva,Mar,eva@liga.test,,\n'
+            'fede,Fede,Luz,usado@liga.test,,\n'
+            'gael,Gael,Rey,gael@liga.test,Nadie,\n'
+            'hugo,Hugo,Paz,hugo@liga.test,Local,11\n'
+            'ines,Ines,Sol,hugo@liga.test,,\n'
+        ), tamano_lote=3)
+        self.assertEqual(resultado.filas, 10)
+        errores = dict(resultado.errores)
+        self.assertEqual(resultado.creados, 3)
+        # Los duplicados se detectan también entre lotes distintos
+        self.assertEqual(sorted(errores), [3, 4, 6, 7, 8, 9, 10])
+        self.assertIn('correo no válido', errores[3])
+        self.assertIn('"ana" ya existe', errores[4])
+        self.assertIn('ya está registrado', errores[6])
+        self.assertIn('"existente" ya existe', errores[7])
+        self.assertIn('ya está registrado', errores[8])
+        self.assertIn('no existe', errores[9])
+        self.assertIn('fuera de rango', errores[10])
+        # Una fila rechazada por su nivel no reserva su correo
+        self.assertEqual(set(Jugador.objects.values_list('usuario__username', flat=True)),
+                         {'existente', 'ana', 'carla', 'ines'})
+        self.assertFalse(Usuario.objects.get(username='ana').has_usable_password())
+        self.assertEqual(Jugador.objects.get(usuario__username='ana').equipo, self.local)
+
+    def test_equipos_repetidos_y_simulacion(self):
+        texto = 'nombre\nNuevo\nLocal\nNuevo\n\n'
+        resultado = self.importar('equipos', texto, simular=True)
+        self.assertEqual((resultado.creados, resultado.total_errores), (1, 2))
+        self.assertFalse(Equipo.objects.filter(nombre='Nuevo').exists())
+        self.importar('equipos', texto)
+        self.assertEqual(Equipo.objects.filter(nombre='Nuevo').count(), 1)
+
+    def test_partidos(self):
+        arbitro = Usuario.objects.create_user('silbato', rol='arbitro')
+        Arbitro.objects.create(usuario=arbitro, nombre='S', apellido='B', correo='s@liga.test')
+        resultado = self.importar('partidos', (
+            'fecha;equipo_local;equipo_visitante;arbitro\n'
+            '2030-05-01 18:00;Local;Visitante;silbato\n'
+            'mañana;Local;Visitante;\n'
+            '2030-05-02 18:00;Local;Local;\n'
+            '2030-05-03 18:00;Local;Visitante;nadie\n'
+        ), delimitador=';')
+        self.assertEqual(resultado.creados, 1)
+        self.assertEqual(sorted(dict(resultado.errores)), [3, 4, 5])
+        self.assertEqual(Partido.objects.get().arbitro.usuario, arbitro)
+
+    def test_cabecera_incompleta(self):
+        with self.assertRaises(ValueError):
+            self.importar('arbitros', 'username,nombre\nx,y\n')
+
+
+# Los workers del pool cargan los settings reales: solo el proceso de los tests usa un hash rápido
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher',
+                                     'django.contrib.auth.hashers.PBKDF2PasswordHasher'])
+class AprovisionamientoTests(DatosLiga):
+    def test_hash_en_linea_sin_pool(self):
+        with mock.patch.object(aprovisionamiento, 'ProcessPoolExecutor') as pool:
+            with aprovisionamiento.Hasheador(procesos=1) as hasheador:
+                hashes = hasheador.hashear(['uno', '', None, 'dos'])
+            with override_settings(APROVISIONAMIENTO_MIN_PARALELO=3):
+                aprovisionamiento.hashear_passwords(['tres', 'cuatro'], procesos=4)
+        pool.assert_not_called()
+        self.assertTrue(check_password('uno', hashes[0]))
+        self.assertTrue(check_password('dos', hashes[3]))
+        self.assertFalse(any(is_password_usable(h) for h in hashes[1:3]))
+
+    @override_settings(APROVISIONAMIENTO_MIN_PARALELO=2)
+    @mock.patch.object(aprovisionamiento, 'LOTE_POR_TAREA', 2)
+    def test_hash_en_pool_de_procesos(self):
+        passwords = ['clave0', '', 'clave1', 'clave2']
+        with aprovisionamiento.Hasheador(procesos=2) as hasheador:
+            hashes = hasheador.hashear(passwords)
+            pool = hasheador.pool
+            self.assertIsNotNone(pool)
+            # El pool se reutiliza entre lotes del mismo bloque
+            hasheador.hashear(['otra', 'mas'])
+            self.assertIs(hasheador.pool, pool)
+        self.assertIsNone(hasheador.pool)
+        for password, hash_ in zip(passwords, hashes):
+            self.assertEqual(check_password(password, hash_), bool(password), password)
+
+    def test_api_aprovisionar(self):
+        url = reverse('api_aprovisionar')
+        cuentas = [{'username': f'nuevo{i}', 'nombre': 'N', 'apellido': 'A', 'correo': f'nuevo{i}@liga.test',
+                    'password': f'clave{i}'} for i in range(3)]
+        cuentas.append({'username': 'nuevo0', 'nombre': 'N', 'apellido': 'A', 'correo': 'otro@liga.test'})
+        self.assertNotEqual(self.client.post(url, {'rol': 'apostadores', 'cuentas': cuentas},
+                                             content_type='application/json').status_code, 201)
+
+        self.client.force_login(Usuario.objects.create_user('jefa', password='x', rol='admin'))
+        self.assertEqual(self.client.post(url, {'rol': 'admin', 'cuentas': cuentas},
+                                          content_type='application/json').status_code, 400)
+        response = self.client.post(url, {'rol': 'apostadores', 'cuentas': cuentas, 'simular': True},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['creados'], 3)
+        self.assertFalse(Usuario.objects.filter(username='nuevo0').exists())
+
+        response = self.client.post(url, {'rol': 'apostadores', 'cuentas': cuentas}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['creados'], response.json()['errores']), (3, 1))
+        self.assertEqual(response.json()['detalle_errores'][0]['linea'], 3)
+        self.assertTrue(Usuario.objects.get(username='nuevo2', rol='apostador').check_password('clave2'))
+
+
+@override_settings(STATIC_URL='/static/')
+class ImagenesTests(SimpleTestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        for parche in (mock.patch.object(imagenes, 'directorio_variantes', return_value=self.directorio.name),
+                       mock.patch.dict(imagenes._indice, {'mtime': None, 'datos': {}})):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def renderizar(self, texto):
+        return Template('{% load imagenes %}' + texto).render(Context())
+
+    def generar(self):
+        from PIL import Image
+
+        origen = os.path.join(self.directorio.name, 'Logo Liga.png')
+        Image.new('RGBA', (500, 250), (255, 0, 0, 128)).save(origen)
+        entrada = imagenes.generar_variantes(origen, formatos=('webp',), destino=self.directorio.name)
+        imagenes.guardar_indice({'mitorneo/imagenes/Logo Liga.png': entrada}, destino=self.directorio.name)
+        return entrada
+
+    def test_sin_variantes_emite_el_original(self):
+        html = self.renderizar("{% imagen 'mitorneo/imagenes/Logo Liga.png' alt='Logo' class='logo' %}")
+        self.assertHTMLEqual(html, '<img src="/static/mitorneo/imagenes/Logo%20Liga.png" alt="Logo" loading="lazy" class="logo">')
+        css = self.renderizar("{% fondo 'mitorneo/imagenes/fondo.jpg' '.panel' %}")
+        self.assertEqual(css, '<style>.panel { background-image: url("/static/mitorneo/imagenes/fondo.jpg") !important; }</style>')
+
+    def test_variantes_sin_ampliar(self):
+        entrada = self.generar()
+        self.assertEqual(entrada['formato_original'], 'png')
+        self.assertEqual([v[0] for v in entrada['variantes']['webp']], [320, 480, 500])
+        self.assertEqual([v[0] for v in entrada['variantes']['png']], [320, 480, 500])
+        for _, nombre, _ in entrada['variantes']['png']:
+            self.assertTrue(os.path.exists(os.path.join(self.directorio.name, os.path.basename(nombre))))
+
+    def test_imagen_con_variantes(self):
+        self.generar()
+        html = self.renderizar("{% imagen 'mitorneo/imagenes/Logo Liga.png' alt='<Logo>' sizes='180px' %}")
+        variantes = '/static/mitorneo/imagenes/variantes/logo-liga'
+        self.assertHTMLEqual(html, (
+            '<picture>'
+            f'<source type="image/webp" srcset="{variantes}-320.webp 320w, {variantes}-480.webp 480w, {variantes}-500.webp 500w" sizes="180px">'
+            f'<img src="/static/mitorneo/imagenes/Logo%20Liga.png" srcset="{variantes}-320.png 320w, {variantes}-480.png 480w, {variantes}-500.png 500w" '
+            'sizes="180px" width="500" height="250" alt="&lt;Logo&gt;" loading="lazy">'
+            '</picture>'
+        ))
+
+    def test_fondo_con_variantes(self):
+        self.generar()
+        css = self.renderizar("{% fondo 'mitorneo/imagenes/Logo Liga.png' 'body</style>' %}")
+        self.assertNotIn('</style>', css[:-len('</style>')])
+        reglas = css.split('\n')
+        self.assertIn('image-set(url("/static/mitorneo/imagenes/variantes/logo-liga-500.webp") type("image/webp"), '
+                      'url("/static/mitorneo/imagenes/variantes/logo-liga-500.png") type("image/png"))', reglas[0])
+        self.assertTrue(reglas[1].startswith('@media (max-width: 480px)'))
+        self.assertTrue(reglas[2].startswith('@media (max-width: 320px)'))
+        self.assertIn('logo-liga-320.webp', reglas[2])
+
+
+class PanelesTests(DatosLiga):
+    def setUp(self):
+        super().setUp()
+        usuario = Usuario.objects.create_user('delantera', password='x', rol='jugador')
+        self.jugador = Jugador.objects.create(usuario=usuario, nombre='D', apellido='L', correo='d@liga.test',
+                                              equipo=self.local)
+        self.client.force_login(usuario)
+        self.url = reverse('panel_jugador')
+
+    def panel(self):
+        return self.client.get(self.url).content.decode()
+
+    def test_consultas_acotadas(self):
+        for dias in range(1, 11):
+            self.crear_partido(fecha=timezone.now() + timedelta(days=dias))
+        # Usuario, jugador, partidos y apuestas; el número no depende de los partidos
+        with self.assertNumQueries(4):
+            self.panel()
+        # Con el fragmento en caché la lista de partidos no se consulta
+        with self.assertNumQueries(3):
+            self.panel()
+
+    def test_guardar_partido_invalida_el_fragmento(self):
+        partido = self.crear_partido(fecha=timezone.make_aware(datetime(2030, 5, 1, 18, 0)))
+        self.assertIn('01/05/2030 18:00', self.panel())
+        # Sin pasar por el modelo el fragmento cacheado sigue mostrando la fecha anterior
+        Partido.objects.filter(pk=partido.pk).update(fecha=timezone.make_aware(datetime(2030, 6, 2, 18, 0)))
+        self.assertIn('01/05/2030 18:00', self.panel())
+        with self.captureOnCommitCallbacks(execute=True):
+            partido.refresh_from_db()
+            partido.save()
+        self.assertIn('02/06/2030 18:00', self.panel())
+
+        # Un partido nuevo del equipo también invalida
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_partido(fecha=timezone.make_aware(datetime(2030, 7, 3, 18, 0)))
+        self.assertIn('03/07/2030 18:00', self.panel())
+
+    def test_renombrar_equipo_rival_invalida_el_fragmento(self):
+        self.crear_partido()
+        self.assertIn('Visitante', self.panel())
+        self.visitante.nombre = 'Renombrado'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.visitante.save()
+        contenido = self.panel()
+        self.assertIn('Renombrado', contenido)
+        self.assertNotIn('Visitante', contenido)
+
+    def test_proximos_partidos_filtra_los_que_ya_empezaron(self):
+        partido = self.crear_partido(fecha=timezone.now() + timedelta(minutes=5))
+        self.assertEqual([p['id'] for p in paneles.proximos_partidos()], [partido.id])
+        with mock.patch.object(timezone, 'now', return_value=timezone.now() + timedelta(minutes=10)):
+            with self.assertNumQueries(0):
+                self.assertEqual(paneles.proximos_partidos(), [])
+
+
+class AuditoriaTests(DatosLiga):
+    def setUp(self):
+        super().setUp()
+        # Sin hilo: los tests vuelcan a mano o por el límite de pendientes
+        hilo = mock.patch.object(auditoria.threading, 'Thread')
+        self.hilo = hilo.start()
+        self.addCleanup(hilo.stop)
+        self.escritor = auditoria.EscritorAuditoria()
+
+    def registros(self, cantidad):
+        return [AuditoriaRol(usuario=self.apostador, rol_anterior='apostador', rol_nuevo='jugador')
+                for _ in range(cantidad)]
+
+    @override_settings(AUDITORIA_LOTE=2)
+    def test_vaciar_escribe_por_lotes_y_por_modelo(self):
+        for registro in self.registros(5):
+            self.escritor.agregar(registro)
+        self.escritor.agregar(AuditoriaAccion(usuario=self.apostador, accion='partidos.simular'))
+        # Un único hilo, avisado cuando se completa un lote
+        self.hilo.assert_called_once()
+        self.assertEqual(self.escritor.pendientes(), 6)
+        with mock.patch.object(AuditoriaRol.objects, 'bulk_create', wraps=AuditoriaRol.objects.bulk_create) as bulk:
+            self.assertEqual(self.escritor.vaciar(), 6)
+        bulk.assert_called_once()
+        self.assertEqual(bulk.call_args.kwargs['batch_size'], 2)
+        self.assertEqual((AuditoriaRol.objects.count(), AuditoriaAccion.objects.count()), (5, 1))
+        self.assertEqual(self.escritor.vaciar(), 0)
+
+    @override_settings(AUDITORIA_MAX_PENDIENTES=3)
+    def test_bufer_lleno_vacia_en_el_hilo_que_agrega(self):
+        registros = self.registros(4)
+        for registro in registros[:2]:
+            self.escritor.agregar(registro)
+        self.assertEqual(AuditoriaRol.objects.count(), 0)
+        self.escritor.agregar(registros[2])
+        self.assertEqual((self.escritor.pendientes(), AuditoriaRol.objects.count()), (0, 3))
+        self.escritor.agregar(registros[3])
+        self.assertEqual(self.escritor.pendientes(), 1)
+
+    def test_fila_invalida_no_tumba_el_lote(self):
+        registros = self.registros(3)
+        registros[1].usuario_id = None
+        for registro in registros:
+            self.escritor.agregar(registro)
+        with self.assertLogs('mitorneo.auditoria', 'ERROR'):
+            self.assertEqual(self.escritor.vaciar(), 2)
+        self.assertEqual(AuditoriaRol.objects.count(), 2)
+
+    def test_detener_vacia_lo_pendiente(self):
+        for registro in self.registros(2):
+            self.escritor.agregar(registro)
+        self.escritor.detener()
+        self.hilo.return_value.join.assert_called_once()
+        self.assertEqual((self.escritor.pendientes(), AuditoriaRol.objects.count()), (0, 2))
+        # Parado, no arranca otro hilo
+        self.escritor.agregar(self.registros(1)[0])
+        self.hilo.assert_called_once()
+
+    def test_cambio_de_rol_se_audita_al_confirmar(self):
+        admin = Usuario.objects.create_user('jefa', rol='admin')
+        with mock.patch.object(auditoria, 'escritor', self.escritor):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.apostador.rol = 'jugador'
+                self.apostador.save()
+                self.assertEqual(self.escritor.pendientes(), 0)
+            # Un cambio deshecho no se audita
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(ValueError):
+                with transaction.atomic():
+                    cambiado = Usuario.objects.get(pk=admin.pk)
+                    cambiado.rol = 'arbitro'
+                    cambiado.save()
+                    raise ValueError
+        self.assertEqual(self.escritor.pendientes(), 1)
+        self.escritor.vaciar()
+        registro = AuditoriaRol.objects.get()
+        self.assertEqual((registro.usuario, registro.rol_anterior, registro.rol_nuevo), (self.apostador, 'apostador', 'jugador'))
+
+
+@override_settings(AUDITORIA_LOTE=3, AUDITORIA_INTERVALO=60)
+class AuditoriaHiloTests(TransactionTestCase):
+    def test_el_hilo_escribe_al_completar_un_lote(self):
+        usuario = Usuario.objects.create_user('apostador', rol='apostador')
+        escritor = auditoria.EscritorAuditoria()
+        self.addCleanup(escritor.detener)
+        for _ in range(3):
+            escritor.agregar(AuditoriaAccion(usuario=usuario, accion='prueba'))
+        limite = time.monotonic() + 5
+        while AuditoriaAccion.objects.count() < 3 and time.monotonic() < limite:
+            time.sleep(0.01)
+        self.assertEqual(AuditoriaAccion.objects.count(), 3)
+        escritor.agregar(AuditoriaAccion(usuario=usuario, accion='prueba'))
+        escritor.detener()
+        self.assertEqual(AuditoriaAccion.objects.count(), 4)
@@ -0,0 +1,189 @@
+"""
+Cola de trabajos en segundo plano guardada en la base de datos (modelo Trabajo).
+
+Las vistas encolan con encolar('simular_partido', partido_id=...) y responden enseguida; el
+comando run_workers arranca N procesos que reclaman trabajos pendientes y los ejecutan, sin
+necesidad de un broker externo.
+
+Reclamar un trabajo debe ser atómico entre workers. En PostgreSQL (o cualquier base con
+SKIP LOCKED) se usa SELECT ... FOR UPDATE SKIP LOCKED: cada worker bloquea filas distintas sin
+esperar a las de los demás. En SQLite se reclama con un UPDATE condicional
+(WHERE estado = 'pendiente'): si otro worker se adelantó no cambia ninguna fila.
+
+Un trabajo que falla se reintenta con backoff exponencial (TRABAJOS_BACKOFF_BASE * 2^intentos,
+hasta TRABAJOS_BACKOFF_MAX, con jitter) hasta max_intentos; después queda como fallido con el
+traceback. Los que llevan más de TRABAJOS_TIMEOUT segundos en curso (el worker murió) vuelven
+a la cola. Cada ejecución deja su espera en cola y su duración en las métricas.
+"""
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import exportacion, metricas, simulacion
+from .eventos import reconstruir_estadisticas
+from .models import Trabajo
+
+TAREAS = {}
+
+
+def tarea(nombre):
+    """Registra la función como tarea `nombre`; recibe los argumentos del trabajo por nombre."""
+    def registrar(funcion):
+        TAREAS[nombre] = funcion
+        return funcion
+    return registrar
+
+
+def _max_intentos():
+    return getattr(settings, 'TRABAJOS_MAX_INTENTOS', 5)
+
+
+def _timeout():
+    return getattr(settings, 'TRABAJOS_TIMEOUT', 600)
+
+
+def backoff(intentos):
+    """Segundos hasta reintentar tras `intentos` fallos."""
+    base = getattr(settings, 'TRABAJOS_BACKOFF_BASE', 5)
+    maximo = getattr(settings, 'TRABAJOS_BACKOFF_MAX', 600)
+    # Con jitter para que los fallos simultáneos no se reintenten todos a la vez
+    return min(base * 2 ** (intentos - 1), maximo) * random.uniform(0.5, 1.0)
+
+
+def nombre_trabajador(indice=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{indice}'
+
+
+def encolar(tipo, max_intentos=None, disponible_desde=None, **argumentos):
+    if tipo not in TAREAS:
+        raise ValueError(f'Tarea desconocida: {tipo}')
+    return Trabajo.objects.create(
+        tipo=tipo, argumentos=argumentos, max_intentos=max_intentos or _max_intentos(),
+        disponible_desde=disponible_desde or timezone.now(),
+    )
+
+
+def reclamar(trabajador, tipos=None, limite=1):
+    """Marca como en curso hasta `limite` trabajos disponibles para `trabajador` y los devuelve."""
+    ahora = timezone.now()
+    disponibles = Trabajo.objects.filter(estado='pendiente', disponible_desde__lte=ahora)
+    if tipos:
+        disponibles = disponibles.filter(tipo__in=tipos)
+    disponibles = disponibles.order_by('disponible_desde', 'id')
+    en_curso = {'estado': 'en_curso', 'trabajador': trabajador, 'iniciado': ahora, 'intentos': F('intentos') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(disponibles.select_for_update(skip_locked=True).values_list('id', flat=True)[:limite])
+            Trabajo.objects.filter(id__in=ids).update(**en_curso)
+    else:
+        ids = []
+        # Algunos candidatos de más por si otro worker se lleva los primeros
+        for trabajo_id in disponibles.values_list('id', flat=True)[:limite * 4]:
+            if Trabajo.objects.filter(id=trabajo_id, estado='pendiente').update(**en_curso):
+                ids.append(trabajo_id)
+                if len(ids) == limite:
+                    break
+    if not ids:
+        return []
+    return list(Trabajo.objects.filter(id__in=ids).order_by('disponible_desde', 'id'))
+
+
+def ejecutar(trabajo):
+    """
+    Ejecuta un trabajo reclamado y guarda el resultado, el reintento o el fallo. Devuelve
+    (resultado, espera en cola, duración) con resultado 'completado', 'reintento' o 'fallido'.
+    """
+    espera = max((trabajo.iniciado - trabajo.disponible_desde).total_seconds(), 0.0)
+    inicio = time.monotonic()
+    # Solo si el trabajo sigue siendo nuestro: si se dio por colgado, ya lo tiene otro worker
+    propio = Trabajo.objects.filter(id=trabajo.id, estado='en_curso', trabajador=trabajo.trabajador, iniciado=trabajo.iniciado)
+    try:
+        funcion = TAREAS.get(trabajo.tipo)
+        if funcion is None:
+            raise ValueError(f'Tarea desconocida: {trabajo.tipo}')
+        valor = funcion(**trabajo.argumentos)
+    except Exception:
+        ahora = timezone.now()
+        if trabajo.intentos >= trabajo.max_intentos:
+            resultado = 'fallido'
+            propio.update(estado='fallido', terminado=ahora, error=traceback.format_exc())
+        else:
+            resultado = 'reintento'
+            propio.update(
+                estado='pendiente', trabajador='', error=traceback.format_exc(),
+                disponible_desde=ahora + timedelta(seconds=backoff(trabajo.intentos)),
+            )
+    else:
+        resultado = 'completado'
+        propio.update(estado='completado', terminado=timezone.now(), resultado=valor, error='')
+    duracion = time.monotonic() - inicio
+
+    metricas.incrementar('playliga_trabajos_total', tipo=trabajo.tipo, resultado=resultado)
+    metricas.observar('playliga_trabajos_espera_segundos', espera, tipo=trabajo.tipo)
+    metricas.observar('playliga_trabajos_duracion_segundos', duracion, tipo=trabajo.tipo)
+    return resultado, espera, duracion
+
+
+def recuperar_colgados():
+    """Devuelve a la cola los trabajos en curso desde hace más de TRABAJOS_TIMEOUT; cuántos."""
+    ahora = timezone.now()
+    colgados = Trabajo.objects.filter(estado='en_curso', iniciado__lt=ahora - timedelta(seconds=_timeout()))
+    agotados = colgados.filter(intentos__gte=F('max_intentos')).update(
+        estado='fallido', terminado=ahora, error='El worker no terminó el trabajo a tiempo.',
+    )
+    return agotados + colgados.update(estado='pendiente', trabajador='', disponible_desde=ahora)
+
+
+def bucle_trabajador(trabajador, parar, tipos=None, lote=1, intervalo=1.0, hasta_vaciar=False, informar=None):
+    """
+    Reclama y ejecuta trabajos hasta que se active el evento `parar` (o, con hasta_vaciar,
+    hasta que no quede ninguno disponible). `informar(tipo, resultado, espera, duracion)`
+    recibe cada ejecución.
+    """
+    while not parar.is_set():
+        trabajos = reclamar(trabajador, tipos, lote)
+        if not trabajos:
+            close_old_connections()
+            if hasta_vaciar:
+                return
+            parar.wait(intervalo)
+            continue
+        for trabajo in trabajos:
+            resultado, espera, duracion = ejecutar(trabajo)
+            if informar is not None:
+                informar(trabajo.tipo, resultado, espera, duracion)
+        metricas.volcar()
+
+
+@tarea('simular_partido')
+def _simular_partido(partido_id):
+    return simulacion.simular_partido(simulacion.cargar_partido(partido_id))
+
+
+@tarea('reconstruir_estadisticas')
+def _reconstruir_estadisticas(lote=1000):
+    return {'actualizados': reconstruir_estadisticas(batch_size=lote)}
+
+
+@tarea('exportar')
+def _exportar(tipo, ruta, formato='ndjson', desde_id=None, desde_marca=None):
+    if desde_marca is not None:
+        desde_marca = exportacion.fecha_iso(desde_marca, 'desde_marca')
+    filas, marca = exportacion.generar(tipo, formato, desde_id, desde_marca=desde_marca)
+    lineas = 0
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'w', encoding='utf-8', newline='') as archivo:
+        for linea in filas:
+            archivo.write(linea)
+            lineas += 1
+    os.replace(temporal, ruta)
+    return {'ruta': ruta, 'lineas': lineas, 'marca': marca.isoformat()}
@@ -16,13 +16,21 @@ urlpatterns = [
     path('api/equipos/', views.api_equipos, name='api_equipos'),
     path('api/arbitros/', views.api_arbitros, name='api_arbitros'),
     path('api/jugadores/', views.api_jugadores, name='api_jugadores'),
+    path('api/jugadores/buscar/', views.api_buscar_jugadores, name='api_buscar_jugadores'),
     path('api/partidos/', views.api_partidos, name='api_partidos'),
+    path('api/goleadores/', views.api_goleadores, name='api_goleadores'),
+    path('api/asistentes/', views.api_asistentes, name='api_asistentes'),
     path('api/agregar_equipo/', views.api_agregar_equipo, name='api_agregar_equipo'),
     path('api/crear_partido/', views.api_crear_partido, name='api_crear_partido'),
     path('api/asignar_jugador/', views.api_asignar_jugador, name='api_asignar_jugador'),
     path('api/bfs_graph/', views.api_bfs_graph, name='api_bfs_graph'),
     path('api/partido/<int:partido_id>/simular/', views.api_simular_partido, name='api_simular_partido'),
+    path('api/trabajos/<int:trabajo_id>/', views.api_trabajo, name='api_trabajo'),
+    path('api/partido/<int:partido_id>/eventos/', views.api_eventos_partido, name='api_eventos_partido'),
     path('api/equipo/<int:equipo_id>/', views.api_equipo_detail, name='api_equipo_detail'),
+    path('api/equipo/<int:equipo_id>/fuerza/', views.api_fuerza_equipo, name='api_fuerza_equipo'),
+    path('api/equipo/<int:equipo_id>/alineacion/', views.api_alineacion_optima, name='api_alineacion_optima'),
+    path('api/equipo/<int:equipo_id>/alineaciones/', views.api_enumerar_alineaciones, name='api_enumerar_alineaciones'),
     path('api/partido/<int:partido_id>/', views.api_partido_detail, name='api_partido_detail'),
     path('apuestas/', views.apuestas_page, name='apuestas_page'),
     path('api/apuestas/', views.api_apuestas, name='api_apuestas'),
@@ -30,6 +38,12 @@ urlpatterns = [
     path('api/saldo/', views.api_saldo, name='api_saldo'),
     path('admin/asignar_jugador/', views.admin_asignar_jugador_page, name='admin_asignar_jugador_page'),
     path('admin/ganadores_apuestas/', views.admin_ganadores_apuestas, name='admin_ganadores_apuestas'),
+    path('admin/importar/', views.admin_importar, name='admin_importar'),
+    path('admin/perfiles/', views.admin_perfiles, name='admin_perfiles'),
+    path('admin/perfiles/<str:nombre>', views.admin_perfil_archivo, name='admin_perfil_archivo'),
+    path('api/exportar/<str:tipo>/', views.api_exportar, name='api_exportar'),
+    path('api/aprovisionar/', views.api_aprovisionar, name='api_aprovisionar'),
+    path('api/consultas_lentas/', views.api_consultas_lentas, name='api_consultas_lentas'),
     path('admin/permutaciones_combinaciones/', views.permutaciones_combinaciones_page, name='permutaciones_combinaciones_page'),
     path('api/estadisticas_equipo/', views.api_estadisticas_equipo, name='api_estadisticas_equipo'),
 ]
\ No newline at end of file
@@ -1,19 +1,25 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
-from .models import Usuario, Jugador, Arbitro, Equipo, Partido, Apuesta, RecargaSaldo
+from .models import Usuario, Jugador, Arbitro, Equipo, Partido, Apuesta, RecargaSaldo, EventoPartido, Trabajo, TIPOS_EVENTO
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponseBadRequest, FileResponse, Http404, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie, get_token
 from django.views.decorators.http import require_http_methods, require_GET
 from django.utils.dateparse import parse_datetime
+from django.urls import reverse
 from django.contrib import messages
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q, F, Sum
+from . import auditoria, metricas, perfilado, consultas_lentas, rankings, importacion, exportacion, paneles, busqueda, simulacion, trabajos, mercados, limites, idempotencia
+from .fuerzas import obtener_fuerzas, fuerza_a_dict
+from .eventos import anular_eventos, registrar_eventos
+from .alineaciones import mejor_alineacion, pagina_alineaciones, total_alineaciones, FORMACION_POR_DEFECTO, TITULARES
+import io
 import json
 from collections import deque
 import decimal
 import math
-import random
 
 # Funciones auxiliares para la validación de roles
 def es_admin(user):
@@ -61,7 +67,8 @@ def login_view(request):
         else:
             messages.error(request, 'Usuario o contraseña inválidos.')
 
-    return render(request, 'mitorneo/login.html')
+    # El widget de goleadores sale del top cacheado, sin ordenar la tabla de jugadores
+    return render(request, 'mitorneo/login.html', {'goleadores': rankings.top('goles')[:5]})
 
 @login_required
 def cerrar_sesion(request):
@@ -209,23 +216,45 @@ def panel_admin(request):
 @login_required
 @user_passes_test(es_jugador)
 def panel_jugador(request):
-    jugador = get_object_or_404(Jugador, usuario=request.user)
+    jugador = get_object_or_404(Jugador.objects.select_related('equipo'), usuario=request.user)
+    jugador.usuario = request.user
+    # Querysets perezosos: si el fragmento está en caché no se ejecutan
     partidos = Partido.objects.filter(
         Q(equipo_local=jugador.equipo) | Q(equipo_visitante=jugador.equipo)
+    ).select_related('equipo_local', 'equipo_visitante').only(
+        'fecha', 'equipo_local__nombre', 'equipo_visitante__nombre'
     ).order_by('fecha')
-    return render(request, 'mitorneo/jugador_panel.html', {'jugador': jugador, 'partidos': partidos, 'equipo': jugador.equipo})
+    apuestas = Apuesta.objects.filter(usuario=request.user).select_related('equipo').only(
+        'monto', 'ganador', 'equipo__nombre'
+    ).order_by('-fecha_apuesta')
+    return render(request, 'mitorneo/jugador_panel.html', {
+        'jugador': jugador,
+        'partidos': partidos,
+        'equipo': jugador.equipo,
+        'apuestas': apuestas,
+        'clave_partidos': paneles.clave_equipo(jugador.equipo_id),
+        'cache_timeout': paneles.timeout(),
+    })
 
 @login_required
 @user_passes_test(es_arbitro)
 def panel_arbitro(request):
     arbitro = get_object_or_404(Arbitro, usuario=request.user)
-    partidos = Partido.objects.filter(arbitro=arbitro).order_by('fecha')
-    return render(request, 'mitorneo/arbitro_panel.html', {'arbitro': arbitro, 'partidos': partidos})
+    arbitro.usuario = request.user
+    partidos = Partido.objects.filter(arbitro=arbitro).select_related('equipo_local', 'equipo_visitante').only(
+        'fecha', 'equipo_local__nombre', 'equipo_visitante__nombre'
+    ).order_by('fecha')
+    return render(request, 'mitorneo/arbitro_panel.html', {
+        'arbitro': arbitro,
+        'partidos': partidos,
+        'clave_partidos': paneles.clave_arbitro(arbitro.id),
+        'cache_timeout': paneles.timeout(),
+    })
 
 @login_required
 def apuestas_page(request):
-    equipos = Equipo.objects.all()
-    proximos_partidos = Partido.objects.filter(simulado=False, fecha__gt=timezone.now()).order_by('fecha')
+    equipos = Equipo.objects.only('id', 'nombre')
+    proximos_partidos = paneles.proximos_partidos()
     saldo = request.user.saldo if hasattr(request.user, 'saldo') else 0
     return render(request, 'mitorneo/apuestas.html', {
         'equipos': equipos,
@@ -235,17 +264,13 @@ def apuestas_page(request):
 
 @login_required
 def resultado_partido(request, partido_id):
-    partido = get_object_or_404(Partido, id=partido_id)
-    jugadores_local = Jugador.objects.filter(equipo=partido.equipo_local)
-    jugadores_visitante = Jugador.objects.filter(equipo=partido.equipo_visitante)
-    
-    niveles_local = [{'nombre': f'{j.nombre} {j.apellido}', 'nivel': j.nivel} for j in jugadores_local]
-    niveles_visitante = [{'nombre': f'{j.nombre} {j.apellido}', 'nivel': j.nivel} for j in jugadores_visitante]
+    partido = get_object_or_404(Partido.objects.select_related('equipo_local', 'equipo_visitante'), id=partido_id)
+    fuerzas = obtener_fuerzas([partido.equipo_local_id, partido.equipo_visitante_id])
     
     return render(request, 'mitorneo/resultado.html', {
         'partido': partido,
-        'niveles_local': json.dumps(niveles_local),
-        'niveles_visitante': json.dumps(niveles_visitante)
+        'fuerza_local': json.dumps(fuerza_a_dict(fuerzas[partido.equipo_local_id])),
+        'fuerza_visitante': json.dumps(fuerza_a_dict(fuerzas[partido.equipo_visitante_id]))
     })
 
 # Vistas de API
@@ -256,9 +281,110 @@ def api_equipos(request):
 
 @require_GET
 def api_jugadores(request):
-    jugadores = Jugador.objects.all().values('id', 'nombre', 'apellido', 'equipo__nombre', 'equipo_id')
+    jugadores = Jugador.objects.all()
+    equipo_id = request.GET.get('equipo_id')
+    if equipo_id:
+        try:
+            equipo_id = int(equipo_id)
+        except ValueError:
+            return JsonResponse({'error': 'equipo_id debe ser un número entero'}, status=400)
+        jugadores = jugadores.filter(equipo_id=equipo_id)
+    jugadores = jugadores.values('id', 'nombre', 'apellido', 'nivel', 'posicion', 'equipo__nombre', 'equipo_id')
     return JsonResponse(list(jugadores), safe=False)
 
+@login_required
+@require_GET
+def api_buscar_jugadores(request):
+    try:
+        limite = int(request.GET.get('limite', busqueda.LIMITE_POR_DEFECTO))
+    except ValueError:
+        return JsonResponse({'error': 'limite debe ser un número entero'}, status=400)
+    if not 1 <= limite <= busqueda.MAX_LIMITE:
+        return JsonResponse({'error': f'limite debe estar entre 1 y {busqueda.MAX_LIMITE}'}, status=400)
+    try:
+        # El correo solo lo buscan y lo ven los administradores
+        resultados = busqueda.buscar(request.GET.get('q', ''), limite, incluir_correo=es_admin(request.user))
+        return JsonResponse({'resultados': resultados})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@require_GET
+def api_fuerza_equipo(request, equipo_id):
+    equipo = get_object_or_404(Equipo, id=equipo_id)
+    return JsonResponse(fuerza_a_dict(obtener_fuerzas([equipo.id])[equipo.id]))
+
+@require_GET
+def api_alineacion_optima(request, equipo_id):
+    equipo = get_object_or_404(Equipo, id=equipo_id)
+    formacion = request.GET.get('formacion')
+    jugadores = Jugador.objects.filter(equipo=equipo).values('id', 'nombre', 'apellido', 'nivel', 'posicion')
+    try:
+        fuerza, titulares, suplentes = mejor_alineacion(jugadores, formacion)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'equipo_id': equipo.id,
+        'formacion': formacion or FORMACION_POR_DEFECTO,
+        'fuerza': fuerza,
+        'titulares': [
+            dict(jugador, posicion_asignada=posicion, valor=valor) for jugador, posicion, valor in titulares
+        ],
+        'suplentes': suplentes,
+    })
+
+@require_GET
+def api_enumerar_alineaciones(request, equipo_id):
+    equipo = get_object_or_404(Equipo, id=equipo_id)
+    jugadores = {j['id']: j for j in Jugador.objects.filter(equipo=equipo).values('id', 'nombre', 'apellido', 'nivel')}
+    try:
+        # La página puede superar 2**53: se recibe y se devuelve como texto
+        pagina = int(request.GET.get('pagina', 1))
+        tamano = int(request.GET.get('tamano', 20))
+        k = int(request.GET.get('k', TITULARES))
+    except ValueError:
+        return JsonResponse({'error': 'pagina, tamano y k deben ser números enteros'}, status=400)
+    try:
+        resultado = pagina_alineaciones(
+            jugadores.values(), request.GET.get('tipo', 'combinaciones'), k, pagina, tamano,
+            request.GET.get('orden', 'lexicografico'),
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'equipo_id': equipo.id,
+        'pagina': str(pagina),
+        'paginas': str(resultado['paginas']),
+        'total': str(resultado['total']),
+        'jugadores': {j['id']: f"{j['nombre']} {j['apellido']}" for j in jugadores.values()},
+        'alineaciones': [dict(a, rango=str(a['rango'])) for a in resultado['alineaciones']],
+    })
+
+def _api_ranking(request, campo):
+    try:
+        limite = int(request.GET.get('limite', 20))
+        despues = request.GET.get('despues')
+        if despues:
+            valor, jugador_id = despues.split('_')
+            despues = (int(valor), int(jugador_id))
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros de paginación inválidos.'}, status=400)
+    if not 1 <= limite <= rankings.MAX_LIMITE:
+        return JsonResponse({'error': f'limite debe estar entre 1 y {rankings.MAX_LIMITE}.'}, status=400)
+
+    filas, siguiente = rankings.pagina(campo, limite, despues or None)
+    return JsonResponse({
+        'resultados': filas,
+        'siguiente': f'{siguiente[0]}_{siguiente[1]}' if siguiente else None,
+    })
+
+@require_GET
+def api_goleadores(request):
+    return _api_ranking(request, 'goles')
+
+@require_GET
+def api_asistentes(request):
+    return _api_ranking(request, 'asistencias')
+
 @require_GET
 def api_arbitros(request):
     arbitros = Arbitro.objects.all().values('id', 'nombre', 'apellido')
@@ -268,6 +394,7 @@ def api_arbitros(request):
 @login_required
 @user_passes_test(es_admin)
 @require_http_methods(["POST"])
+@auditoria.auditar('equipo.crear')
 def api_agregar_equipo(request):
     try:
         data = json.loads(request.body)
@@ -284,6 +411,7 @@ def api_agregar_equipo(request):
 @login_required
 @user_passes_test(es_admin)
 @require_http_methods(["POST"])
+@auditoria.auditar('partido.crear')
 def api_crear_partido(request):
     try:
         data = json.loads(request.body)
@@ -345,6 +473,8 @@ def api_saldo(request):
 
 @csrf_exempt
 @login_required
+@limites.limitar('saldo')
+@idempotencia.idempotente
 @require_http_methods(["POST"])
 def api_recargar_saldo(request):
     try:
@@ -360,7 +490,8 @@ def api_recargar_saldo(request):
 
         # Actualizamos el saldo real del usuario
         request.user.saldo_real = F('saldo_real') + monto
-        request.user.save()
+        # Solo el saldo: el usuario de la petición puede venir de la caché
+        request.user.save(update_fields=['saldo_real'])
         request.user.refresh_from_db()
         
         RecargaSaldo.objects.create(
@@ -385,42 +516,107 @@ def api_recargar_saldo(request):
 @login_required
 @user_passes_test(es_admin)
 @require_http_methods(["POST"])
+@auditoria.auditar('partido.simular')
 def api_simular_partido(request, partido_id):
+    """
+    Simula el partido en la petición o, con {"asincrono": true} (o ?asincrono=1), lo encola
+    para run_workers y responde 202 con la URL del trabajo.
+    """
     try:
-        partido = get_object_or_404(Partido, id=partido_id)
-
-        # Simulación de goles
-        goles_local = random.randint(0, 5)
-        goles_visitante = random.randint(0, 5)
+        partido = get_object_or_404(Partido.objects.select_related('equipo_local', 'equipo_visitante'), id=partido_id)
+        data = json.loads(request.body) if request.content_type == 'application/json' and request.body else {}
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Se esperaba un objeto JSON.'}, status=400)
+        if simulacion.tiene_eventos_de_arbitro(partido):
+            return JsonResponse({'error': 'El partido tiene eventos registrados por el árbitro; no se puede simular.'}, status=409)
+        if data.get('asincrono') or request.GET.get('asincrono') in ('1', 'true'):
+            trabajo = trabajos.encolar('simular_partido', partido_id=partido.id)
+            return JsonResponse({
+                'success': True,
+                'trabajo_id': trabajo.id,
+                'estado': trabajo.estado,
+                'url': reverse('api_trabajo', args=[trabajo.id]),
+                'mensaje': 'Simulación encolada.'
+            }, status=202)
+        return JsonResponse(simulacion.simular_partido(partido))
+    except Http404:
+        raise
+    except simulacion.EventosDeArbitro as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'JSON inválido.'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
 
-        partido.goles_local = goles_local
-        partido.goles_visitante = goles_visitante
-        partido.simulado = True
-        
-        # Determinar ganador
-        if goles_local > goles_visitante:
-            partido.ganador = partido.equipo_local
-        elif goles_visitante > goles_local:
-            partido.ganador = partido.equipo_visitante
-        else:
-            partido.ganador = None
-        
-        partido.save()
+@login_required
+@user_passes_test(es_admin)
+@require_GET
+def api_trabajo(request, trabajo_id):
+    trabajo = get_object_or_404(Trabajo, id=trabajo_id)
+    return JsonResponse({
+        'id': trabajo.id,
+        'tipo': trabajo.tipo,
+        'estado': trabajo.estado,
+        'intentos': trabajo.intentos,
+        'creado': trabajo.creado.isoformat(),
+        'iniciado': trabajo.iniciado.isoformat() if trabajo.iniciado else None,
+        'terminado': trabajo.terminado.isoformat() if trabajo.terminado else None,
+        'resultado': trabajo.resultado,
+        # Solo la última línea del traceback
+        'error': trabajo.error.strip().splitlines()[-1] if trabajo.error else None,
+    })
 
-        # Procesar apuestas ganadoras
-        Apuesta.objects.filter(partido=partido).update(ganador=False)
-        if partido.ganador:
-            Apuesta.objects.filter(partido=partido, equipo=partido.ganador).update(ganador=True)
+@csrf_exempt
+@login_required
+@limites.limitar('eventos')
+@require_http_methods(["GET", "POST"])
+def api_eventos_partido(request, partido_id):
+    partido = get_object_or_404(Partido.objects.select_related('arbitro'), id=partido_id)
+    if request.method == 'GET':
+        eventos = partido.eventos.values('id', 'tipo', 'minuto', 'jugador_id', 'jugador__nombre', 'jugador__apellido')
+        return JsonResponse(list(eventos), safe=False)
 
-        return JsonResponse({
-            'success': True,
-            'goles_local': goles_local,
-            'goles_visitante': goles_visitante,
-            'equipo_local': partido.equipo_local.nombre,
-            'equipo_visitante': partido.equipo_visitante.nombre,
-            'ganador': partido.ganador.nombre if partido.ganador else 'Empate',
-            'mensaje': 'Partido simulado exitosamente.'
-        })
+    # Solo el árbitro del partido o un administrador registran eventos
+    es_su_arbitro = es_arbitro(request.user) and partido.arbitro and partido.arbitro.usuario_id == request.user.id
+    if not (es_admin(request.user) or es_su_arbitro):
+        return JsonResponse({'error': 'No autorizado para registrar eventos de este partido.'}, status=403)
+    try:
+        data = json.loads(request.body)
+        entradas = data.get('eventos') if isinstance(data, dict) else data
+        if not isinstance(entradas, list) or not entradas:
+            return JsonResponse({'error': 'Se esperaba una lista de eventos.'}, status=400)
+
+        tipos = dict(TIPOS_EVENTO)
+        jugadores = Jugador.objects.filter(
+            equipo_id__in=[partido.equipo_local_id, partido.equipo_visitante_id]
+        ).in_bulk([e.get('jugador_id') for e in entradas if isinstance(e, dict)])
+        # Un jugador aparece como mucho una vez por partido; las apariciones simuladas se reemplazan abajo
+        ya_aparecen = set(partido.eventos.filter(tipo='aparicion', registrado_por__isnull=False).values_list('jugador_id', flat=True))
+        eventos = []
+        for indice, entrada in enumerate(entradas):
+            if not isinstance(entrada, dict) or entrada.get('tipo') not in tipos:
+                return JsonResponse({'error': f'Evento {indice}: tipo no válido.'}, status=400)
+            jugador = jugadores.get(entrada.get('jugador_id'))
+            if jugador is None:
+                return JsonResponse({'error': f'Evento {indice}: el jugador no pertenece a ninguno de los equipos.'}, status=400)
+            minuto = entrada.get('minuto')
+            if minuto is not None and (not isinstance(minuto, int) or not 0 <= minuto <= 130):
+                return JsonResponse({'error': f'Evento {indice}: minuto no válido.'}, status=400)
+            if entrada['tipo'] == 'aparicion':
+                if jugador.id in ya_aparecen:
+                    continue
+                ya_aparecen.add(jugador.id)
+            eventos.append(EventoPartido(
+                partido=partido, jugador=jugador, tipo=entrada['tipo'], minuto=minuto, registrado_por=request.user,
+            ))
+
+        with transaction.atomic():
+            # Los eventos del árbitro sustituyen a los de una simulación anterior, no se suman a ellos
+            anular_eventos(partido, solo_simulados=True)
+            registrar_eventos(eventos)
+        return JsonResponse({'success': True, 'registrados': len(eventos)}, status=201)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'JSON inválido.'}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -428,6 +624,7 @@ def api_simular_partido(request, partido_id):
 @login_required
 @user_passes_test(es_admin)
 @require_http_methods(["POST"])
+@auditoria.auditar('jugador.asignar')
 def api_asignar_jugador(request):
     try:
         data = json.loads(request.body)
@@ -509,6 +706,7 @@ def api_bfs_graph(request):
 @login_required
 @user_passes_test(es_admin)
 @require_http_methods(["PUT", "DELETE"])
+@auditoria.auditar('equipo.editar')
 def api_equipo_detail(request, equipo_id):
     try:
         equipo = get_object_or_404(Equipo, id=equipo_id)
@@ -532,6 +730,7 @@ def api_equipo_detail(request, equipo_id):
 @login_required
 @user_passes_test(es_admin)
 @require_http_methods(["PUT", "DELETE"])
+@auditoria.auditar('partido.editar')
 def api_partido_detail(request, partido_id):
     try:
         partido = get_object_or_404(Partido, id=partido_id)
@@ -554,10 +753,12 @@ def api_partido_detail(request, partido_id):
 
 @csrf_exempt
 @login_required
+@limites.limitar('apuestas')
+@idempotencia.idempotente
 def api_apuestas(request):
     if request.method == 'GET':
         try:
-            apuestas = Apuesta.objects.filter(usuario=request.user).order_by('-fecha_apuesta')
+            apuestas = Apuesta.objects.filter(usuario=request.user).select_related('equipo').order_by('-fecha_apuesta')
             data = [{
                 'equipo': apuesta.equipo.nombre,
                 'monto': float(apuesta.monto),
@@ -578,35 +779,36 @@ def api_apuestas(request):
             if not partido_id or not equipo_id or monto <= 0:
                 return JsonResponse({'error': 'Datos de apuesta inválidos.'}, status=400)
             
-            partido = get_object_or_404(Partido, id=partido_id)
-            equipo = get_object_or_404(Equipo, id=equipo_id)
-            
-            if partido.fecha <= timezone.now():
-                return JsonResponse({'error': 'No se puede apostar en partidos que ya comenzaron.'}, status=400)
-            
-            if equipo not in [partido.equipo_local, partido.equipo_visitante]:
+            # Validación contra los mercados abiertos en memoria; registrar_apuesta vuelve a
+            # comprobar el partido en el UPDATE del saldo
+            mercado = mercados.abierto(int(partido_id))
+            if mercado is None:
+                partido = get_object_or_404(Partido, id=partido_id)
+                if partido.simulado or partido.fecha <= timezone.now():
+                    return JsonResponse({'error': 'No se puede apostar en partidos que ya comenzaron.'}, status=400)
+                return JsonResponse({'error': 'El partido no admite apuestas en este momento.'}, status=400)
+
+            if int(equipo_id) not in mercado[:2]:
                 return JsonResponse({'error': 'El equipo no participa en este partido.'}, status=400)
-            
-            if request.user.saldo < monto:
+
+            try:
+                _, nuevo_saldo = mercados.registrar_apuesta(request.user.pk, int(partido_id), int(equipo_id), monto)
+            except mercados.MercadoCerrado:
+                return JsonResponse({'error': 'No se puede apostar en partidos que ya comenzaron.'}, status=400)
+            except mercados.SaldoInsuficiente:
                 return JsonResponse({'error': 'Saldo insuficiente.'}, status=400)
-            
-            # Descontar del saldo
-            request.user.saldo_real = F('saldo_real') - monto
-            request.user.save()
-            request.user.refresh_from_db()
-            
-            apuesta = Apuesta.objects.create(
-                usuario=request.user,
-                partido=partido,
-                equipo=equipo,
-                monto=monto
-            )
+            metricas.incrementar('playliga_apuestas_total')
+            metricas.incrementar('playliga_monto_apostado_total', float(monto))
             
             return JsonResponse({
                 'success': True,
                 'mensaje': 'Apuesta realizada exitosamente.',
-                'nuevo_saldo': float(request.user.saldo)
+                'nuevo_saldo': float(nuevo_saldo)
             })
+        except Http404:
+            raise
+        except (ValueError, TypeError, decimal.InvalidOperation):
+            return JsonResponse({'error': 'Datos de apuesta inválidos.'}, status=400)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     
@@ -615,21 +817,121 @@ def api_apuestas(request):
 @login_required
 @user_passes_test(es_admin)
 def admin_asignar_jugador_page(request):
-    jugadores = Jugador.objects.all()
-    equipos = Equipo.objects.all()
+    # Los jugadores se buscan desde la página (api_buscar_jugadores) en vez de listarlos todos
+    equipos = Equipo.objects.only('id', 'nombre')
     return render(request, 'mitorneo/admin_asignar_jugador.html', {
-        'jugadores': jugadores,
         'equipos': equipos
     })
 
 @login_required
 @user_passes_test(es_admin)
 def admin_ganadores_apuestas(request):
-    apuestas = Apuesta.objects.all()
+    # Usuario y equipo de cada fila en la misma consulta (antes, dos consultas por apuesta)
+    apuestas = Apuesta.objects.select_related('usuario', 'equipo').only(
+        'monto', 'fecha_apuesta', 'ganador', 'usuario__username', 'equipo__nombre',
+    )
     return render(request, 'mitorneo/admin_ganadores_apuestas.html', {
         'apuestas': apuestas
     })
 
+@login_required
+@user_passes_test(es_admin)
+@require_http_methods(["GET", "POST"])
+@auditoria.auditar('importar')
+def admin_importar(request):
+    context = {'tipos': importacion.COLUMNAS}
+    if request.method == 'POST':
+        tipo = request.POST.get('tipo')
+        archivo = request.FILES.get('archivo')
+        if tipo not in importacion.IMPORTADORES or archivo is None:
+            messages.error(request, 'Selecciona un tipo y un archivo CSV.')
+            return render(request, 'mitorneo/admin_importar.html', context)
+        try:
+            # El archivo subido se lee en streaming; utf-8-sig descarta el BOM de Excel
+            texto = io.TextIOWrapper(archivo.file, encoding='utf-8-sig', newline='')
+            resultado = importacion.importar_csv(tipo, texto, simular=bool(request.POST.get('simular')))
+            context['resultado'] = resultado.como_dict()
+            context['simulado'] = bool(request.POST.get('simular'))
+        except (ValueError, UnicodeDecodeError) as e:
+            messages.error(request, f'No se pudo importar el archivo: {e}')
+    return render(request, 'mitorneo/admin_importar.html', context)
+
+@login_required
+@user_passes_test(es_admin)
+@require_GET
+@auditoria.auditar('exportar', lectura=True)
+def api_exportar(request, tipo):
+    formato = request.GET.get('formato', 'ndjson')
+    try:
+        desde_id = int(request.GET['desde_id']) if request.GET.get('desde_id') else None
+        desde = exportacion.fecha_iso(request.GET['desde']) if request.GET.get('desde') else None
+        desde_marca = (
+            exportacion.fecha_iso(request.GET['desde_marca'], 'desde_marca') if request.GET.get('desde_marca') else None
+        )
+        filas, marca = exportacion.generar(tipo, formato, desde_id, desde, desde_marca=desde_marca)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    tipo_contenido = 'application/x-ndjson' if formato == 'ndjson' else 'text/csv'
+    response = StreamingHttpResponse(filas, content_type=f'{tipo_contenido}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{tipo}.{formato}"'
+    # Marca para la siguiente exportación incremental (?desde_marca=...)
+    response['X-Marca'] = marca.isoformat()
+    return response
+
+@csrf_exempt
+@login_required
+@user_passes_test(es_admin)
+@require_http_methods(["POST"])
+@auditoria.auditar('cuentas.aprovisionar')
+def api_aprovisionar(request):
+    """
+    Alta masiva de cuentas: {"rol": "jugadores" | "arbitros" | "apostadores", "cuentas": [{...}]}
+    con las mismas columnas que la importación CSV. Devuelve el resumen con los errores por fila.
+    """
+    try:
+        data = json.loads(request.body)
+        rol = data.get('rol')
+        cuentas = data.get('cuentas')
+        if rol not in ('jugadores', 'arbitros', 'apostadores') or not isinstance(cuentas, list):
+            return JsonResponse({'error': 'Se requiere rol (jugadores, arbitros o apostadores) y una lista de cuentas'}, status=400)
+        if len(cuentas) > importacion.TAMANO_LOTE * 5:
+            return JsonResponse({'error': f'Máximo {importacion.TAMANO_LOTE * 5} cuentas por petición; use importar_csv'}, status=400)
+        filas = [
+            (indice, {str(k): '' if v is None else str(v) for k, v in cuenta.items()} if isinstance(cuenta, dict) else {})
+            for indice, cuenta in enumerate(cuentas)
+        ]
+        resultado = importacion.importar_filas(rol, filas, simular=bool(data.get('simular')))
+        return JsonResponse(resultado.como_dict(), status=201 if resultado.creados else 200)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'JSON no válido'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@login_required
+@user_passes_test(es_admin)
+def admin_perfiles(request):
+    return render(request, 'mitorneo/admin_perfiles.html', {
+        'perfiles': perfilado.listar_perfiles(),
+        'directorio': perfilado.directorio_perfiles(),
+    })
+
+@login_required
+@user_passes_test(es_admin)
+def admin_perfil_archivo(request, nombre):
+    ruta = perfilado.ruta_perfil(nombre)
+    if ruta is None:
+        raise Http404('Perfil no encontrado.')
+    if nombre.endswith('.txt'):
+        return FileResponse(open(ruta, 'rb'), content_type='text/plain; charset=utf-8')
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=nombre)
+
+@login_required
+@user_passes_test(es_admin)
+@require_GET
+def api_consultas_lentas(request):
+    return JsonResponse(consultas_lentas.resumen(), safe=False)
+
 @login_required
 def permutaciones_combinaciones_page(request):
     equipos = Equipo.objects.all()
@@ -662,9 +964,11 @@ def api_estadisticas_equipo(request):
                     victorias += 1
         
         # Calcular permutaciones y combinaciones
+        # Totales exactos como texto: superan el rango de los números de JavaScript
         num_jugadores = Jugador.objects.filter(equipo=equipo).count()
-        permutaciones = math.factorial(num_jugadores) if num_jugadores <= 10 else "Muy grande"
-        combinaciones = math.comb(num_jugadores, 11) if num_jugadores >= 11 else 0
+        permutaciones = str(math.factorial(num_jugadores))
+        combinaciones = str(total_alineaciones('combinaciones', num_jugadores)) if num_jugadores >= TITULARES else '0'
+        permutaciones_alineacion = str(total_alineaciones('permutaciones', num_jugadores)) if num_jugadores >= TITULARES else '0'
         
         # Calcular ganancias
         ganancias = Apuesta.objects.filter(equipo=equipo, ganador=True).aggregate(
@@ -675,6 +979,8 @@ def api_estadisticas_equipo(request):
             'victorias': victorias,
             'permutaciones': permutaciones,
             'combinaciones': combinaciones,
+            'permutaciones_alineacion': permutaciones_alineacion,
+            'num_jugadores': num_jugadores,
             'ganancias': float(ganancias)
         })
     except Exception as e: